@@ -0,0 +1,81 @@
+"""Textured quads drawn in as few OpenGL calls as possible.
+
+Everything the fields draw is a textured quad.  Drawing them one by one with
+glBegin/glEnd costs a handful of calls per block part, so with many fields
+on the screen the frame time goes to the calls, not to the pixels.  A
+QuadBatch collects the quads of every field over a frame and draws each
+texture's quads with a single glDrawArrays.
+
+Fields don't overlap, so only the layers within a field have to be kept in
+order: all backgrounds are drawn first, then all block parts and so on.
+"""
+
+import numpy
+from OpenGL.GL import *
+
+### Layers, drawn in this order
+BACKGROUNDS = 0
+BLOCKPARTS = 1
+OVERLAYS = 2
+PIECES = 3
+ICONS = 4
+LAYERS = 5
+
+WHITE = (1.0, 1.0, 1.0, 1.0)
+
+
+class QuadBatch:
+    """Quads per layer and texture, until draw() sends them"""
+
+    def __init__(self):
+        self.layers = [{} for i in range(LAYERS)]
+
+    def add(self, layer, texture, x0, y0, x1, y1, u0, v0, u1, v1, color=WHITE):
+        """Add the quad from (x0, y0) to (x1, y1) with the texture coordinates
+        (u0, v0) at its top left corner and (u1, v1) at the bottom right"""
+        rows = self.layers[layer].get(texture)
+        if rows is None:
+            rows = self.layers[layer][texture] = []
+        rows.append((x0, y0, x1, y1, u0, v0, u1, v1) + tuple(color))
+
+    def __len__(self):
+        return sum(len(rows) for layer in self.layers for rows in layer.values())
+
+    def arrays(self, rows):
+        """Return the vertex, texture coordinate and color arrays of rows"""
+        q = numpy.array(rows, dtype=numpy.float32)
+        n = len(q)
+        vertices = numpy.empty((n, 4, 2), dtype=numpy.float32)
+        vertices[:, 0] = q[:, [0, 1]]
+        vertices[:, 1] = q[:, [2, 1]]
+        vertices[:, 2] = q[:, [2, 3]]
+        vertices[:, 3] = q[:, [0, 3]]
+        texcoords = numpy.empty((n, 4, 2), dtype=numpy.float32)
+        texcoords[:, 0] = q[:, [4, 5]]
+        texcoords[:, 1] = q[:, [6, 5]]
+        texcoords[:, 2] = q[:, [6, 7]]
+        texcoords[:, 3] = q[:, [4, 7]]
+        colors = numpy.repeat(q[:, 8:12], 4, axis=0)
+        return vertices, texcoords, colors
+
+    def draw(self):
+        """Draw and forget every quad, one glDrawArrays per layer and texture"""
+        glLoadIdentity()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        try:
+            for layer in self.layers:
+                for texture, rows in layer.items():
+                    vertices, texcoords, colors = self.arrays(rows)
+                    glBindTexture(GL_TEXTURE_2D, texture)
+                    glVertexPointer(2, GL_FLOAT, 0, vertices)
+                    glTexCoordPointer(2, GL_FLOAT, 0, texcoords)
+                    glColorPointer(4, GL_FLOAT, 0, colors)
+                    glDrawArrays(GL_QUADS, 0, len(vertices) * 4)
+                layer.clear()
+        finally:
+            glDisableClientState(GL_COLOR_ARRAY)
+            glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+            glDisableClientState(GL_VERTEX_ARRAY)
+            glColor(1, 1, 1)
@@ -12,9 +12,37 @@ from OpenGL.GLU import *
 from OpenGL.GLUT import *
 from pygame.locals import *
 
+from batch import BACKGROUNDS, BLOCKPARTS, ICONS, OVERLAYS, PIECES, WHITE, QuadBatch
 from blocks import *
 from eit_constants import *
 
+ALL_CELLS = [(x, y) for y in range(23) for x in range(10)]
+### The x of each bit set in a 10 bit row mask, lowest first
+MASK_BITS = [tuple(x for x in range(10) if mask >> x & 1) for mask in range(1 << 10)]
+
+### Random 64-bit keys of the Zobrist hash, the same in every process
+ZOBRIST_SEED = 0xE177
+_keys = Random(ZOBRIST_SEED)
+### A part in cell (x, y), CELL_KEYS[y][x][bp.is_special]
+CELL_KEYS = [
+    [(_keys.getrandbits(64), _keys.getrandbits(64)) for x in range(10)]
+    for y in range(23)
+]
+### A part of the current block in cell (x, y)
+PIECE_KEYS = [[_keys.getrandbits(64) for x in range(10)] for y in range(23)]
+EFFECT_KEYS = dict(
+    (name, _keys.getrandbits(64))
+    for name in ("Inverse", "Mini", "Blink", "Blind", "Trans", "SZ", "Color")
+)
+
+
+def block_key(block):
+    """The Zobrist key of the cells covered by block"""
+    key = 0
+    for bp in block.blockparts:
+        key ^= PIECE_KEYS[bp.y][bp.x]
+    return key
+
 
 class BlockField:
     def __init__(self, dm, px, py):
@@ -55,6 +83,38 @@ class BlockField:
         self.currentblock = None
         self.nextblock = None
 
+        ### Cells (x, y) changed since the last take_dirty(), for spectators
+        self.dirty = set()
+
+        ### Zobrist hash of the parts, the current block and the effects,
+        ### kept up to date by the methods that change them.  Equal fields
+        ### have equal hashes, compare them instead of the fields.
+        self.zobrist = 0
+
+    def rehash(self):
+        """Compute zobrist from scratch, after the grid was swapped"""
+        key = 0
+        for y, row in enumerate(self.blockparts):
+            for x, bp in enumerate(row):
+                if bp is not None:
+                    key ^= CELL_KEYS[y][x][bp.is_special]
+        if self.currentblock is not None:
+            key ^= block_key(self.currentblock)
+        for name, effect in self.effects.items():
+            if effect is not None:
+                key ^= EFFECT_KEYS[name]
+        self.zobrist = key
+
+    def mark_all(self):
+        """Mark every cell as changed, after the grid was swapped or restored"""
+        self.dirty.update(ALL_CELLS)
+
+    def take_dirty(self):
+        """Return the cells changed since the last call"""
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
     def flip(self):
         top = self.top_index() + 1
         middle = top + (22 - top) // 2
@@ -68,6 +128,8 @@ class BlockField:
                     self.blockparts[y1][x].y = y1
                 if self.blockparts[y2][x] is not None:
                     self.blockparts[y2][x].y = y2
+        self.mark_all()
+        self.rehash()
 
     def insert_bp(self, xy, bp):
         (x, y) = xy
@@ -76,6 +138,8 @@ class BlockField:
         bp.y = y
         self.blockparts_list.append(bp)
         self.blockparts[y][x] = bp
+        self.dirty.add((x, y))
+        self.zobrist ^= CELL_KEYS[y][x][bp.is_special]
 
     def remove_bp(self, xy):
         (x, y) = xy
@@ -84,7 +148,32 @@ class BlockField:
             if oldbp is self.special_block:
                 self.special_block = None
             self.blockparts_list.remove(oldbp)
+            self.zobrist ^= CELL_KEYS[y][x][oldbp.is_special]
         self.blockparts[y][x] = None
+        self.dirty.add((x, y))
+
+    def apply_row(self, y, fill, clear, parts):
+        """Empty the cells of row y whose bit is set in clear and put parts in
+        the cells whose bit is set in fill, one per bit from x = 0 up.  Does
+        what insert_bp and remove_bp would do cell by cell."""
+        row = self.blockparts[y]
+        keys = CELL_KEYS[y]
+        changed = MASK_BITS[fill | clear]
+        for x in changed:
+            oldbp = row[x]
+            if oldbp is not None:
+                if oldbp is self.special_block:
+                    self.special_block = None
+                self.blockparts_list.remove(oldbp)
+                self.zobrist ^= keys[x][oldbp.is_special]
+                row[x] = None
+        for x, bp in zip(MASK_BITS[fill], parts):
+            bp.x = x
+            bp.y = y
+            row[x] = bp
+            self.zobrist ^= keys[x][bp.is_special]
+        self.blockparts_list.extend(parts)
+        self.dirty.update((x, y) for x in changed)
 
     def replace_bp(self, oldbp, newbp):
         self.insert_bp((oldbp.x, oldbp.y), newbp)
@@ -115,25 +204,53 @@ class BlockField:
     def rotate_block(self, dir="cw"):
         if self.currentblock is None:
             return
+        key = block_key(self.currentblock)
         # Check if it is possible to rotate
         self.currentblock.rotate(dir)
         if not self.in_valid_position(self.currentblock):
             self.currentblock.rotate(self.inverse_dir(dir))
+        else:
+            self.zobrist ^= key ^ block_key(self.currentblock)
+
+    def move_block(self, dx, dy):
+        """Move the current block if it fits there, return True if it did"""
+        key = block_key(self.currentblock)
+        self.currentblock.move(dx, dy)
+        if not self.in_valid_position(self.currentblock):
+            self.currentblock.move(-dx, -dy)
+            return False
+        self.zobrist ^= key ^ block_key(self.currentblock)
+        return True
+
+    def set_currentblock(self, block):
+        if self.currentblock is not None:
+            self.zobrist ^= block_key(self.currentblock)
+        self.currentblock = block
+        if block is not None:
+            self.zobrist ^= block_key(block)
+
+    def set_effect(self, name, bp):
+        """Turn effect name on with its icon bp, or off if bp is None"""
+        if (self.effects[name] is None) != (bp is None):
+            self.zobrist ^= EFFECT_KEYS[name]
+        self.effects[name] = bp
 
     def add_bp(self, bp):
         """add blockpart bp to the playing field"""
         self.remove_bp((bp.x, bp.y))
         self.blockparts[bp.y][bp.x] = bp
         self.blockparts_list.append(bp)
+        self.dirty.add((bp.x, bp.y))
+        self.zobrist ^= CELL_KEYS[bp.y][bp.x][bp.is_special]
 
     def add_block(self):
         x = choice([3, 4, 5, 6])  # randomly place block in x
         y = 0
         if self.nextblock is None:
             self.nextblock = self.random_block()(self.dm, 0, 1)
-            self.currentblock = self.nextblock.__class__(self.dm, x, y)
+            self.set_currentblock(self.nextblock.__class__(self.dm, x, y))
         else:
-            self.currentblock = self.nextblock.__class__(self.dm, x, y)
+            self.set_currentblock(self.nextblock.__class__(self.dm, x, y))
             self.nextblock = self.random_block()(self.dm, 0, 1)
         if self.nextblock.__class__ == BlockT:
             self.nextblock.rotate("ccw")
@@ -162,86 +279,97 @@ class BlockField:
                 self.blockparts[-1].append(None)
         self.blockparts_list = []
         self.special_block = None
+        self.mark_all()
+        self.rehash()
 
     def draw(self):
+        batch = QuadBatch()
+        self.draw_batch(batch)
+        batch.draw()
 
-        glBindTexture(GL_TEXTURE_2D, self.dm.textures["background_border"])
-        glLoadIdentity()
-        glTranslated(self.px - 4, self.py - 4, 0.0)
-        glBegin(GL_QUADS)
-        glTexCoord2d(0.0, 1.0)
-        glVertex2d(0.0, 0.0)
-        glTexCoord2d(1.0, 1.0)
-        glVertex2d(248.0, 0.0)
-        glTexCoord2d(1.0, 0.0)
-        glVertex2d(248.0, 536.0)
-        glTexCoord2d(0.0, 0.0)
-        glVertex2d(0.0, 536.0)
-        glEnd()
-
-        glBindTexture(GL_TEXTURE_2D, self.background_tile)
-        glLoadIdentity()
-        glTranslated(self.px, self.py, 0.0)
-        glBegin(GL_QUADS)
-        glTexCoord2d(0.0, 4.125)
-        glVertex2d(0.0, 0.0)
-        glTexCoord2d(1.875, 4.125)
-        glVertex2d(240.0, 0.0)
-        glTexCoord2d(1.875, 0.0)
-        glVertex2d(240.0, 528.0)
-        glTexCoord2d(0.0, 0.0)
-        glVertex2d(0.0, 528.0)
-        glEnd()
-
-        glTranslated(0.0, -BLOCK_SIZE, 0.0)
+    def batch_block(self, batch, layer, block, ox, oy, color):
+        """Add the quads of block, drawn at (ox, oy), to batch"""
+        for bp in block.blockparts:
+            self.batch_bp(batch, layer, bp, ox, oy, color)
+
+    def batch_bp(self, batch, layer, bp, ox, oy, color, mini=False, trans=False):
+        q = bp.quad(mini=mini, trans=trans)
+        if q is not None:
+            texture, x0, y0, x1, y1, u0, u1 = q
+            x0, y0, x1, y1 = ox + x0, oy + y0, ox + x1, oy + y1
+            batch.add(layer, texture, x0, y0, x1, y1, u0, 1.0, u1, 0.25, color)
+
+    def draw_batch(self, batch, color=WHITE):
+        """Add the quads of the field to batch, see batch.QuadBatch"""
+        px, py = self.px, self.py
+        batch.add(
+            BACKGROUNDS,
+            self.dm.textures["background_border"],
+            px - 4,
+            py - 4,
+            px + 244,
+            py + 532,
+            0.0,
+            1.0,
+            1.0,
+            0.0,
+            color,
+        )
+        batch.add(
+            BACKGROUNDS,
+            self.background_tile,
+            px,
+            py,
+            px + 240,
+            py + 528,
+            0.0,
+            4.125,
+            1.875,
+            0.0,
+            color,
+        )
+
+        mini = self.effects["Mini"] is not None
+        trans = not mini and self.effects["Trans"] is not None
+        oy = py - BLOCK_SIZE
         for bp in self.blockparts_list:
-            if self.effects["Mini"] is not None:
-                bp.draw(mini=True)
-            elif self.effects["Trans"] is not None:
-                bp.draw(trans=True)
-            else:
-                bp.draw()
+            self.batch_bp(batch, BLOCKPARTS, bp, px, oy, color, mini, trans)
 
         ### Color effect
         if self.effects["Color"] is not None:
-            glLoadIdentity()
-            glTranslated(self.px, self.py, 0.0)
-            glBindTexture(GL_TEXTURE_2D, self.dm.textures["bw"])
             dx = 0
             dy = 0.25
             if self.currentblock is not None:
                 dx = (self.currentblock.blockparts[0].x + 1) / (10.0 * 2) + 0.50
                 dy = self.currentblock.blockparts[0].y / (22.0 * 2) + 0.50
-                pass
-            glBegin(GL_QUADS)
-            glTexCoord2d(0.0 - dx, 0.0 - dy)
-            glVertex2d(0.0, 0.0)
-            glTexCoord2d(0.5 - dx, 0.0 - dy)
-            glVertex2d(240.0, 0.0)
-            glTexCoord2d(0.5 - dx, 0.5 - dy)
-            glVertex2d(240.0, 528.0)
-            glTexCoord2d(0.0 - dx, 0.5 - dy)
-            glVertex2d(0.0, 528.0)
-            glEnd()
+            batch.add(
+                OVERLAYS,
+                self.dm.textures["bw"],
+                px,
+                py,
+                px + 240,
+                py + 528,
+                0.0 - dx,
+                0.0 - dy,
+                0.5 - dx,
+                0.5 - dy,
+                color,
+            )
 
         if self.currentblock is not None:
             if self.blink and self.effects["Blink"] is not None:
                 pass
             else:
-                glLoadIdentity()
-                glTranslated(self.px, self.py - BLOCK_SIZE, 0.0)
-                self.currentblock.draw()
+                self.batch_block(
+                    batch, PIECES, self.currentblock, px, py - BLOCK_SIZE, color
+                )
 
         if self.nextblock is not None and self.effects["Blind"] is None:
-            glLoadIdentity()
-            glTranslated(self.px + 175, self.py + 567, 0.0)
-            self.nextblock.draw()
+            self.batch_block(batch, PIECES, self.nextblock, px + 175, py + 567, color)
 
-        glLoadIdentity()
-        glTranslated(self.px + 2, self.py + 677, 0.0)
         for _, sbp in self.effects.items():
             if sbp is not None:
-                sbp.draw()
+                self.batch_bp(batch, ICONS, sbp, px + 2, py + 677, color)
 
     def in_valid_position(self, block):
         """Check if the position of the blockparts in block is valid"""
@@ -319,12 +447,32 @@ class BlockField:
         self.blockparts[y][x].x = x
         self.blockparts[y][x].y = y
         self.blockparts[from_y][from_x] = None
+        self.dirty.add((from_x, from_y))
+        self.dirty.add((x, y))
+        is_special = self.blockparts[y][x].is_special
+        self.zobrist ^= (
+            CELL_KEYS[from_y][from_x][is_special] ^ CELL_KEYS[y][x][is_special]
+        )
+
+    def shake_bp(self, bp, x, y):
+        """Move bp to the empty cell (x, y), emptying the cell at its old x
+        and y even if bp has left the field, for rumbles"""
+        oldbp = self.blockparts[bp.y][bp.x]
+        if oldbp is not None:
+            self.zobrist ^= CELL_KEYS[bp.y][bp.x][oldbp.is_special]
+        self.blockparts[bp.y][bp.x] = None
+        self.blockparts[y][x] = bp
+        self.zobrist ^= CELL_KEYS[y][x][bp.is_special]
+        self.dirty.add((bp.x, bp.y))
+        self.dirty.add((x, y))
+        bp.x = x
+        bp.y = y
 
     def place_currentblock(self):
         for bp in self.currentblock.blockparts:
             self.insert_bp((bp.x, bp.y), bp)
-            # self.add_bp(bp)
-        self.currentblock = None
+            # self.batch_bp(bp)
+        self.set_currentblock(None)
         self.dm.placesound.play()
 
     def check(self):
@@ -5,6 +5,10 @@ from OpenGL.GLU import *
 BLOCK_SIZE = 24
 X,Y = 0,1	
 
+# Display lists compiled in the current GL context. Every part of a kind
+# draws the same, so a list is compiled once, not each time a part is made
+compiled_dls = set()
+
 class BlockPart:
 	def __init__(self, x, y, texture):
 		
@@ -22,6 +26,10 @@ class BlockPart:
 		self.dl = None
 		
 	def create_dl(self, id):
+		self.dl = id
+		if id in compiled_dls:
+			return
+		compiled_dls.add(id)
 		glNewList(id,GL_COMPILE)
 		tex = self.tex_offset
 		glBegin(GL_QUADS)
@@ -31,7 +39,6 @@ class BlockPart:
 		glTexCoord2d( tex[0]*0.75, 0.25 ); glVertex2d(0.0, BLOCK_SIZE)
 		glEnd()
 		glEndList()
-		self.dl = id
 
 	def draw(self, mini = False, trans = False):
 		if self.y == 0: # we dont want to draw blocks outside the field
@@ -63,6 +70,23 @@ class BlockPart:
 		
 		glPopMatrix()
 		
+	def quad(self, mini = False, trans = False):
+		""" (texture, x0, y0, x1, y1, u0, u1) of the part as draw() would draw it,
+		the texture v runs from 1.0 at y0 to 0.25 at y1. None if it is not drawn """
+		if self.y == 0:
+			return None
+		x = self.x * self.w
+		y = self.y * self.h
+		size = BLOCK_SIZE
+		if mini and self.__class__ is not BlockPartGrey:
+			size = BLOCK_SIZE * 0.4
+			x += self.mini_offset[X] * 0.4
+			y += self.mini_offset[Y] * 0.4
+		tex = self.tex_offset
+		if trans and self.__class__ is not BlockPartGrey:
+			tex = (8 / 8.0, 9 / 8.0)
+		return (self.texture, x, y, x + size, y + size, tex[0]*0.75, tex[1]*0.75)
+
 	def move(self, x, y):	
 		self.x += x
 		self.y += y
@@ -86,6 +110,13 @@ class BlockPartSpecial(BlockPart):
 		glTexCoord2d( self.tex_offset[0]*0.515625, 0.25 ); glVertex2d(0.0, BLOCK_SIZE)
 		glEnd()
 		glPopMatrix()
+	def quad(self, mini = False, trans = False):
+		if self.y == 0:
+			return None
+		x = self.x * self.w
+		y = self.y * self.h
+		return (self.texture, x, y, x + BLOCK_SIZE, y + BLOCK_SIZE,
+				self.tex_offset[0]*0.515625, self.tex_offset[1]*0.515625)
 #Special blockparts
 class BlockPartFaster(BlockPartSpecial):
 	def __init__(self, dm, x=0, y=0):
@@ -0,0 +1,175 @@
+"""Recording matches to a video file.
+
+Reading the framebuffer with glReadPixels into memory waits for the GPU to
+finish the frame, which about halves the frame rate.  A Recorder instead
+reads each frame into a pixel buffer object, which returns at once, and
+maps the buffer DELAY frames later when the copy is long done.  The frames
+are then converted and written by a FrameWriter thread.  Its queue is
+bounded, when the disk can't keep up frames are dropped instead of slowing
+down the game.
+
+Two formats are written: a Y4M stream (4:2:0, which ffmpeg and most players
+read directly) for files ending in .y4m, otherwise raw RGB frames, top row
+first.
+"""
+
+import ctypes
+import queue
+import threading
+
+import numpy
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as _glReadPixels
+
+### Frames between reading a frame into a buffer and mapping it
+DELAY = 2
+### Frames waiting for the writer before new ones are dropped
+QUEUE_SIZE = 8
+FPS = 60
+
+
+def rgb_frame(pixels, size):
+    """Return the RGB rows of the RGBA pixels read from GL, top row first"""
+    width, height = size
+    frame = numpy.frombuffer(pixels, dtype=numpy.uint8)
+    return frame.reshape(height, width, 4)[::-1, :, :3]
+
+
+def y4m_header(size, fps=FPS):
+    return b"YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C420jpeg\n" % (size[0], size[1], fps)
+
+
+def y4m_frame(rgb):
+    """Return the Y4M FRAME of rgb, full range BT.601 with 4:2:0 chroma"""
+    rgb = rgb.astype(numpy.float32)
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    u = (b - y) * 0.564 + 128.0
+    v = (r - y) * 0.713 + 128.0
+    height, width = y.shape
+    planes = [y]
+    for c in (u, v):
+        c = c[: height & ~1, : width & ~1]
+        planes.append(c.reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3)))
+    data = [b"FRAME\n"]
+    for plane in planes:
+        data.append(numpy.clip(plane + 0.5, 0, 255).astype(numpy.uint8).tobytes())
+    return b"".join(data)
+
+
+class FrameWriter(threading.Thread):
+    """Converts and writes the frames put() into its queue"""
+
+    def __init__(self, f, size, y4m=True, fps=FPS, queue_size=QUEUE_SIZE):
+        threading.Thread.__init__(self, name="capture")
+        self.daemon = True
+        self.f = f
+        self.size = size
+        self.y4m = y4m
+        self.frames = queue.Queue(queue_size)
+        self.written = 0
+        self.dropped = 0
+        if y4m:
+            f.write(y4m_header(size, fps))
+
+    def put(self, pixels, block=False):
+        """Queue the RGBA pixels of a frame, False if it had to be dropped"""
+        try:
+            self.frames.put(pixels, block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def run(self):
+        while True:
+            pixels = self.frames.get()
+            if pixels is None:
+                break
+            self.write(pixels)
+
+    def write(self, pixels):
+        rgb = rgb_frame(pixels, self.size)
+        if self.y4m:
+            self.f.write(y4m_frame(rgb))
+        else:
+            self.f.write(numpy.ascontiguousarray(rgb).tobytes())
+        self.written += 1
+
+    def close(self):
+        """Write the queued frames and stop"""
+        self.frames.put(None)
+        self.join()
+        self.f.close()
+
+
+class Recorder:
+    """Captures the frames drawn on the screen, call capture() before flip"""
+
+    def __init__(self, filename, size, fps=FPS, delay=DELAY, queue_size=QUEUE_SIZE):
+        self.size = size
+        self.fps = fps
+        self.delay = delay
+        self.writer = FrameWriter(
+            open(filename, "wb"), size, filename.endswith(".y4m"), fps, queue_size
+        )
+        self.writer.start()
+        self.buffers = []
+        ### Frames read into the buffers since reset()
+        self.count = 0
+        self.frametime = 0
+
+    def reset(self):
+        """Make the buffers, capture() calls it after a release()"""
+        self.count = 0
+        width, height = self.size
+        self.buffers = [int(b) for b in numpy.ravel(glGenBuffers(self.delay))]
+        for pbo in self.buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, width * height * 4, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+    def capture(self, frametime=None):
+        """Read the frame into a buffer and pass on the one from DELAY frames
+        ago.  With frametime in ms, only capture at the rate of fps."""
+        if frametime is not None:
+            self.frametime += frametime
+            if self.frametime < 1000.0 / self.fps:
+                return
+            self.frametime %= 1000.0 / self.fps
+        if not self.buffers:
+            self.reset()
+        pbo = self.buffers[self.count % self.delay]
+        if self.count >= self.delay:
+            self.read(pbo)
+        width, height = self.size
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        _glReadPixels(
+            0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0)
+        )
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.count += 1
+
+    def read(self, pbo, block=False):
+        """Map a buffer filled DELAY frames ago and queue its frame"""
+        width, height = self.size
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        address = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        if address:
+            self.writer.put(ctypes.string_at(address, width * height * 4), block)
+            glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+    def release(self):
+        """Pass on the frames still in the buffers and delete them, before
+        the GL context goes away"""
+        if self.buffers:
+            for i in range(max(0, self.count - self.delay), self.count):
+                self.read(self.buffers[i % self.delay], True)
+            glDeleteBuffers(len(self.buffers), self.buffers)
+        self.buffers = []
+
+    def close(self):
+        """Write the frames still in the buffers and finish the file"""
+        self.release()
+        self.writer.close()
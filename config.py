@@ -0,0 +1,88 @@
+"""profiles.cfg and settings.cfg, parsed once and kept in memory.
+
+Every PlayerField used to parse profiles.cfg when a game started, the
+profile dialogs parsed it again each time they opened and every click on a
+menu switch rewrote settings.cfg.  Now open_config() parses a file the
+first time it's asked for and hands out the same ConfigObj after that.
+Code that changes it calls changed(), and flush(), called once a frame,
+writes the file when it hasn't changed for SAVE_DELAY seconds, so a burst
+of clicks is one write.  Writes go to a temporary file that replaces the
+old one, a crash never leaves a half written config behind.
+"""
+
+import os
+import time
+
+from configobj import ConfigObj
+
+### Seconds to wait after the last change before writing a file
+SAVE_DELAY = 1.0
+
+### The ConfigFiles read so far, by absolute path
+_files = {}
+
+
+class ConfigFile:
+    """A config file in memory, data is its ConfigObj"""
+
+    def __init__(self, filename, delay=SAVE_DELAY):
+        self.filename = filename
+        self.delay = delay
+        self.data = ConfigObj(filename)
+        ### When to write the changes, None when there are none
+        self.deadline = None
+
+    def changed(self, now=None):
+        """Note a change of data, it's written delay seconds from now unless
+        it changes again"""
+        if now is None:
+            now = time.monotonic()
+        self.deadline = now + self.delay
+
+    def flush(self, now=None):
+        """Write the changes if they are old enough"""
+        if self.deadline is None:
+            return
+        if now is None:
+            now = time.monotonic()
+        if now >= self.deadline:
+            self.save()
+
+    def save(self):
+        tmp = self.filename + ".tmp"
+        with open(tmp, "wb") as f:
+            self.data.write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+        self.deadline = None
+
+
+def open_config(filename):
+    """Return the ConfigFile of filename, parsing it on the first call"""
+    path = os.path.abspath(filename)
+    config = _files.get(path)
+    if config is None:
+        config = _files[path] = ConfigFile(path)
+    return config
+
+
+def profiles():
+    return open_config("profiles.cfg")
+
+
+def settings():
+    return open_config("settings.cfg")
+
+
+def flush(now=None):
+    """Write the files whose changes are old enough, call once a frame"""
+    for config in _files.values():
+        config.flush(now)
+
+
+def save_all():
+    """Write every pending change now, at exit"""
+    for config in _files.values():
+        if config.deadline is not None:
+            config.save()
@@ -7,6 +7,10 @@ from OpenGL.GLU import *
 from OpenGL.GLUT import *
 from pygame.locals import *
 
+from blocks import compiled_dls
+from music import MusicService
+from sounds import REPEAT_INTERVAL, REPEATING, SoundDispatcher
+
 
 class DataManager:
     def cleanup(self):
@@ -27,11 +31,16 @@ class DataManager:
         except Exception:
             pass
 
-    def __init__(self):
+    def __init__(self, jukebox=None):
         self.textures = {}
         self.backgrounds = {}
         self.players = []
         self.gameover_players = []
+        self.sounds = SoundDispatcher()
+        ### Main passes its own, which lives longer than a DataManager
+        if jukebox is None:
+            jukebox = MusicService()
+        self.jukebox = jukebox
         soundpath = "sounds"
         self.placesound = pygame.mixer.Sound(os.path.join(soundpath, "DEEK.WAV"))
         self.gameoversound = pygame.mixer.Sound(os.path.join(soundpath, "RASPB.WAV"))
@@ -60,9 +69,25 @@ class DataManager:
             "Blind": pygame.mixer.Sound(os.path.join(soundpath, "TICK.WAV")),
             "Blink": pygame.mixer.Sound(os.path.join(soundpath, "ZING.WAV")),
         }
+        self.cue_sounds()
+
+    def cue_sounds(self):
+        """Route the sounds through self.sounds, see sounds.SoundDispatcher"""
+        sounds = self.sounds
+        self.placesound = sounds.cue("Place", self.placesound, "place")
+        self.gameoversound = sounds.cue("GameOver", self.gameoversound, "gameover")
+        self.welcomesound = sounds.cue("Welcome", self.welcomesound, "ui")
+        for name, sound in self.specialsounds.items():
+            if name in REPEATING:
+                cue = sounds.cue(name, sound, "repeat", REPEAT_INTERVAL)
+            else:
+                cue = sounds.cue(name, sound, "special")
+            self.specialsounds[name] = cue
 
     def load_textures(self):
-        names = os.listdir("images")
+        ### Textures are loaded into a new GL context, which has no lists yet
+        compiled_dls.clear()
+        names = sorted(os.listdir("images"))
         texture_names = []
         for name in names:
             if name.endswith(".png") and name not in ["main_eit.png", "main_right.png"]:
@@ -95,7 +120,7 @@ class DataManager:
 
     def load_backgrounds(self):
         dir = os.path.join("images", "backgrounds")
-        names = os.listdir(dir)
+        names = sorted(os.listdir(dir))
         texture_names = []
         for name in names:
             if name.endswith(".png"):
@@ -131,10 +156,51 @@ class DataManager:
         self.backgrounds = backgrounds
 
     def random_music(self):
-        try:
-            filenames = os.listdir("music")
-            fn = choice(filenames)
-            # print("music:", fn)
-            music = pygame.mixer.music.load("music/" + fn)
-        except Exception:
-            print("Couldnt load " + fn)
+        """Switch to the next track of the shuffled playlist, without waiting
+        for it to load if it hasn't been prefetched yet"""
+        self.jukebox.play()
+
+
+class HeadlessDataManager(DataManager):
+    """DataManager for a simulation without a window, OpenGL or audio.
+
+    Textures get fake ids, but there is one per image like in DataManager, so
+    random choices among them consume the random numbers in the same way.
+    """
+
+    def __init__(self):
+        self.textures = {}
+        self.backgrounds = {}
+        self.players = []
+        self.gameover_players = []
+        self.music = False
+        self.fullscreen = False
+        self.jukebox = MusicService()
+        self.sounds = SoundDispatcher(enabled=False)
+        self.placesound = self.gameoversound = self.welcomesound = None
+        self.specialsounds = dict.fromkeys(
+            (
+                "Faster Slower Stair Fill Rumble Inverse Flip Switch Packet "
+                "Clear Question Bridge Mini Color Trans SZ Anti Background "
+                "Blind Blink"
+            ).split()
+        )
+        self.cue_sounds()
+        self.load_textures()
+        self.load_backgrounds()
+
+    def cleanup(self):
+        pass
+
+    def load_textures(self):
+        names = sorted(os.listdir("images"))
+        names = [n for n in names if n.endswith(".png")]
+        self.textures = dict((name[:-4], i + 1) for i, name in enumerate(names))
+
+    def load_backgrounds(self):
+        names = sorted(os.listdir(os.path.join("images", "backgrounds")))
+        names = [n for n in names if n.endswith(".png")]
+        self.backgrounds = dict((name[:-4], 1000 + i) for i, name in enumerate(names))
+
+    def random_music(self):
+        pass
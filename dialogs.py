@@ -3,7 +3,7 @@ import os
 import pygame
 from pygame.locals import *
 
-from configobj import ConfigObj
+import config
 from pgu import gui, high
 
 
@@ -19,7 +19,7 @@ class ManageProfilesDialog(gui.Dialog):
         space = (5, 5)  # title.style.font.size(" ")
         t.tr()
         txtcolor = (0, 255, 0)
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
 
         ### New Profile
         doc = gui.Document(width=100, background=(0, 0, 0))
@@ -123,7 +123,7 @@ class ManageProfilesDialog(gui.Dialog):
         gui.Dialog.__init__(self, title, gui.ScrollArea(t, width, height))
 
     def update_profile(self, e):
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         try:
             del profiles[self.profile_list.value]
         except KeyError:
@@ -140,7 +140,7 @@ class ManageProfilesDialog(gui.Dialog):
             profiles[name]["Anti"] = self.use_anti.value
             profiles[name]["Change"] = self.change_target.value
 
-        profiles.write()
+        config.profiles().changed()
         self.profile_list.clear()
         names = sorted(profiles.keys())
         for name in names:
@@ -149,7 +149,7 @@ class ManageProfilesDialog(gui.Dialog):
         self.profile_list.repaint()
 
     def select_profile(self, e):
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         name = self.profile_list.value
         if name is not None and name in profiles:
             self.name.value = name
@@ -163,7 +163,7 @@ class ManageProfilesDialog(gui.Dialog):
             self.change_target.value = profiles[name]["Change"]
 
     def new_profile(self, e):
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         # print "."
         new_name = "Player"
         while new_name in profiles:
@@ -179,7 +179,7 @@ class ManageProfilesDialog(gui.Dialog):
             "Anti": "100",
             "Change": "100",
         }
-        profiles.write()
+        config.profiles().changed()
         self.profile_list.clear()
         names = sorted(profiles.keys())
         for name in names:
@@ -188,12 +188,12 @@ class ManageProfilesDialog(gui.Dialog):
         self.profile_list.repaint()
 
     def delete_profile(self, e):
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         try:
             del profiles[self.profile_list.value]
         except KeyError:
             pass
-        profiles.write()
+        config.profiles().changed()
         self.profile_list.clear()
         names = sorted(profiles.keys())
         for name in names:
@@ -341,7 +341,7 @@ class SelectProfileDialog(gui.Dialog):
 
         doc.block(align=1)
 
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         self.profile_list = gui.List(width=155, height=120)
         names = sorted(profiles.keys())
         for name in names:
@@ -371,7 +371,7 @@ class SelectProfileDialog(gui.Dialog):
         gui.Dialog.__init__(self, title, gui.ScrollArea(c, width, height))
 
     def open(self, *params):
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         self.profile_list.clear()
         names = sorted(profiles.keys())
         for name in names:
@@ -403,6 +403,34 @@ class SelectProfileDialog(gui.Dialog):
         self.close()
 
 
+class _ScoreRows:
+    """The rows of a scoretable, formatted for ViewScoreDialog.
+
+    Only the slice that is asked for is read from the scoretable.
+    """
+
+    def __init__(self, scoretable):
+        self.scoretable = scoretable
+
+    def __len__(self):
+        return self.scoretable.count()
+
+    def __getitem__(self, s):
+        rows = []
+        for name, stat in self.scoretable.get_list(s.start, s.stop - s.start):
+            rows.append(
+                (
+                    stat["Rank Points"],
+                    name,
+                    stat["Score"],
+                    stat["Lines"],
+                    stat["Max Level"],
+                    str(stat["Winns"]) + "/" + str(stat["Matches"] - stat["Winns"]),
+                )
+            )
+        return rows
+
+
 class ViewScoreDialog(gui.Dialog):
     def __init__(self, scoretable):
         title = gui.Label("Highscores")
@@ -411,67 +439,40 @@ class ViewScoreDialog(gui.Dialog):
         height = 250
         bgcolor = (0, 0, 0)
         txtcolor = (0, 255, 0)
+        columns = [75, 110, 80, 70, 55, 55]
         c = gui.Container(background=bgcolor)
 
-        doc = gui.Document(width=width, background=bgcolor)
-
-        space = (5, 5)  # title.style.font.size(" ")
-
-        doc.block(align=0)
-        """
-		for word in "Highscores!".split(" "): 
-			doc.add(gui.Label(word, color = txtcolor))
-			doc.space(space)
-		"""
-        doc.br(space[1])
-        """
-		self.stats = {"Test":{"Matches":0, "Score":0, "Lines":0, "Max Level":0, 
-							  "Rank Points":0, "Winns":0}}
-		"""
-        t = gui.Table(width=445, height=200)
+        t = gui.Table(width=445, background=bgcolor)
         t.tr()
-        t.td(gui.Label("Rank Pts", color=txtcolor))
-        t.td(gui.Label("Name", color=txtcolor))
-        t.td(gui.Label("Tot Score", color=txtcolor))
-        t.td(gui.Label("Tot Lines", color=txtcolor))
-        t.td(gui.Label("Max Lvl", color=txtcolor))
-        t.td(gui.Label("W/L", color=txtcolor))
-        t.tr()
-        t.td(gui.Spacer(1, 10))
-        place = 1
-
-        l = scoretable.get_list()
-        for name, stat in l:
-            t.tr()
-            t.td(gui.Label(str(stat["Rank Points"]), color=txtcolor))
-            t.td(gui.Label(name, color=txtcolor))
-            t.td(gui.Label(str(stat["Score"]), color=txtcolor))
-            t.td(gui.Label(str(stat["Lines"]), color=txtcolor))
-            t.td(gui.Label(str(stat["Max Level"]), color=txtcolor))
-            t.td(
-                gui.Label(
-                    str(stat["Winns"]) + "/" + str(stat["Matches"] - stat["Winns"]),
-                    color=txtcolor,
-                )
-            )
-
-        doc.add(t)
-
-        t = gui.Table(width=155, height=30, background=bgcolor)
-
-        # ok_button = gui.Button("Ok", width=55)
-        # ok_button.connect(gui.CLICK,self.send,gui.CHANGE)
-        t.tr()
-        # t.td(ok_button)
+        for text, w in zip(
+            ["Rank Pts", "Name", "Tot Score", "Tot Lines", "Max Lvl", "W/L"], columns
+        ):
+            t.td(gui.Label(text, color=txtcolor), width=w, align=-1)
+        c.add(t, 0, 5)
+
+        ### Only the visible rows are created, they are filled from the
+        ### scoretable as the list is scrolled
+        self.score_list = gui.VirtualList(
+            445,
+            175,
+            columns,
+            _ScoreRows(scoretable),
+            font=title.style.font,
+            color=txtcolor,
+            background=bgcolor,
+        )
+        c.add(self.score_list, 0, 35)
 
         b = gui.Button("Ok", width=55)
         b.connect(gui.CLICK, self.close, None)
-        t.td(b)
+        c.add(b, 195, 215)
 
-        doc.add(t)
-        c.add(doc, 0, 0)
         gui.Dialog.__init__(self, title, gui.ScrollArea(c, width, height))
 
+    def open(self, *params):
+        self.score_list.refresh()
+        gui.Dialog.open(self, *params)
+
 
 class EnterScoreDialog(gui.Dialog):
     def __init__(self, score):
@@ -3,8 +3,10 @@
 mail: vb@viblo.se
 """
 
+import argparse
 import os
 import pickle
+import sys
 from random import *
 
 import pygame
@@ -14,21 +16,34 @@ from OpenGL.GLUT import *
 from pgu import gui
 from pygame.locals import *
 
+import config
 from blocks import *
 from datamanager import *
 from dialogs import *
 from eit_constants import *
+from layout import SCREEN, grid
+from music import MusicService
+from netplay import NetplayError
 from playerfield import *
+from scoredb import ScoreDB
 
+SCORETABLE_FILE = "scoretable.db"
+LEGACY_SCORETABLE_FILE = "scoretable.dat"
+### Longest time the menu sleeps waiting for an event, in ms
+MENU_IDLE_WAIT = 250
 
-def resize(size):
+
+def resize(size, canvas=None):
+    """Set up the window, drawing on canvas (width, height) stretched to fit"""
     (width, height) = size
     if height == 0:
         height = 1
+    if canvas is None:
+        canvas = (width, height)
     glViewport(0, 0, width, height)
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
-    glOrtho(0.0, width, height, 0.0, -1.0, 1.0)
+    glOrtho(0.0, canvas[0], canvas[1], 0.0, -1.0, 1.0)
     glMatrixMode(GL_MODELVIEW)
     glLoadIdentity()
 
@@ -56,12 +71,17 @@ class Scoretable:
 							  "Rank Points":0, "Winns":0}}
 		"""
 
-    def get_list(self):
+    def count(self):
+        return len(self.stats)
+
+    def get_list(self, offset=0, limit=None):
         l = list(self.stats.items())
         l.sort(key=lambda x: x[1]["Rank Points"])
         l.reverse()
         # print l
-        return l
+        if limit is None:
+            return l[offset:]
+        return l[offset : offset + limit]
 
     def insert_result(self, winner, losers):
         ### Update winner
@@ -115,33 +135,43 @@ class Scoretable:
 
 class Main(gui.Container):
     def load_scoretable(self):
-        try:
-            f = open("scoretable.dat", "rb")
-            self.scoretable = pickle.load(f)
-        except Exception:
-            self.scoretable = Scoretable()
-            self.save_scoretable()
+        self.scoretable = ScoreDB(SCORETABLE_FILE)
+        ### Carry over the stats from the old pickled scoretable
+        self.scoretable.import_pickle(LEGACY_SCORETABLE_FILE)
 
     def save_scoretable(self):
-        if self.scoretable is not None:
-            with open("scoretable.dat", "wb") as f:
+        """Only needed for the old pickled Scoretable, ScoreDB commits
+        every result as it is inserted"""
+        if isinstance(self.scoretable, Scoretable):
+            with open(LEGACY_SCORETABLE_FILE, "wb") as f:
                 pickle.dump(self.scoretable, f)
 
-    def __init__(self):
-
+    def __init__(self, net=None, spectators=None, bots=0, recorder=None):
+
+        ### netplay.NetGame when playing over the network
+        self.net = net
+        ### spectator.Spectators when viewers can watch the game
+        self.spectators = spectators
+        ### Players with random keys added to local games
+        self.bots = bots
+        ### capture.Recorder when the games are recorded to a video file
+        self.recorder = recorder
+        self.canvas = SCREEN
         self.all_gameover = False
         ### Load scoretable
         self.load_scoretable()
         ### Load settings
-        settings = ConfigObj("settings.cfg")
-        self.active_profiles = {
-            0: settings["0"],
-            1: settings["1"],
-            2: settings["2"],
-            3: settings["3"],
-        }
+        settings = config.settings().data
+        ### The menu has four slots, settings.cfg can add more
+        self.active_profiles = []
+        i = 0
+        while i < 4 or str(i) in settings:
+            self.active_profiles.append(settings.get(str(i), "None"))
+            i += 1
         self.fullscreen = settings["Fullscreen"] == "True"
         self.music = settings["Music"] == "True"
+        ### Kept across games, so the playlist doesn't repeat tracks
+        self.jukebox = MusicService()
 
         gui.Container.__init__(
             self,
@@ -208,8 +238,8 @@ class Main(gui.Container):
         t.td(gui.Spacer(1, 10))
 
         b = gui.Button("Highscores", width=120)
-        d = ViewScoreDialog(self.scoretable)
-        b.connect(gui.CLICK, d.open, None)
+        self.score_dialog = None
+        b.connect(gui.CLICK, self.m_highscores, None)
         t.tr()
         t.td(b, align=0)
 
@@ -258,6 +288,12 @@ class Main(gui.Container):
     def m_music(self, e):
         self.music = not self.music
         self.save_settings()
+        self.prefetch_music()
+
+    def prefetch_music(self):
+        """Read the first track of the next game while the menus are up"""
+        if self.music:
+            self.jukebox.prefetch()
 
     def m_del(self, i):
         self.active_profiles_buttons[i].value = "None"
@@ -269,19 +305,23 @@ class Main(gui.Container):
         d.open()
         self.i = i
 
+    def m_highscores(self, e):
+        ### Built on first use, most sessions never open the highscores
+        if self.score_dialog is None:
+            self.score_dialog = ViewScoreDialog(self.scoretable)
+        self.score_dialog.open()
+
     def m_manage_profiles(self, e):
         d = ManageProfilesDialog()
         d.open()
 
     def save_settings(self):
-        settings = ConfigObj("settings.cfg")
-        settings["0"] = self.active_profiles[0]
-        settings["1"] = self.active_profiles[1]
-        settings["2"] = self.active_profiles[2]
-        settings["3"] = self.active_profiles[3]
+        settings = config.settings().data
+        for i, name in enumerate(self.active_profiles):
+            settings[str(i)] = name
         settings["Music"] = str(self.music)
         settings["Fullscreen"] = str(self.fullscreen)
-        settings.write()
+        config.settings().changed()
 
     def m_select_profile(self, d):
         name = d.profile_list.value
@@ -301,7 +341,12 @@ class Main(gui.Container):
 
     def init_menu(self):
         ### Menu here:
-        app = gui.App(theme=gui.Theme(dirs=[os.path.join("data", "themes", "eit")]))
+        app = gui.App(
+            theme=gui.Theme(
+                dirs=[os.path.join("data", "themes", "eit")], preload=True
+            ),
+            background=(0, 0, 0),
+        )
         t = self
 
         c = gui.Container(align=-1, valign=-1)
@@ -315,7 +360,7 @@ class Main(gui.Container):
         init()
         pygame.mouse.set_visible(False)
         # pygame.event.set_grab(1)
-        self.dm = DataManager()
+        self.dm = DataManager(self.jukebox)
         self.dm.load_textures()
         self.dm.load_backgrounds()
         self.dm.music = self.music
@@ -326,41 +371,66 @@ class Main(gui.Container):
         ### music
         if self.dm.music:
             self.dm.random_music()
-            pygame.mixer.music.play(-1)  # infinite loop of music
 
         ### Players
         self.dm.players = []
         self.dm.gameover_players = []
-        if self.active_profiles[0] != "None":
-            player1field = PlayerField(self.dm, 0, self.active_profiles[0], 0 + 16, 16)
-            self.dm.players.append(player1field)
-        if self.active_profiles[1] != "None":
-            player2field = PlayerField(
-                self.dm, 1, self.active_profiles[1], 248 + 16, 16
-            )
-            self.dm.players.append(player2field)
-        if self.active_profiles[2] != "None":
-            player3field = PlayerField(
-                self.dm, 2, self.active_profiles[2], 248 * 2 + 16, 16
-            )
-            self.dm.players.append(player3field)
-        if self.active_profiles[3] != "None":
-            player4field = PlayerField(
-                self.dm, 3, self.active_profiles[3], 248 * 3 + 16, 16
-            )
-            self.dm.players.append(player4field)
+        if self.net is not None:
+            ### The players and the random seed come from the server, the
+            ### Waiting state polls for them and then calls begin_game
+            self.net.join(self.active_profiles[0])
+            self.state = "Waiting"
+            self.canvas = SCREEN
+            resize(SCREEN, self.canvas)
+            return
+        else:
+            ### The slot decides the default keys, the fields are packed
+            slots = [
+                (i, name)
+                for i, name in enumerate(self.active_profiles)
+                if name != "None"
+            ]
+            self.canvas, positions = grid(len(slots) + self.bots)
+            for (i, name), (px, py) in zip(slots, positions):
+                self.dm.players.append(PlayerField(self.dm, i, name, px, py))
+            for i in range(self.bots):
+                px, py = positions[len(slots) + i]
+                id = len(self.active_profiles) + i
+                name = "Bot " + str(i + 1)
+                self.dm.players.append(BotField(self.dm, id, name, px, py))
 
-        for player in self.dm.players:
-            player.next_target()
+            for player in self.dm.players:
+                player.next_target()
+        self.begin_game()
 
+    def wait_for_players(self):
+        """Poll the network game, start it once every player has joined"""
+        try:
+            match = self.net.poll(self.dm)
+        except (OSError, NetplayError) as e:
+            print("netplay: could not join: %s" % e)
+            self.to_menu()
+            return
+        if match is not None:
+            self.canvas = grid(len(self.dm.players))[0]
+            self.state = "Game"
+            self.begin_game()
+
+    def begin_game(self):
+        """Show the players in dm.players and start playing"""
+        resize(SCREEN, self.canvas)
+
+        if self.spectators is not None:
+            self.spectators.watch(self.dm.players)
         self.all_gameover = False
         self.paused = False
         self.dm.welcomesound.play()
 
     def pause_screen(self):
-        size = 1024, 768
+        size = self.canvas
         glLoadIdentity()
         glTranslated(size[X] / 2, size[Y] / 2, 0.0)
+        glScaled(size[X] / SCREEN[X], size[Y] / SCREEN[Y], 1.0)
         glColor4d(0.2, 0.2, 0.2, 0.5)
         glDisable(GL_TEXTURE_2D)
         glBegin(GL_QUADS)
@@ -378,11 +448,34 @@ class Main(gui.Container):
             glutBitmapCharacter(GLUT_BITMAP_HELVETICA_12, ord(c))
         glEnable(GL_TEXTURE_2D)
 
+    def waiting_screen(self):
+        size = self.canvas
+        glLoadIdentity()
+        glTranslated(size[X] / 2, size[Y] / 2, 0.0)
+        glScaled(size[X] / SCREEN[X], size[Y] / SCREEN[Y], 1.0)
+        glColor4d(0.2, 0.2, 0.2, 0.5)
+        glDisable(GL_TEXTURE_2D)
+        glBegin(GL_QUADS)
+        glVertex2d(-496, -100)
+        glVertex2d(496, -100)
+        glVertex2d(496, 100)
+        glVertex2d(-496, 100)
+        glEnd()
+        glColor(1.0, 1.0, 1.0)
+        glRasterPos2d(-150, 12)
+        for c in "Waiting for the other players":
+            glutBitmapCharacter(GLUT_BITMAP_TIMES_ROMAN_24, ord(c))
+        glRasterPos2d(-60, 40)
+        for c in "(press ESC to cancel)":
+            glutBitmapCharacter(GLUT_BITMAP_HELVETICA_12, ord(c))
+        glEnable(GL_TEXTURE_2D)
+
     def gameover_screen(self):
-        size = 1024, 768
+        size = self.canvas
         # size = 4*248, 735
         glLoadIdentity()
         glTranslated(size[X] / 2, size[Y] / 2, 0.0)
+        glScaled(size[X] / SCREEN[X], size[Y] / SCREEN[Y], 1.0)
         glColor4d(0.2, 0.2, 0.2, 0.5)
         glDisable(GL_TEXTURE_2D)
         glBegin(GL_QUADS)
@@ -402,9 +495,17 @@ class Main(gui.Container):
         glEnable(GL_TEXTURE_2D)
 
     def to_menu(self):
+        if self.net is not None:
+            self.net.close()
+        if self.recorder is not None:
+            self.recorder.release()
         self.screen = pygame.display.set_mode((640, 500), SWSURFACE)
         pygame.mouse.set_visible(True)
         self.state = "Menu"
+        self.prefetch_music()
+        ### The game drew over everything, start the menu with a full repaint
+        self.app.screen = self.screen
+        self.app.repaintall()
 
     def calc_stats(self, winner):
         losers = []
@@ -428,10 +529,19 @@ class Main(gui.Container):
     def loop(self):
         """Main Loop"""
         if self.state == "Menu":
-            self.screen.fill((255, 255, 255))
-            self.screen.fill((0, 0, 0))
-            self.app.paint(self.screen)
-            for event in pygame.event.get():
+            ### Only draw the widgets that changed since the last frame
+            rects = self.app.update(self.screen)
+            if rects:
+                pygame.display.update(rects)
+            self.clock.tick(60)
+
+            ### Sleep until something happens instead of spinning
+            event = pygame.event.wait(MENU_IDLE_WAIT)
+            if event.type == NOEVENT:
+                events = []
+            else:
+                events = [event] + pygame.event.get()
+            for event in events:
                 if event.type == QUIT:
                     self.running = False
                 elif event.type == KEYDOWN and event.key == K_ESCAPE:
@@ -450,10 +560,6 @@ class Main(gui.Container):
                     self.start_new_game()
                 self.app.event(event)
 
-            pygame.time.wait(6)  ### Uncomment here and in menu to not use all cpu
-            self.clock.tick(60)
-            pygame.display.flip()
-
         elif self.state == "Paused":
             for event in pygame.event.get():
                 if event.type == QUIT:
@@ -462,31 +568,46 @@ class Main(gui.Container):
                     self.to_menu()
                 elif event.type == KEYDOWN and event.key == K_PAUSE:
                     self.state = "Game"
-                elif event.type == KEYDOWN and event.key == K_F2:
+                elif event.type == KEYDOWN and event.key == K_F2 and self.net is None:
                     self.start_new_game()
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-            for player in self.dm.players:
-                player.draw()
+            draw_players(self.dm.players)
             self.pause_screen()
 
             pygame.time.wait(6)  ### Uncomment here and in menu to not use all cpu
             self.clock.tick(60)
             pygame.display.flip()
 
+        elif self.state == "Waiting":
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    self.running = False
+                elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                    self.to_menu()
+            if self.state == "Waiting":
+                self.wait_for_players()
+            if self.state == "Waiting":
+                glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                self.waiting_screen()
+                pygame.display.flip()
+            pygame.time.wait(6)
+            self.clock.tick(60)
+
         elif self.state == "GameOver":
             for event in pygame.event.get():
                 if event.type == QUIT:
                     self.running = False
                 elif event.type == KEYDOWN and event.key == K_ESCAPE:
                     self.to_menu()
-                elif event.type == KEYDOWN and event.key == K_F2:
+                elif event.type == KEYDOWN and event.key == K_F2 and self.net is None:
                     self.start_new_game()
 
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-            for player in self.dm.players:
-                player.draw()
+            draw_players(self.dm.players)
 
             self.gameover_screen()
+            if self.recorder is not None:
+                self.recorder.capture(self.clock.get_time())
             pygame.time.wait(6)  ### Uncomment here and in menu to not use all cpu
             self.clock.tick(60)
             pygame.display.flip()
@@ -506,7 +627,7 @@ class Main(gui.Container):
                     self.to_menu()
                 elif event.type == KEYDOWN and event.key == K_PAUSE:
                     self.state = "Paused"
-                elif event.type == KEYDOWN and event.key == K_F2:
+                elif event.type == KEYDOWN and event.key == K_F2 and self.net is None:
                     self.start_new_game()
                 elif event.type == USEREVENT and event.utype == "GameOver":
                     self.dm.gameover_players.append(event.player)
@@ -516,15 +637,26 @@ class Main(gui.Container):
                         self.calc_stats(event.player)
                 else:
                     player_events.append(event)
+            if self.state == "Menu":
+                return
 
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
             ### let each player do its own event handling and drawing
-            for player in self.dm.players:
-                player.update(player_events, frametime)
+            if self.net is not None:
+                self.net.update(player_events, frametime)
+                if self.net.client.closed:
+                    print("netplay: connection lost: %s" % self.net.client.lost())
+                    self.to_menu()
+                    return
+            else:
+                for player in self.dm.players:
+                    player.update(player_events, frametime)
 
-            for player in self.dm.players:
-                player.draw()
+            draw_players(self.dm.players)
+
+            if self.spectators is not None:
+                self.spectators.update(frametime)
 
             fps = self.clock.get_fps()
             if self.fps_var > 50:
@@ -532,8 +664,19 @@ class Main(gui.Container):
                 pygame.display.set_caption("Eit - fps: " + str(fps)[:5])
                 self.fps_var = 0
 
+            if self.recorder is not None:
+                self.recorder.capture(frametime)
+
             pygame.display.flip()
 
+        ### Play the sounds of this frame, each once
+        if self.state != "Menu":
+            self.dm.sounds.flush()
+            self.dm.jukebox.update()
+
+        ### Write the config files a while after their last change
+        config.flush()
+
     def main(self):
 
         ### Initialise screen
@@ -555,15 +698,69 @@ class Main(gui.Container):
         self.running = True
         self.in_menu = True
         self.state = "Menu"
+        self.prefetch_music()
         while self.running:
             self.loop()
 
 
-def run_game():
-    m = Main()
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="eit.py")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="join a networked match")
+    parser.add_argument(
+        "--rollback",
+        action="store_true",
+        help="don't wait for the inputs of the other players, needs --connect",
+    )
+    parser.add_argument(
+        "--spectate", metavar="PORT", type=int, help="let spectators watch on PORT"
+    )
+    parser.add_argument("--bots", type=int, default=0, help="number of bots to add")
+    parser.add_argument("--record", metavar="FILE", help="record the matches to FILE")
+    options = parser.parse_args(list(args))
+    if options.rollback and options.connect is None:
+        parser.error("--rollback needs --connect")
+    if options.bots < 0:
+        parser.error("--bots can't be negative")
+    if options.connect is not None:
+        import netplay
+
+        try:
+            options.address = netplay.parse_address(options.connect)
+        except ValueError:
+            parser.error("--connect takes HOST:PORT, not %r" % options.connect)
+    return options
+
+
+def run_game(args=()):
+    options = parse_args(args)
+    net = None
+    if options.connect is not None:
+        import netplay
+
+        session = netplay.Lockstep
+        if options.rollback:
+            from rollback import Rollback as session
+        net = netplay.NetGame(*options.address, session=session)
+    spectators = None
+    if options.spectate is not None:
+        import spectator
+
+        spectators = spectator.Spectators(options.spectate)
+    bots = options.bots
+    recorder = None
+    if options.record is not None:
+        import capture
+
+        recorder = capture.Recorder(options.record, SCREEN)
+    m = Main(net, spectators, bots, recorder)
     try:
         m.main()
     finally:
+        config.save_all()
+        if spectators is not None:
+            spectators.close()
+        if recorder is not None:
+            recorder.close()
         if hasattr(m, "dm"):
             m.dm.cleanup()
 
@@ -598,6 +795,6 @@ def run_test():
 if __name__ == "__main__":
     DO_PROFILING = 0
     if not DO_PROFILING:
-        run_game()
+        run_game(sys.argv[1:])
     else:
         run_test()
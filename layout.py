@@ -0,0 +1,39 @@
+"""Where the fields of a match go on the screen.
+
+The game draws on a virtual canvas and resize() maps it onto the window, so
+a layout only has to place the fields in a grid and make the canvas big
+enough for it.  Up to four fields fit side by side in 1024x768 at their
+full size, more are tiled in rows and everything is scaled down to fit.
+"""
+
+### Size of a PlayerField, its BlockField and the info box below it
+FIELD_WIDTH = 248
+FIELD_HEIGHT = 736
+MARGIN = 16
+SCREEN = (1024, 768)
+
+
+def grid(n, size=SCREEN):
+    """Return (canvas, positions) for n fields in a window of size.
+
+    canvas is the (width, height) to draw on, with the same aspect as size,
+    and positions the top left corner of each field on it.
+    """
+    width, height = size
+    best = None
+    for cols in range(1, max(n, 1) + 1):
+        rows = (n + cols - 1) // cols
+        need_w = cols * FIELD_WIDTH + 2 * MARGIN
+        need_h = rows * (FIELD_HEIGHT + MARGIN) + MARGIN
+        scale = min(1.0, width * 1.0 / need_w, height * 1.0 / need_h)
+        if best is None or scale > best[0]:
+            best = (scale, cols)
+    scale, cols = best
+    canvas = (width / scale, height / scale)
+    positions = []
+    for i in range(n):
+        row, col = divmod(i, cols)
+        positions.append(
+            (MARGIN + col * FIELD_WIDTH, MARGIN + row * (FIELD_HEIGHT + MARGIN))
+        )
+    return canvas, positions
@@ -0,0 +1,131 @@
+"""Background music, read ahead of time on a worker thread.
+
+Loading a tracker module from disk at the start of a game delays the first
+frame, noticeably so on slow storage.  MusicService keeps a shuffled
+playlist and reads the next track into memory on a worker thread while the
+menus or the current match run, checking that it looks like a module.  When
+a game starts the track is handed to pygame.mixer.music from memory, and if
+it isn't ready yet the game starts without it and update() starts it once
+it is.
+"""
+
+import io
+import os
+import random
+import threading
+
+import pygame
+
+MUSIC_PATH = "music"
+
+
+def is_module(data):
+    """Tell if data looks like a MOD or S3M module"""
+    if data[44:48] == b"SCRM":
+        return True
+    tag = data[1080:1084]
+    return len(tag) == 4 and (
+        tag in (b"M.K.", b"M!K!", b"FLT4", b"FLT8", b"OCTA", b"CD81")
+        or tag[1:] == b"CHN"
+        or tag[2:] == b"CH"
+    )
+
+
+class MusicService:
+    """Plays the tracks in path in a shuffled order, each once per round"""
+
+    def __init__(self, path=MUSIC_PATH, rnd=None):
+        self.path = path
+        ### Its own random, the game's random must not depend on the thread
+        self.random = rnd or random.Random()
+        self.playlist = []
+        self.bad = set()
+        self.last = None
+        self.current = None
+        self.ready = None
+        self.waiting = False
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def tracks(self):
+        try:
+            names = sorted(os.listdir(self.path))
+        except OSError:
+            return []
+        return [n for n in names if n not in self.bad]
+
+    def next_name(self):
+        """Pop the next track of the playlist, shuffling a new round if empty"""
+        if not self.playlist:
+            self.playlist = self.tracks()
+            self.random.shuffle(self.playlist)
+            ### Don't play the same track twice in a row across rounds
+            if len(self.playlist) > 1 and self.playlist[-1] == self.last:
+                self.playlist.insert(0, self.playlist.pop())
+        if not self.playlist:
+            return None
+        self.last = self.playlist.pop()
+        return self.last
+
+    def prefetch(self):
+        """Start reading the next track, unless one is ready or being read"""
+        with self.lock:
+            if self.ready is not None:
+                return
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.fetch, name="music")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def fetch(self):
+        """Read tracks until one is valid, on the worker thread"""
+        for i in range(len(self.tracks()) + 1):
+            with self.lock:
+                name = self.next_name()
+            if name is None:
+                return
+            try:
+                with open(os.path.join(self.path, name), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = b""
+            with self.lock:
+                if is_module(data):
+                    self.ready = (name, data)
+                    return
+                print("Couldnt load " + name)
+                self.bad.add(name)
+
+    def wait(self, timeout=None):
+        """Block until the worker is done, for tests and shutdown"""
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def play(self):
+        """Switch to the prefetched track, or to the next one when it's read"""
+        with self.lock:
+            ready, self.ready = self.ready, None
+        if ready is None:
+            self.waiting = True
+            self.prefetch()
+            return False
+        self.waiting = False
+        name, data = ready
+        try:
+            pygame.mixer.music.load(io.BytesIO(data), os.path.splitext(name)[1][1:])
+            pygame.mixer.music.play(-1)  # infinite loop of music
+            self.current = name
+        except Exception:
+            print("Couldnt load " + name)
+            with self.lock:
+                self.bad.add(name)
+            self.waiting = True
+        self.prefetch()
+        return True
+
+    def update(self):
+        """Start the music the last play() asked for, once it has been read"""
+        if self.waiting and self.ready is not None:
+            self.play()
@@ -0,0 +1,616 @@
+"""Networked multiplayer in lockstep.
+
+Every client runs the whole match itself, from the same random seed, and
+only the players' actions travel over the network.  The actions for tick t
+are sent INPUT_DELAY ticks ahead of time, and a client simulates tick t once
+it has the actions of every player for it, so all clients do exactly the
+same thing in the same order.  Every HASH_INTERVAL ticks each client sends a
+hash of its state, and the server reports a desync if they differ.
+
+The server is a plain relay: it hands out the seed and the player numbers
+and forwards every message to the other clients.  Start one with
+
+    python netplay.py server --players 2
+
+and join it with ``python eit.py --connect HOST:PORT``, or with a headless
+bot that presses random keys:
+
+    python netplay.py bot --connect HOST:PORT --name Bot1
+
+Messages are a 16-bit little endian length followed by a one byte type and
+the payload.  An INPUT message is 8 bytes plus one byte per action.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import struct
+import sys
+
+import pygame
+from pygame.locals import *
+
+from layout import grid
+from playerfield import ACTIONS, PlayerField
+
+PORT = 7777
+### Game time per tick, in ms
+TICK_TIME = 10
+### Ticks between taking an action and doing it
+INPUT_DELAY = 4
+HASH_INTERVAL = 50
+
+HELLO = b"H"
+START = b"S"
+INPUT = b"I"
+HASH = b"C"
+DESYNC = b"D"
+
+FRAME = struct.Struct("<H")
+START_HEADER = struct.Struct("<IBBB")
+INPUT_HEADER = struct.Struct("<IB")
+HASH_BODY = struct.Struct("<IBQ")
+DESYNC_BODY = struct.Struct("<I")
+ZOBRIST = struct.Struct("<Q")
+
+
+class NetplayError(Exception):
+    pass
+
+
+def write_message(writer, kind, payload=b""):
+    writer.write(FRAME.pack(len(payload) + 1) + kind + payload)
+
+
+async def read_message(reader):
+    """Return (kind, payload) of the next message, or (None, b"") at EOF"""
+    try:
+        (n,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+        data = await reader.readexactly(n)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None, b""
+    return data[:1], data[1:]
+
+
+def encode_actions(actions):
+    return bytes(ACTIONS.index(a) for a in actions)
+
+
+def decode_actions(data):
+    for c in data:
+        if c >= len(ACTIONS):
+            raise NetplayError("unknown action %d" % c)
+    return [ACTIONS[c] for c in data]
+
+
+def state_hash(players):
+    """64-bit hash of everything in the match that the players can affect"""
+    h = hashlib.blake2b(digest_size=8)
+    for p in players:
+        h.update(
+            repr(
+                (
+                    p.score,
+                    p.level,
+                    p.lines,
+                    p.gameover,
+                    p.antidotes,
+                    p.packettime,
+                    p.downtime,
+                    p.target.id if p.target is not None else None,
+                    len(p.lines_to_add),
+                )
+            ).encode()
+        )
+        ### The parts, the current block and the effects
+        h.update(ZOBRIST.pack(p.field.zobrist))
+    return struct.unpack("<Q", h.digest())[0]
+
+
+class Match:
+    """A match simulated in fixed ticks from a seed.
+
+    Creates the players like Main.start_new_game, in dm.players.  The game
+    takes all its random numbers from the random module, so the match swaps
+    in its own random state while it runs.  Several matches can then run in
+    one process.
+    """
+
+    def __init__(self, dm, names, seed):
+        self.dm = dm
+        outer = random.getstate()
+        random.seed(seed)
+        dm.players = []
+        dm.gameover_players = []
+        for i, (name, (px, py)) in enumerate(zip(names, grid(len(names))[1])):
+            dm.players.append(PlayerField(dm, i, name, px, py))
+        self.players = list(dm.players)
+        for player in self.players:
+            player.next_target()
+            ### A rollback could undo it, the session reports game overs
+            player.post_gameover = False
+        self.random_state = random.getstate()
+        random.setstate(outer)
+        self.tick = 0
+
+    def step(self, inputs):
+        """Simulate one tick. inputs has a list of actions per player"""
+        outer = random.getstate()
+        random.setstate(self.random_state)
+        for player, actions in zip(self.players, inputs):
+            player.step(actions, TICK_TIME)
+        self.random_state = random.getstate()
+        random.setstate(outer)
+        self.tick += 1
+
+    def over(self):
+        for player in self.players:
+            if not player.gameover:
+                return False
+        return True
+
+    def hash(self):
+        return state_hash(self.players)
+
+
+class Lockstep:
+    """The inputs of every player, released one tick at a time.
+
+    Inputs for the first delay ticks are empty, then tick t waits for the
+    actions every player sent for t.
+    """
+
+    def __init__(self, players, local, delay=INPUT_DELAY):
+        self.players = players
+        self.local = local
+        self.delay = delay
+        self.tick = 0
+        self.sent = delay
+        self.inputs = {}
+        self.hashes = {}
+        self.gameovers = {}
+        self.reported = [False] * players
+
+    def schedule(self, actions):
+        """Store the local actions for the next free tick and return it,
+        or None if the local input is already delay ticks ahead"""
+        if self.sent > self.tick + self.delay:
+            return None
+        tick = self.sent
+        self.receive(tick, self.local, actions)
+        self.sent += 1
+        return tick
+
+    def receive(self, tick, player, actions):
+        if tick < self.tick:
+            raise NetplayError("input for tick %d arrived late" % tick)
+        self.inputs.setdefault(tick, [None] * self.players)[player] = actions
+
+    def ready(self):
+        if self.tick < self.delay:
+            return True
+        inputs = self.inputs.get(self.tick)
+        return inputs is not None and None not in inputs
+
+    def advance(self):
+        """Return the inputs of the current tick and move to the next"""
+        if self.tick < self.delay:
+            inputs = [[]] * self.players
+        else:
+            inputs = self.inputs.pop(self.tick)
+        self.tick += 1
+        return inputs
+
+    def run(self, match):
+        """Simulate the current tick of match"""
+        match.step(self.advance())
+        self.record(match)
+
+    def record(self, match):
+        if match.tick % HASH_INTERVAL == 0:
+            self.hashes[match.tick] = match.hash()
+        self.gameovers[match.tick] = [p.gameover for p in match.players]
+
+    def final(self):
+        """The last tick whose state can not change any more"""
+        return self.tick
+
+    def settle(self, match):
+        """Correct match for all the inputs received so far"""
+        pass
+
+    def take_hashes(self):
+        """Return [(tick, hash), ...] of the final states not returned yet"""
+        ticks = sorted(t for t in self.hashes if t <= self.final())
+        return [(t, self.hashes.pop(t)) for t in ticks]
+
+    def take_gameovers(self, match):
+        """Return the players whose game over is final, once each"""
+        done = []
+        for t in sorted(t for t in self.gameovers if t <= self.final()):
+            now = self.gameovers.pop(t)
+            for p, over, before in zip(match.players, now, self.reported):
+                if over and not before:
+                    done.append(p)
+            self.reported = now
+        return done
+
+
+class RelayServer:
+    """Hands out seat numbers and the seed, then relays inputs and hashes"""
+
+    def __init__(self, players, seed=None, delay=INPUT_DELAY):
+        self.players = players
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**32)
+        self.seed = seed
+        self.delay = delay
+        self.writers = []
+        self.names = []
+        self.hashes = {}
+        self.desync = None
+        self.finished = None
+        self.connections = 0
+
+    async def start(self, host="127.0.0.1", port=PORT):
+        """Start listening, return the port"""
+        self.finished = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        self.server.close()
+        for writer in self.writers:
+            writer.close()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            await self.relay(reader, writer)
+        finally:
+            writer.close()
+            self.connections -= 1
+            if self.connections == 0 and self.writers:
+                self.finished.set()
+
+    async def relay(self, reader, writer):
+        kind, payload = await read_message(reader)
+        if kind != HELLO or len(self.writers) >= self.players:
+            writer.close()
+            return
+        seat = len(self.writers)
+        self.writers.append(writer)
+        self.names.append(payload.decode("utf-8", "replace"))
+        if len(self.writers) == self.players:
+            names = "\n".join(self.names).encode("utf-8")
+            for i, w in enumerate(self.writers):
+                header = START_HEADER.pack(self.seed, self.delay, self.players, i)
+                write_message(w, START, header + names)
+
+        ### A dropped client, or one that sends a bad message, ends the
+        ### match for everyone
+        try:
+            while await self.forward(seat, reader, writer):
+                pass
+        finally:
+            self.close()
+
+    async def forward(self, seat, reader, writer):
+        """Pass on the next message of the client in seat, False if it has to
+        be dropped"""
+        kind, payload = await read_message(reader)
+        if kind is None:
+            return False
+        try:
+            if kind == INPUT:
+                tick, player = INPUT_HEADER.unpack_from(payload)
+                if player != seat:
+                    return False
+                for w in self.writers:
+                    if w is not writer:
+                        write_message(w, INPUT, payload)
+            elif kind == HASH:
+                tick, player, value = HASH_BODY.unpack(payload)
+                if player != seat:
+                    return False
+                self.check_hash(tick, player, value)
+        except (struct.error, ValueError):
+            return False
+        try:
+            for w in self.writers:
+                await w.drain()
+        except ConnectionError:
+            return False
+        return True
+
+    def check_hash(self, tick, player, value):
+        hashes = self.hashes.setdefault(tick, {})
+        hashes[player] = value
+        if len(hashes) < self.players:
+            return
+        del self.hashes[tick]
+        if len(set(hashes.values())) > 1 and self.desync is None:
+            self.desync = tick
+            for w in self.writers:
+                write_message(w, DESYNC, DESYNC_BODY.pack(tick))
+
+
+class Client:
+    """One player's connection to a RelayServer"""
+
+    def __init__(self, name, session=Lockstep):
+        self.name = name
+        self.session_class = session
+        self.desync = None
+        self.closed = False
+        self.writer = None
+        self.task = None
+        ### Why the connection was closed, None if the server closed it
+        self.error = None
+
+    async def connect(self, host, port):
+        """Connect and wait until every player has joined"""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        write_message(self.writer, HELLO, self.name.encode("utf-8"))
+        kind, payload = await read_message(self.reader)
+        if kind != START:
+            raise NetplayError("server closed the connection")
+        seed, delay, players, index = START_HEADER.unpack_from(payload)
+        self.seed = seed
+        self.index = index
+        self.names = payload[START_HEADER.size :].decode("utf-8").split("\n")
+        self.session = self.session_class(players, index, delay)
+        self.changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self.read())
+
+    def close(self):
+        self.closed = True
+        if self.task is not None:
+            self.task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+    async def read(self):
+        try:
+            while True:
+                kind, payload = await read_message(self.reader)
+                if kind is None:
+                    break
+                elif kind == INPUT:
+                    tick, player = INPUT_HEADER.unpack_from(payload)
+                    if player >= self.session.players:
+                        raise NetplayError("input for player %d" % player)
+                    actions = decode_actions(payload[INPUT_HEADER.size :])
+                    self.session.receive(tick, player, actions)
+                elif kind == DESYNC:
+                    (self.desync,) = DESYNC_BODY.unpack(payload)
+                self.changed.set()
+        except Exception as e:
+            ### A bad message ends the match like a lost connection
+            self.error = e
+        self.closed = True
+        self.changed.set()
+
+    def lost(self):
+        """Tell why the connection was closed"""
+        if self.error is not None:
+            return str(self.error)
+        return "the server closed the connection"
+
+    def send_input(self, actions):
+        """Send the local actions, if the lockstep takes more input now.
+        Returns False if actions has to wait for a later tick."""
+        tick = self.session.schedule(actions)
+        if tick is None:
+            return False
+        payload = INPUT_HEADER.pack(tick, self.index) + encode_actions(actions)
+        write_message(self.writer, INPUT, payload)
+        return True
+
+    def send_hash(self, tick, value):
+        write_message(self.writer, HASH, HASH_BODY.pack(tick, self.index, value))
+
+    async def wait(self):
+        """Wait until the inputs of the current tick are all in"""
+        await self.writer.drain()
+        while not self.session.ready():
+            if self.closed:
+                raise NetplayError("connection to the server lost: %s" % self.lost())
+            self.changed.clear()
+            await self.changed.wait()
+
+
+def run_tick(client, match):
+    """Simulate the next tick, if the session lets it. Returns True if it did"""
+    session = client.session
+    if not session.ready():
+        return False
+    session.run(match)
+    for tick, value in session.take_hashes():
+        client.send_hash(tick, value)
+    return True
+
+
+class NetGame:
+    """Drives a networked match from the game loop in eit.Main.
+
+    Owns an asyncio event loop that only runs while NetGame is called, so the
+    game stays single threaded.
+    """
+
+    def __init__(self, host, port, session=Lockstep):
+        self.host = host
+        self.port = port
+        self.session = session
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self.joining = None
+        self.match = None
+        self.pending = []
+        self.time = 0
+        self.desync = None
+
+    def join(self, name):
+        """Connect as name, poll() until the other players have joined"""
+        self.close()
+        self.client = Client(name, self.session)
+        self.joining = self.loop.create_task(self.client.connect(self.host, self.port))
+
+    def poll(self, dm):
+        """Let the handshake go on without blocking.  Returns the Match, with
+        its players in dm.players, once every player has joined, else None.
+        Raises the error if the connection failed."""
+        self.loop.run_until_complete(asyncio.sleep(0))
+        if not self.joining.done():
+            return None
+        joining, self.joining = self.joining, None
+        joining.result()
+        self.match = Match(dm, self.client.names, self.client.seed)
+        self.pending = []
+        self.time = 0
+        self.desync = None
+        return self.match
+
+    def start(self, dm, name):
+        """Join as name and wait for the other players, then set up dm.players"""
+        self.join(name)
+        self.loop.run_until_complete(asyncio.wait([self.joining]))
+        return self.poll(dm)
+
+    def close(self):
+        if self.joining is not None:
+            self.joining.cancel()
+            self.joining = None
+        if self.client is not None:
+            self.client.close()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.client = None
+
+    def update(self, events, frametime):
+        """Take the local player's key presses and run the ticks that are due"""
+        if self.client.closed:
+            return
+        local = self.match.players[self.client.index]
+        self.pending += local.actions(events)
+        self.time += frametime
+        self.loop.run_until_complete(asyncio.sleep(0))
+        while self.time >= TICK_TIME:
+            if self.client.send_input(self.pending):
+                self.pending = []
+            if not run_tick(self.client, self.match):
+                ### The game waits for the slowest player
+                self.time = min(self.time, TICK_TIME)
+                break
+            self.time -= TICK_TIME
+        for player in self.client.session.take_gameovers(self.match):
+            pygame.event.post(
+                pygame.event.Event(USEREVENT, utype="GameOver", player=player)
+            )
+        self.loop.run_until_complete(self.client.writer.drain())
+        if self.client.desync is not None and self.desync is None:
+            self.desync = self.client.desync
+            print("netplay: desync detected at tick", self.desync)
+
+
+async def play_bot(host, port, name, ticks, dm=None, session=Lockstep):
+    """Play up to ticks ticks with random actions, return the final Match"""
+    if dm is None:
+        from datamanager import HeadlessDataManager
+
+        dm = HeadlessDataManager()
+    client = Client(name, session)
+    await client.connect(host, port)
+    bot = random.Random(name)
+    match = Match(dm, client.names, client.seed)
+    session = client.session
+    over = 0
+    try:
+        while match.tick < ticks and over < len(match.players):
+            actions = []
+            if bot.random() < 0.2:
+                actions.append(bot.choice(ACTIONS[:6]))
+            client.send_input(actions)
+            await client.wait()
+            run_tick(client, match)
+            over += len(session.take_gameovers(match))
+        ### A rollback session may have run ahead of the other players' inputs
+        while over < len(match.players):
+            session.settle(match)
+            for tick, value in session.take_hashes():
+                client.send_hash(tick, value)
+            over += len(session.take_gameovers(match))
+            if session.final() >= match.tick or client.closed:
+                break
+            client.changed.clear()
+            await client.changed.wait()
+        await client.writer.drain()
+        ### Let the last hashes reach the server before hanging up
+        for i in range(20):
+            await asyncio.sleep(0.01)
+            if client.desync is not None or client.closed:
+                break
+    finally:
+        client.close()
+    match.desync = client.desync
+    return match
+
+
+async def serve(host, port, players, seed, delay):
+    server = RelayServer(players, seed, delay)
+    port = await server.start(host, port)
+    print("netplay: listening on port", port, flush=True)
+    await server.finished.wait()
+    if server.desync is not None:
+        print("netplay: desync at tick", server.desync, flush=True)
+        return 1
+    return 0
+
+
+def parse_address(s):
+    host, _, port = s.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="netplay.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("server", help="relay a match between clients")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--players", type=int, default=2)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--delay", type=int, default=INPUT_DELAY)
+    p = sub.add_parser("bot", help="join a match with random actions")
+    p.add_argument("--connect", default="127.0.0.1:%d" % PORT)
+    p.add_argument("--name", default="Bot")
+    p.add_argument("--ticks", type=int, default=3000)
+    p.add_argument("--rollback", action="store_true", help="don't wait for inputs")
+    options = parser.parse_args(args)
+
+    if options.command == "server":
+        return asyncio.run(
+            serve(
+                options.host,
+                options.port,
+                options.players,
+                options.seed,
+                options.delay,
+            )
+        )
+    host, port = parse_address(options.connect)
+    session = Lockstep
+    if options.rollback:
+        from rollback import Rollback as session
+    match = asyncio.run(
+        play_bot(host, port, options.name, options.ticks, session=session)
+    )
+    print("netplay: tick", match.tick, "hash %016x" % match.hash(), flush=True)
+    if match.desync is not None:
+        print("netplay: desync at tick", match.desync, flush=True)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -5,19 +5,245 @@ future versions of pgu!</p>
 """
 print('pgu.algo','This module is alpha, and is subject to change.')
 
-#def dist(a,b):
-#    return abs(a[0]-b[0]) + abs(a[1]-b[1])
-    
-class node:
-    def __init__(self,prev,pos,dest):
-        self.prev,self.pos,self.dest = prev,pos,dest
-        if self.prev == None: self.g = 0
-        else: self.g = self.prev.g + 1
-        self.h = dist(pos,dest)
-        self.f = self.g+self.h
+import heapq
 
+SQRT2 = 2**0.5
 
-def astar(start,end,layer,_dist):
+def manhattan(a,b):
+    return abs(a[0]-b[0]) + abs(a[1]-b[1])
+
+def octile(a,b):
+    dx,dy = abs(a[0]-b[0]),abs(a[1]-b[1])
+    return max(dx,dy) + (SQRT2-1)*min(dx,dy)
+
+class GridSearch:
+    """A reusable A* search context for one grid.
+    
+    <p>The grid is copied into flat arrays once, repeated searches only reset
+    what they touch, by stamping cells with a search number.</p>
+    
+    <pre>GridSearch(layer,dist=None,diagonal=False,jump=False)</pre>
+    
+    <dl>
+    <dt>layer<dd>a grid where zero cells are open and non-zero cells are walls
+    <dt>dist<dd>a distance function dist(a,b) used as the heuristic, defaults to manhattan, or octile with diagonal
+    <dt>diagonal<dd>also move diagonally, at a cost of sqrt(2), but never around a corner of a wall
+    <dt>jump<dd>use jump point search, only for diagonal searches with the default dist.  Finds paths of the same length, much faster on open maps
+    </dl>
+    
+    <strong>Example</strong>
+    <code>
+    s = GridSearch(layer,diagonal=True,jump=True)
+    path = s.find((1,1),(20,14))
+    s.set(5,5,1)
+    paths = s.find_many([((1,1),(20,14)),((3,3),(1,1))])
+    </code>
+    """
+    def __init__(self,layer,dist=None,diagonal=False,jump=False):
+        if jump and (not diagonal or dist is not None):
+            raise ValueError('jump point search needs diagonal=True and the default dist')
+        self.diagonal = diagonal
+        self.jump = jump
+        if dist is None: dist = octile if diagonal else manhattan
+        self.dist = dist
+        self.load(layer)
+    
+    def load(self,layer):
+        """Read the walls of layer again, after it has been changed.
+        
+        <pre>GridSearch.load(layer)</pre>
+        """
+        self.w,self.h = w,h = len(layer[0]),len(layer)
+        #one cell of wall all around, so neighbours never need bounds checks
+        self.pw = pw = w+2
+        n = pw*(h+2)
+        self.walls = walls = bytearray(b'\x01')*n
+        for y,row in enumerate(layer):
+            i = (y+1)*pw+1
+            for x in range(w):
+                if not row[x]: walls[i+x] = 0
+        self.g = [0]*n
+        self.parent = [-1]*n
+        self.seen = [0]*n
+        self.closed = [0]*n
+        self.stamp = 0
+        
+        self.steps = [(-pw,1),(1,1),(pw,1),(-1,1)]
+        if self.diagonal:
+            #each diagonal step with the two straight steps it must not cut
+            self.dsteps = [(-pw+1,-pw,1),(pw+1,pw,1),(pw-1,pw,-1),(-pw-1,-pw,-1)]
+    
+    def set(self,x,y,v):
+        """Change one cell, v is non-zero for a wall.
+        
+        <pre>GridSearch.set(x,y,v)</pre>
+        """
+        self.walls[(y+1)*self.pw+x+1] = 1 if v else 0
+    
+    def _index(self,pos):
+        x,y = pos
+        if x < 0 or y < 0 or x >= self.w or y >= self.h: return None
+        i = (y+1)*self.pw+x+1
+        if self.walls[i]: return None
+        return i
+    
+    def _pos(self,i):
+        return i%self.pw-1,i//self.pw-1
+    
+    def find(self,start,end):
+        """Find a path from start to end.
+        
+        <pre>GridSearch.find(start,end): return [list of positions]</pre>
+        
+        <p>Like astar, the path leaves out start and ends with end.  It is empty
+        if there is no path.</p>
+        """
+        si,ei = self._index(start),self._index(end)
+        if si is None or ei is None: return []
+        
+        self.stamp += 1
+        stamp = self.stamp
+        g,parent,seen,closed = self.g,self.parent,self.seen,self.closed
+        dist = self.dist
+        pos = self._pos
+        end = tuple(end)
+        
+        g[si] = 0
+        parent[si] = -1
+        seen[si] = stamp
+        h = dist(tuple(start),end)
+        heap = [(h,h,si)]
+        push,pop = heapq.heappush,heapq.heappop
+        if self.jump: neighbours = self._jump_neighbours
+        else: neighbours = self._neighbours
+        
+        while heap:
+            f,h,i = pop(heap)
+            if closed[i] == stamp: continue
+            closed[i] = stamp
+            if i == ei: return self._path(si,ei)
+            gi = g[i]
+            for j,cost in neighbours(i,ei):
+                ng = gi+cost
+                if seen[j] == stamp and ng >= g[j]: continue
+                seen[j] = stamp
+                closed[j] = 0
+                g[j] = ng
+                parent[j] = i
+                h = dist(pos(j),end)
+                push(heap,(ng+h,h,j))
+        return []
+    
+    def find_many(self,pairs):
+        """Find a path for each (start,end) pair.
+        
+        <pre>GridSearch.find_many(pairs): return [list of paths]</pre>
+        """
+        return [self.find(start,end) for start,end in pairs]
+    
+    def _neighbours(self,i,ei):
+        walls = self.walls
+        r = [(i+d,c) for d,c in self.steps if not walls[i+d]]
+        if self.diagonal:
+            for d,a,b in self.dsteps:
+                if not walls[i+d] and not walls[i+a] and not walls[i+b]:
+                    r.append((i+d,SQRT2))
+        return r
+    
+    def _path(self,si,ei):
+        parent,pos = self.parent,self._pos
+        path = []
+        i = ei
+        while i != si:
+            p = parent[i]
+            x,y = pos(i)
+            if self.jump:
+                #fill in the straight run between two jump points
+                px,py = pos(p)
+                dx,dy = _sign(px-x),_sign(py-y)
+                while (x,y) != (px,py):
+                    path.append((x,y))
+                    x,y = x+dx,y+dy
+            else:
+                path.append((x,y))
+            i = p
+        path.reverse()
+        return path
+    
+    # jump point search, after Harabor and Grastien, in the variant that never
+    # cuts a corner, so it finds the same path lengths as the plain search
+    
+    def _jump_neighbours(self,i,ei):
+        walls,pw = self.walls,self.pw
+        p = self.parent[i]
+        if p == -1:
+            dirs = [(0,-1),(1,0),(0,1),(-1,0),(1,-1),(1,1),(-1,1),(-1,-1)]
+        else:
+            x,y = self._pos(i)
+            px,py = self._pos(p)
+            dx,dy = _sign(x-px),_sign(y-py)
+            dirs = []
+            if dx and dy:
+                v,hz = not walls[i+dy*pw],not walls[i+dx]
+                if v: dirs.append((0,dy))
+                if hz: dirs.append((dx,0))
+                if v and hz: dirs.append((dx,dy))
+            elif dx:
+                nxt = not walls[i+dx]
+                up,down = not walls[i+pw],not walls[i-pw]
+                if nxt:
+                    dirs.append((dx,0))
+                    if up: dirs.append((dx,1))
+                    if down: dirs.append((dx,-1))
+                if up: dirs.append((0,1))
+                if down: dirs.append((0,-1))
+            else:
+                nxt = not walls[i+dy*pw]
+                right,left = not walls[i+1],not walls[i-1]
+                if nxt:
+                    dirs.append((0,dy))
+                    if right: dirs.append((1,dy))
+                    if left: dirs.append((-1,dy))
+                if right: dirs.append((1,0))
+                if left: dirs.append((-1,0))
+        
+        r = []
+        for dx,dy in dirs:
+            if dx and dy:
+                if walls[i+dx] or walls[i+dy*pw]: continue
+                j = self._jump_diagonal(i+dx+dy*pw,dx,dy,ei)
+            else:
+                j = self._jump_straight(i+dx+dy*pw,dx+dy*pw,dx,dy,ei)
+            if j is None: continue
+            n = max(abs(j%pw-i%pw),abs(j//pw-i//pw))
+            r.append((j,n*SQRT2 if dx and dy else n))
+        return r
+    
+    def _jump_straight(self,i,d,dx,dy,ei):
+        walls,pw = self.walls,self.pw
+        while 1:
+            if walls[i]: return None
+            if i == ei: return i
+            if dx:
+                if (not walls[i-pw] and walls[i-dx-pw]) or (not walls[i+pw] and walls[i-dx+pw]): return i
+            else:
+                if (not walls[i-1] and walls[i-1-dy*pw]) or (not walls[i+1] and walls[i+1-dy*pw]): return i
+            i += d
+    
+    def _jump_diagonal(self,i,dx,dy,ei):
+        walls,pw = self.walls,self.pw
+        while 1:
+            if walls[i]: return None
+            if i == ei: return i
+            if self._jump_straight(i+dx,dx,dx,0,ei) is not None: return i
+            if self._jump_straight(i+dy*pw,dy*pw,0,dy,ei) is not None: return i
+            if walls[i+dx] or walls[i+dy*pw]: return None
+            i += dx+dy*pw
+
+def _sign(v):
+    return (v > 0) - (v < 0)
+
+def astar(start,end,layer,dist):
     """uses the a* algorithm to find a path
     
     <pre>astar(start,end,layer,dist): return [list of positions]</pre>
@@ -30,56 +256,10 @@ def astar(start,end,layer,_dist):
     </dl>
     
     <p>returns a list of positions from start to end</p>
+    
+    <p>For many searches on the same layer, use a GridSearch.</p>
     """
-    global dist
-    dist = _dist
-    if layer[start[1]][start[0]]: return [] #start is blocked
-    if layer[end[1]][end[0]]: return [] #end is blocked
-    w,h = len(layer[0]),len(layer)
-    if start[0] < 0 or start[1] < 0 or start[0] >= w or start[1] >= h: return [] #start outside of layer
-    if end[0] < 0 or end[1] < 0 or end[0] >= w or end[1] >= h: return [] #end outside of layer
-
-    opens = []
-    open = {}
-    closed = {}
-    cur = node(None,start,end)
-    open[cur.pos] = cur
-    opens.append(cur)
-    while len(open):
-        cur = opens.pop(0)
-        if cur.pos not in open: continue
-        del open[cur.pos]
-        closed[cur.pos] = cur
-        if cur.pos == end: break
-        for dx,dy in [(0,-1),(1,0),(0,1),(-1,0)]:#(-1,-1),(1,-1),(-1,1),(1,1)]:
-            x,y = pos = cur.pos[0]+dx,cur.pos[1]+dy
-            if layer[y][x]: continue
-            #check for blocks of diagonals
-            if layer[cur.pos[1]+dy][cur.pos[0]]: continue
-            if layer[cur.pos[1]][cur.pos[0]+dx]: continue
-            new = node(cur,pos,end)
-            if pos in open and new.f >= open[pos].f: continue
-            if pos in closed and new.f >= closed[pos].f: continue
-            if pos in open: del open[pos]
-            if pos in closed: del closed[pos]
-            open[pos] = new
-            lo = 0
-            hi = len(opens)
-            while lo < hi:
-                mid = (lo+hi)/2
-                if new.f < opens[mid].f: hi = mid
-                else: lo = mid + 1
-            opens.insert(lo,new)
-    
-    if cur.pos != end: 
-        return []
-                    
-    path = []
-    while cur.prev != None:
-        path.append(cur.pos)
-        cur = cur.prev
-    path.reverse()
-    return path
+    return GridSearch(layer,dist).find(start,end)
     
 
 def getline(a,b):
@@ -110,13 +290,13 @@ def getline(a,b):
     if dx >= dy:
         xi1,yi2 = 0,0
         d = dx
-        n = dx/2
+        n = dx//2
         a = dy
         p = dx
     else:
         xi2,yi1 = 0,0
         d = dy
-        n = dy/2
+        n = dy//2
         a = dx
         p = dy
         
@@ -0,0 +1,61 @@
+"""A bounded dict-like cache, used by pgu.gui and pgu.fonts.
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A dict-like cache that keeps at most size entries.
+
+    <p>When full, the least recently used entry is dropped.</p>
+
+    <pre>LRUCache(size)</pre>
+
+    <strong>Example</strong>
+    <code>
+    c = LRUCache(2)
+    c['a'] = 1
+    c['b'] = 2
+    c['a']
+    c['c'] = 3 # drops 'b'
+    </code>
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        v = self.data[key]
+        self.data.move_to_end(key)
+        return v
+
+    def __setitem__(self, key, v):
+        self.data[key] = v
+        self.data.move_to_end(key)
+        while len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Return the cached value, or default. Counts as a hit or a miss.
+
+        <pre>LRUCache.get(key,default=None)</pre>
+        """
+        try:
+            v = self[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return v
+
+    def clear(self):
+        self.data.clear()
@@ -9,23 +9,75 @@ print('pgu.fonts','This module is alpha, and is subject to change.')
 import pygame
 from pygame.locals import *
 
+from pgu.cache import LRUCache
+
+def _render(cache,key,size,background,draw,into=None):
+    """Return the cached render of key, or draw a new one.
+    
+    <p>Every cached render gets a surface of its own, a surface that has been
+    returned never changes, even after it drops out of the cache.</p>
+    
+    <p>When into is given the cache is not used, the text is drawn into that
+    surface if it has the right size and format, or into a new surface if it
+    has not.  Either way the caller owns the result.  A surface from the
+    cache is never drawn on, passing one as into gets a new surface.</p>
+    """
+    alpha = background == None
+    if into is None:
+        s = cache.get(key)
+        if s is not None: return s
+    if (into is not None and into.get_size() == tuple(size)
+            and bool(into.get_flags() & SRCALPHA) == alpha
+            and not any(into is v for v in cache.data.values())):
+        s = into
+    else:
+        s = pygame.Surface(size)
+        if alpha: s = s.convert_alpha()
+        else: s = s.convert()
+    if alpha: s.fill((0,0,0,0))
+    else: s.fill(background)
+    draw(s)
+    if into is None: cache[key] = s
+    return s
+
+def _recolor(img,color):
+    """Return a copy of img, with every pixel more than half opaque set to color."""
+    s = pygame.Surface(img.get_size(),SRCALPHA,32)
+    s.blit(img,(0,0))
+    a = pygame.surfarray.pixels_alpha(s)
+    mask = a > 128
+    a[mask] = color[3]
+    del a
+    rgb = pygame.surfarray.pixels3d(s)
+    rgb[mask] = color[:3]
+    del rgb
+    return s
+
 class TileFont:
     """Creates an instance of the TileFont class.  Interface compatible with pygame.Font
     
     <p>TileFonts are fonts that are stored in a tiled image.  Where the image opaque, it assumed that the font is visible.  Font color is changed automatically, so it does not work with
     fonts with stylized coloring.</p>
     
-    <pre>TileFont(fname,size,hints,scale=None,sensitive=False)</pre>
+    <pre>TileFont(fname,size,hints,scale=None,sensitive=False,cache_size=64)</pre>
     
     <dl>
     <dt>size <dd>the dimensions of the characters
     <dt>hints <dd>a string of hints "abcdefg..."
     <dt>scale <dd>size to scale font to
     <dt>sensitive <dd>case sensitivity
+    <dt>cache_size <dd>number of rendered strings to keep
     </dl>
+    
+    <p>The surfaces returned by render are shared between the calls that
+    render the same string, blit them, do not draw on them.  Text that changes
+    every frame, like a score ticker, can pass the surface it got last time as
+    into, render(text,into=s) then draws into s instead of allocating a new
+    surface whenever the size stays the same.  That surface is never cached,
+    it belongs to the caller.</p>
     """
 
-    def __init__(self,fname,size,hints,scale=None,sensitive=False):
+    def __init__(self,fname,size,hints,scale=None,sensitive=False,cache_size=64):
         
         self.image = pygame.image.load(fname)
         
@@ -36,6 +88,7 @@ class TileFont:
         self.scale = scale
         
         self.chars = {}
+        self.rects = {}
         x,y = 0,0
         self.sensitive = sensitive
         if not self.sensitive: hints = hints.lower()
@@ -43,88 +96,87 @@ class TileFont:
             if c not in ('\r','\n','\t'):
                 img = self.image.subsurface(x,y,tw,th)
                 self.chars[c] = img
+                self.rects[c] = pygame.Rect(x,y,tw,th)
                 x += tw
                 if x >= w: x,y = 0,y+th
                 
         self.colors = {}
+        self.cache = LRUCache(cache_size)
                 
     def size(self,text):
         tw,th = self.scale
         return len(text)*tw,th
+    
+    def _glyphs(self,color):
+        """Return the glyphs in color, at the current scale."""
+        scale = tuple(self.scale)
+        key = (color,scale)
+        if key not in self.colors:
+            sheet = _recolor(self.image,color)
+            glyphs = {}
+            for c,r in self.rects.items():
+                img = sheet.subsurface(r)
+                if scale != tuple(self._size): img = pygame.transform.scale(img,scale)
+                glyphs[c] = img
+            self.colors[key] = glyphs
+        return self.colors[key]
         
-    def render(self,text,antialias=0,color=(255,255,255),background=None):
-        size = self.size(text)
-        scale = self.scale
-        tw,th = self._size
-        if background == None:
-            s = pygame.Surface(size).convert_alpha()
-            s.fill((0,0,0,0))
-        else:
-            s = pygame.Surface(size).convert()
-            s.fill(background)
-            
+    def render(self,text,antialias=0,color=(255,255,255),background=None,into=None):
         if not self.sensitive: text = text.lower()
+        color = tuple(pygame.Color(color))
+        if background != None: background = tuple(pygame.Color(background))
+        scale = tuple(self.scale)
         
-        if color not in self.colors: self.colors[color] = {}
-        colored = self.colors[color]
+        def draw(s):
+            glyphs = self._glyphs(color)
+            x = 0
+            for c in text:
+                if c in glyphs: s.blit(glyphs[c],(x,0))
+                x += scale[0]
         
-        x,y = 0,0
-        for c in text:
-            if c in self.chars:
-                if c not in colored:
-                    img = self.chars[c].convert_alpha()
-                    for yy in range(0,th):
-                        for xx in range(0,tw):
-                            r,g,b,a = img.get_at((xx,yy))
-                            if a > 128:
-                                img.set_at((xx,yy),color)
-                    colored[c] = img
-                img = colored[c]
-                if scale != (tw,th): img = pygame.transform.scale(img,scale)
-                s.blit(img,(x,y))
-            x += scale[0]
-        return s
+        key = (text,color,scale,background)
+        return _render(self.cache,key,self.size(text),background,draw,into)
         
         
 class BorderFont: 
     """a decorator for normal fonts, adds a border. Interface compatible with pygame.Font.
     
-    <pre>BorderFont(font,size=1,color=(0,0,0))</pre>
+    <pre>BorderFont(font,size=1,color=(0,0,0),cache_size=64)</pre>
     
     <dl>
     <dt>size <dd>width of border; defaults 0
     <dt>color <dd>color of border; default (0,0,0)
+    <dt>cache_size <dd>number of rendered strings to keep
     </dl>
+    
+    <p>Rendered strings are cached and shared the same way as with TileFont,
+    and render takes into the same way too.</p>
     """
-    def __init__(self,font,size=1,color=(0,0,0)):
+    def __init__(self,font,size=1,color=(0,0,0),cache_size=64):
         
         self.font = font
         self._size = size
         self.color = color
+        self.cache = LRUCache(cache_size)
                 
     def size(self,text):
         w,h = self.font.size(text)
         s = self._size
         return w+s*2,h+s*2
         
-    def render(self,text,antialias=0,color=(255,255,255),background=None):
-        size = self.size(text)
+    def render(self,text,antialias=0,color=(255,255,255),background=None,into=None):
+        color = tuple(pygame.Color(color))
+        if background != None: background = tuple(pygame.Color(background))
+        border = tuple(pygame.Color(self.color))
+        si = self._size
         
-        if background == None:
-            s = pygame.Surface(size).convert_alpha()
-            s.fill((0,0,0,0))
-        else:
-            s = pygame.Surface(size).convert()
-            s.fill(background)
-            
-        bg = self.font.render(text,antialias,self.color)
-        fg = self.font.render(text,antialias,color)
+        def draw(s):
+            bg = self.font.render(text,antialias,border)
+            fg = self.font.render(text,antialias,color)
+            dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
+            for dx,dy in dirs: s.blit(bg,(si+dx*si,si+dy*si))
+            s.blit(fg,(si,si))
         
-        si = self._size
-        dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        for dx,dy in dirs: s.blit(bg,(si+dx*si,si+dy*si))
-        s.blit(fg,(si,si))
-
-        return s
+        key = (text,antialias,color,background,border,si)
+        return _render(self.cache,key,self.size(text),background,draw,into)
 
-        
@@ -54,7 +54,9 @@ class App(container.Container):
         self.events = []
         
     def resize(self):
-            
+        
+        container.Container._layout_gen += 1
+        
         screen = self.screen
         w = self.widget
         wsize = 0
@@ -4,9 +4,10 @@ import os
 
 from .const import *
 from . import surface
-from . import container, table
+from . import widget, container, table
 from . import group
 from . import basic, button, slider
+from .cache import render_text
 
 
 class SlideBox(container.Container):
@@ -421,6 +422,156 @@ class List(ScrollArea):
         self.table.remove_row(item.style.row)
 
 
+class _VirtualList_Row(widget.Widget):
+    def __init__(self, vlist, **params):
+        params.setdefault("focusable", False)
+        widget.Widget.__init__(self, decorate=False, **params)
+        self.vlist = vlist
+        self.values = None
+
+    def resize(self, width=None, height=None):
+        return self.style.width, self.style.height
+
+    def paint(self, s):
+        if not self.values:
+            return
+        vlist = self.vlist
+        font, color = vlist.style.font, vlist.style.color
+        x = 0
+        for text, w in zip(self.values, vlist.columns):
+            sub = surface.subsurface(s, (x, 0, min(w, s.get_width() - x), s.get_height()))
+            sub.blit(render_text(font, str(text), 1, color), (0, 0))
+            x += w
+            if x >= s.get_width():
+                break
+
+
+class VirtualList(container.Container):
+    """A read-only list of rows that only creates widgets for the visible rows.
+
+    <p>Rows are pulled from the source when they are scrolled into view, and the
+    same row widgets are reused for every scroll position, so the cost of the
+    list does not grow with the number of rows.</p>
+
+    <pre>VirtualList(width,height,columns,source,row_height=None)</pre>
+
+    <dl>
+    <dt>width, height<dd>size of the list
+    <dt>columns<dd>list of column widths in pixels
+    <dt>source<dd>the rows, must support len(source) and source[a:b], returning a list of rows where each row is a sequence of values
+    <dt>row_height<dd>height of a row, defaults to the line size of the font
+    </dl>
+
+    <strong>Example</strong>
+    <code>
+    l = gui.VirtualList(300,200,[100,200],[("a","1"),("b","2")])
+    l.source = new_rows
+    l.refresh()
+    </code>
+    """
+
+    def __init__(self, width, height, columns, source, row_height=None, **params):
+        params.setdefault("cls", "vlist")
+        params.setdefault("width", width)
+        params.setdefault("height", height)
+        container.Container.__init__(self, **params)
+        if not self.style.font:
+            from . import app
+
+            self.style.font = app.App.app.theme.get("label", "", "font")
+        if not self.style.color:
+            self.style.color = (0, 0, 0)
+        self.columns = columns
+        self.source = source
+        self.row_height = row_height or self.style.font.get_linesize()
+        self.offset = 0
+        self.rows = []
+        self.count = len(source)
+        self._window = None
+
+        self.vscrollbar = slider.VScrollBar(0, 0, 1, 20, step=1)
+        self.vscrollbar.connect(CHANGE, self._vscrollbar_changed, None)
+
+    def refresh(self):
+        """Re-read the source, call this after the source has changed.
+
+        <pre>VirtualList.refresh()</pre>
+        """
+        self._window = None
+        self.count = len(self.source)
+        self.offset = max(0, min(self.offset, self.count - len(self.rows)))
+        self.chsize()
+
+    def resize(self, width=None, height=None):
+        visible = max(1, self.style.height // self.row_height)
+
+        rw = self.style.width
+        if self.count > visible:
+            if self.vscrollbar not in self.widgets:
+                container.Container.add(self, self.vscrollbar, 0, 0)
+            vs = self.vscrollbar
+            vs.style.height = self.style.height
+            vs.rect.w, vs.rect.h = vs.resize()
+            rw -= vs.rect.w
+            vs.style.x = rw
+            vs.max = self.count - visible
+            vs.size = max(20, self.style.height * visible // self.count)
+            vs.value = self.offset
+        else:
+            if self.vscrollbar in self.widgets:
+                self.widgets.remove(self.vscrollbar)
+            self.offset = 0
+
+        while len(self.rows) < visible:
+            row = _VirtualList_Row(self)
+            self.rows.append(row)
+            container.Container.add(self, row, 0, 0)
+        while len(self.rows) > visible:
+            self.widgets.remove(self.rows.pop())
+        for n, row in enumerate(self.rows):
+            row.style.x, row.style.y = 0, n * self.row_height
+            row.style.width, row.style.height = rw, self.row_height
+
+        container.Container.resize(self)
+        return self.style.width, self.style.height
+
+    def _fetch(self):
+        key = (self.offset, len(self.rows))
+        if self._window is None or self._window[0] != key:
+            data = self.source[self.offset : self.offset + len(self.rows)]
+            self._window = (key, data)
+        return self._window[1]
+
+    def paint(self, s):
+        data = self._fetch()
+        for n, row in enumerate(self.rows):
+            row.values = data[n] if n < len(data) else None
+        container.Container.paint(self, s)
+
+    def scroll(self, rows):
+        """Scroll the list by a number of rows.
+
+        <pre>VirtualList.scroll(rows)</pre>
+        """
+        offset = max(0, min(self.offset + rows, self.count - len(self.rows)))
+        if offset != self.offset:
+            self.offset = offset
+            if self.vscrollbar in self.widgets:
+                self.vscrollbar.value = offset
+            self.repaint()
+
+    def _vscrollbar_changed(self, xxx):
+        if self.vscrollbar.value != self.offset:
+            self.offset = self.vscrollbar.value
+            self.repaint()
+
+    def event(self, e):
+        if e.type == MOUSEBUTTONDOWN and e.button in (4, 5):
+            self.scroll(-3 if e.button == 4 else 3)
+            return
+        container.Container.event(self, e)
+
+
 # class List(ListArea):
 #    def __init__(self,*args,**params):
 #        print 'gui.List','Scheduled to be renamed to ListArea.  API may also be changed in the future.'
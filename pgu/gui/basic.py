@@ -5,6 +5,7 @@ import pygame
 
 from .const import *
 from . import widget
+from .cache import render_text
 
 class Spacer(widget.Widget):
     """A invisible space.
@@ -74,7 +75,7 @@ class Label(widget.Widget):
         self.style.width, self.style.height = self.font.size(self.value)
     
     def paint(self,s):
-        s.blit(self.font.render(self.value, 1, self.style.color),(0,0))
+        s.blit(render_text(self.font, self.value, 1, self.style.color),(0,0))
 
 class Image(widget.Widget):
     """An image.
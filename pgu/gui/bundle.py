@@ -0,0 +1,199 @@
+"""Precompiled theme bundles.
+
+<p>A bundle holds the parsed config.txt of a theme dir together with the
+decoded pixels of every image and the bytes of every font it refers to, in one
+file that is memory mapped when loaded.  Theme uses the bundle of a theme dir
+instead of parsing and decoding the separate files, as long as the bundle is
+not older than any of them.</p>
+
+<p>Compile a theme with</p>
+<code>
+python -m pgu.gui.bundle data/themes/eit
+</code>
+
+<p>File layout: MAGIC, the index length as a 32-bit little endian int, the index
+as JSON, then the image and font data at the offsets given in the index.</p>
+"""
+
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+import pygame
+
+MAGIC = b"PGUTHEM1"
+HEADER = struct.Struct("<8sI")
+BUNDLE_NAME = "theme.bundle"
+
+is_image = re.compile(r"\.(gif|jpg|bmp|png|tga)$", re.I)
+is_font = re.compile(r"\.ttf$", re.I)
+
+
+def parse_config(fname):
+    """Parse a theme config.txt into {"cls:pcls attr": vals}.
+
+    <pre>parse_config(fname)</pre>
+    """
+    config = {}
+    with open(fname) as f:
+        for line in f.readlines():
+            vals = line.strip().split()
+            if len(vals) < 3:
+                continue
+            cls = vals[0]
+            del vals[0]
+            pcls = ""
+            if cls.find(":") >= 0:
+                cls, pcls = cls.split(":")
+            attr = vals[0]
+            del vals[0]
+            config[cls + ":" + pcls + " " + attr] = vals
+    return config
+
+
+def _sources(dname, config):
+    """The files of dname that a bundle of config depends on"""
+    files = set(["config.txt"])
+    for vals in config.values():
+        if is_image.search(vals[0]) or is_font.search(vals[0]):
+            files.add(vals[0])
+    return sorted(files)
+
+
+def compile_theme(dname, fname=None):
+    """Compile the theme in dname into a bundle.
+
+    <pre>compile_theme(dname,fname=None)</pre>
+
+    <dl>
+    <dt>dname<dd>theme dir, containing a config.txt
+    <dt>fname<dd>bundle to write, defaults to theme.bundle inside dname
+    </dl>
+    """
+    if fname is None:
+        fname = os.path.join(dname, BUNDLE_NAME)
+    config = parse_config(os.path.join(dname, "config.txt"))
+
+    images, fonts, chunks = {}, {}, []
+    offset = 0
+    for name in _sources(dname, config):
+        path = os.path.join(dname, name)
+        if not os.path.exists(path):
+            # left to fail the same way as without a bundle, if it is used
+            continue
+        if is_image.search(name):
+            s = pygame.image.load(path)
+            data = pygame.image.tobytes(s, "RGBA")
+            images[name] = [offset, len(data), s.get_width(), s.get_height()]
+        elif is_font.search(name):
+            with open(path, "rb") as f:
+                data = f.read()
+            fonts[name] = [offset, len(data)]
+        else:
+            continue
+        # keep every chunk 4 byte aligned, so pixel rows can be used in place
+        data += b"\0" * (-len(data) % 4)
+        chunks.append(data)
+        offset += len(data)
+
+    index = json.dumps(
+        {"config": config, "images": images, "fonts": fonts}, sort_keys=True
+    ).encode("utf-8")
+    index += b" " * (-(HEADER.size + len(index)) % 4)
+
+    tmp = fname + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(index)))
+        f.write(index)
+        for data in chunks:
+            f.write(data)
+    os.replace(tmp, fname)
+    return fname
+
+
+class Bundle:
+    """A compiled theme, memory mapped from its file.
+
+    <pre>Bundle(fname)</pre>
+
+    <p>Surfaces returned by <tt>image</tt> use the mapped memory directly, so the
+    bundle must be kept open while they are in use.</p>
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, n = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError("%s is not a theme bundle" % fname)
+        index = json.loads(self.map[HEADER.size : HEADER.size + n].decode("utf-8"))
+        self.base = HEADER.size + n
+        self.config = index["config"]
+        self.images = index["images"]
+        self.fonts = index["fonts"]
+        self.data = memoryview(self.map)
+
+    def close(self):
+        self.data.release()
+        self.map.close()
+
+    def image(self, name):
+        """Return the image name as a pygame.Surface.
+
+        <pre>Bundle.image(name)</pre>
+        """
+        offset, n, w, h = self.images[name]
+        start = self.base + offset
+        return pygame.image.frombuffer(self.data[start : start + n], (w, h), "RGBA")
+
+    def font(self, name, size):
+        """Return the font name at size as a pygame.font.Font.
+
+        <pre>Bundle.font(name,size)</pre>
+        """
+        offset, n = self.fonts[name]
+        start = self.base + offset
+        return pygame.font.Font(io.BytesIO(self.data[start : start + n]), size)
+
+
+def load(dname):
+    """Return the Bundle of theme dir dname, or None if it has none or it is stale.
+
+    <pre>load(dname)</pre>
+    """
+    fname = os.path.join(dname, BUNDLE_NAME)
+    try:
+        built = os.path.getmtime(fname)
+    except OSError:
+        return None
+    try:
+        b = Bundle(fname)
+    except (OSError, ValueError):
+        return None
+    for name in _sources(dname, b.config):
+        try:
+            if os.path.getmtime(os.path.join(dname, name)) > built:
+                b.close()
+                return None
+        except OSError:
+            pass
+    return b
+
+
+def main(args):
+    if not args:
+        print("usage: python -m pgu.gui.bundle THEME_DIR [THEME_DIR ...]")
+        return 1
+    for dname in args:
+        print(compile_theme(dname))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
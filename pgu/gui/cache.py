@@ -0,0 +1,24 @@
+"""Bounded caches for surfaces that are expensive to create and often reused.
+"""
+
+import pygame
+
+from ..cache import LRUCache
+
+
+text_cache = LRUCache(512)
+
+
+def render_text(font, value, antialias, color):
+    """Render text with font, reusing an earlier surface for the same arguments.
+
+    <p>The returned surface is shared, it must only be blitted, never drawn on.</p>
+
+    <pre>render_text(font,value,antialias,color)</pre>
+    """
+    key = (value, font, antialias, tuple(pygame.Color(color)))
+    s = text_cache.get(key)
+    if s is None:
+        s = font.render(value, antialias, color)
+        text_cache[key] = s
+    return s
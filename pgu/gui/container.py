@@ -5,11 +5,23 @@ import pygame
 from .const import *
 from . import widget, surface
 
+#containers with at least this many widgets use a grid to find the
+#widgets under the mouse, instead of testing every widget
+INDEX_THRESHOLD = 32
+INDEX_CELL = 64
+
 class Container(widget.Widget):
     """The base container widget, can be used as a template as well as stand alone.
     
-    <pre>Container()</pre>
+    <pre>Container(hit_index=None)</pre>
+    
+    <dl>
+    <dt>hit_index<dd>use a grid of the widgets for mouse hit testing, True, False or None to use it for large containers
+    </dl>
     """
+    #bumped by App.resize, any index built before that is out of date
+    _layout_gen = 0
+    
     def __init__(self,**params):
         widget.Widget.__init__(self,**params)
         self.myfocus = None
@@ -20,6 +32,35 @@ class Container(widget.Widget):
         self.windows = []
         self.toupdate = {}
         self.topaint = {}
+        self.hit_index = params.get('hit_index',None)
+        self._index = None
+    
+    def _build_index(self):
+        grid = {}
+        for w in self.widgets:
+            r = w.rect
+            if r.w <= 0 or r.h <= 0: continue
+            for cy in range(r.top//INDEX_CELL,(r.bottom-1)//INDEX_CELL+1):
+                for cx in range(r.left//INDEX_CELL,(r.right-1)//INDEX_CELL+1):
+                    grid.setdefault((cx,cy),[]).append(w)
+        self._index = (Container._layout_gen,len(self.widgets),grid)
+    
+    def widgets_at(self,pos):
+        """Return the widgets that contain pos, in the order they were added.
+        
+        <pre>Container.widgets_at(pos)</pre>
+        """
+        use = self.hit_index
+        if use is None: use = len(self.widgets) >= INDEX_THRESHOLD
+        if not use:
+            return [w for w in self.widgets if w.rect.collidepoint(pos)]
+        
+        i = self._index
+        if i is None or i[0] != Container._layout_gen or i[1] != len(self.widgets):
+            self._build_index()
+        x,y = pos
+        ws = self._index[2].get((x//INDEX_CELL,y//INDEX_CELL),())
+        return [w for w in ws if w.rect.collidepoint(pos)]
     
     def update(self,s):
         updates = []
@@ -119,23 +160,22 @@ class Container(widget.Widget):
                 if self.myfocus: self.blur(self.myfocus)
             elif e.type == MOUSEBUTTONDOWN:
                 h = None
-                for w in self.widgets:
-                    if w.rect.collidepoint(e.pos):
-                        h = w
-                        if self.myfocus is not w: self.focus(w)
+                for w in self.widgets_at(e.pos):
+                    h = w
+                    if self.myfocus is not w: self.focus(w)
                 if not h and self.myfocus:
                     self.blur(self.myfocus)
             elif e.type == MOUSEMOTION:
                 if 1 in e.buttons:
                     if self.myfocus: ws = [self.myfocus]
                     else: ws = []
-                else: ws = self.widgets
+                    ws = [w for w in ws if w.rect.collidepoint(e.pos)]
+                else: ws = self.widgets_at(e.pos)
                 
                 h = None
                 for w in ws:
-                    if w.rect.collidepoint(e.pos):
-                        h = w
-                        if self.myhover is not w: self.enter(w)
+                    h = w
+                    if self.myhover is not w: self.enter(w)
                 if not h and self.myhover:
                     self.exit(self.myhover)
                 w = self.myhover
@@ -179,6 +219,7 @@ class Container(widget.Widget):
         """
         self.blur(w)
         self.widgets.remove(w)
+        self._index = None
         #self.repaint()
         self.chsize()
     
@@ -201,6 +242,7 @@ class Container(widget.Widget):
         #w.rect.x,w.rect.y = w.style.x,w.style.y
         #w.rect.w, w.rect.h = w.resize()
         self.widgets.append(w)
+        self._index = None
         self.chsize()
     
     def open(self,w=None,x=None,y=None):
@@ -340,6 +382,7 @@ class Container(widget.Widget):
         if self.style.width: ww = self.style.width
         if self.style.height: hh = self.style.height
         
+        self._index = None
         for w in self.widgets:
             #w.rect.w,w.rect.h = 0,0
             w.rect.x,w.rect.y = w.style.x,w.style.y
@@ -5,6 +5,7 @@ from pygame.locals import *
 
 from .const import *
 from . import widget
+from .cache import render_text
 
 class Input(widget.Widget):
     """A single line text input.
@@ -47,7 +48,7 @@ class Input(widget.Widget):
         if x < 0: self.vpos -= -x
         if x+cs > s.get_width(): self.vpos += x+cs-s.get_width()
         
-        s.blit(self.font.render(self.value, 1, self.style.color),(-self.vpos,0))
+        s.blit(render_text(self.font, self.value, 1, self.style.color),(-self.vpos,0))
         
         if self.container.myfocus is self:
             w,h = self.font.size(self.value[0:self.pos])
@@ -143,7 +144,7 @@ class Password(Input):
         if x < 0: self.vpos -= -x
         if x+cs > s.get_width(): self.vpos += x+cs-s.get_width()
         
-        s.blit(self.font.render(show, 1, self.style.color),(-self.vpos,0))
+        s.blit(render_text(self.font, show, 1, self.style.color),(-self.vpos,0))
         
         if self.container.myfocus is self:
             #w,h = self.font.size(self.value[0:self.pos])            
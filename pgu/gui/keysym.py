@@ -5,6 +5,7 @@ from pygame.locals import *
 
 from .const import *
 from . import widget
+from .cache import render_text
 
 class Keysym(widget.Widget):
     """A keysym input.
@@ -57,7 +58,7 @@ class Keysym(widget.Widget):
         for p in pygame.key.name(self.value).split(): name += p.capitalize()+" "
         #r.x = self.style.padding_left;
         #r.y = self.style.padding_bottom;
-        s.blit(self.style.font.render(name, 1, self.style.color), r)
+        s.blit(render_text(self.style.font, name, 1, self.style.color), r)
     
     def __setattr__(self,k,v):
         if k == 'value' and v != None:
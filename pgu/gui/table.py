@@ -205,61 +205,62 @@ class Table(container.Container):
         self.chsize()
 
     def resize(self, width=None, height=None):
-        # if 1 or self.getRows() == 82:
-        # print ''
-        # print 'resize',self.getRows(),self.getColumns(),width,height
-        # import inspect
-        # for obj,fname,line,fnc,code,n in inspect.stack()[9:20]:
-        #    print fname,line,':',fnc,code[0].strip()
+        # Only widgets that asked for a chsize since the last layout, or that
+        # are new, are measured again.  A chsize of the table itself (add,
+        # remove, clear, ...) measures all of them.
+        full = getattr(self, "_layout_all", True)
+        self._layout_all = False
+        if full:
+            self._sizes = {}
+            self._cells = {}
+        sizes, cells = self._sizes, self._cells
 
         # resize the widgets to their smallest size
+        changed = set()
         for w in self.widgets:
-            w.rect.w, w.rect.h = w.resize()
+            if w not in sizes or getattr(w, "_layout_dirty", True):
+                w.rect.w, w.rect.h = w.resize()
+                w._layout_dirty = False
+                if sizes.get(w) != (w.rect.w, w.rect.h):
+                    sizes[w] = w.rect.w, w.rect.h
+                changed.add(w)
+        if not changed and not full:
+            return self._size
+        self._index = None
 
         # calculate row heights and column widths
-        rowsizes = [0 for y in range(self.getRows())]
-        columnsizes = [0 for x in range(self.getColumns())]
-        for row in range(self.getRows()):
-            for cell in range(self.getColumns()):
-                if self._rows[row][cell] and self._rows[row][cell] is not True:
-                    if not self._rows[row][cell]["colspan"] > 1:
-                        columnsizes[cell] = max(
-                            columnsizes[cell], self._rows[row][cell]["widget"].rect.w
-                        )
-                    if not self._rows[row][cell]["rowspan"] > 1:
-                        rowsizes[row] = max(
-                            rowsizes[row], self._rows[row][cell]["widget"].rect.h
-                        )
+        spans = []
+        rowsizes = [0] * self.getRows()
+        columnsizes = [0] * self.getColumns()
+        for row, r in enumerate(self._rows):
+            for col, cell in enumerate(r):
+                if cell and cell is not True:
+                    w, h = sizes[cell["widget"]]
+                    if cell["colspan"] > 1 or cell["rowspan"] > 1:
+                        spans.append((row, col, cell, w, h))
+                    if not cell["colspan"] > 1:
+                        columnsizes[col] = max(columnsizes[col], w)
+                    if not cell["rowspan"] > 1:
+                        rowsizes[row] = max(rowsizes[row], h)
 
         # distribute extra space if necessary for wide colspanning/rowspanning
-        for row in range(self.getRows()):
-            for cell in range(self.getColumns()):
-                if self._rows[row][cell] and self._rows[row][cell] is not True:
-                    if self._rows[row][cell]["colspan"] > 1:
-                        columns = range(cell, cell + self._rows[row][cell]["colspan"])
-                        totalwidth = 0
-                        for acol in columns:
-                            totalwidth += columnsizes[acol]
-                        if totalwidth < self._rows[row][cell]["widget"].rect.w:
-                            for acol in columns:
-                                columnsizes[acol] += _table_div(
-                                    self._rows[row][cell]["widget"].rect.w - totalwidth,
-                                    self._rows[row][cell]["colspan"],
-                                    acol,
-                                )
-                    if self._rows[row][cell]["rowspan"] > 1:
-                        rows = range(row, row + self._rows[row][cell]["rowspan"])
-                        totalheight = 0
-                        for arow in rows:
-                            totalheight += rowsizes[arow]
-                        if totalheight < self._rows[row][cell]["widget"].rect.h:
-                            for arow in rows:
-                                rowsizes[arow] += _table_div(
-                                    self._rows[row][cell]["widget"].rect.h
-                                    - totalheight,
-                                    self._rows[row][cell]["rowspan"],
-                                    arow,
-                                )
+        for row, col, cell, w, h in spans:
+            if cell["colspan"] > 1:
+                columns = range(col, col + cell["colspan"])
+                totalwidth = sum(columnsizes[col : col + cell["colspan"]])
+                if totalwidth < w:
+                    for acol in columns:
+                        columnsizes[acol] += _table_div(
+                            w - totalwidth, cell["colspan"], acol
+                        )
+            if cell["rowspan"] > 1:
+                rows = range(row, row + cell["rowspan"])
+                totalheight = sum(rowsizes[row : row + cell["rowspan"]])
+                if totalheight < h:
+                    for arow in rows:
+                        rowsizes[arow] += _table_div(
+                            h - totalheight, cell["rowspan"], arow
+                        )
 
         # make everything fill out to self.style.width, self.style.heigh, not exact, but pretty close...
         w, h = sum(columnsizes), sum(rowsizes)
@@ -274,37 +275,36 @@ class Table(container.Container):
                 v = rowsizes[n]
                 rowsizes[n] += v * d / h
 
-        # set the widget's position by calculating their row/column x/y offset
-        cellpositions = [
-            [
-                [sum(columnsizes[0:cell]), sum(rowsizes[0:row])]
-                for cell in range(self.getColumns())
-            ]
-            for row in range(self.getRows())
-        ]
-        for row in range(self.getRows()):
-            for cell in range(self.getColumns()):
-                if self._rows[row][cell] and self._rows[row][cell] is not True:
-                    x, y = cellpositions[row][cell]
-                    w = sum(columnsizes[cell : cell + self._rows[row][cell]["colspan"]])
-                    h = sum(rowsizes[row : row + self._rows[row][cell]["rowspan"]])
-
-                    widget = self._rows[row][cell]["widget"]
-                    widget.rect.x = x
-                    widget.rect.y = y
-                    if 1 and (w, h) != (widget.rect.w, widget.rect.h):
-                        # if h > 50:
-                        #    print widget.widget.__class__.__name__, (widget.rect.w,widget.rect.h),'=>',(w,h)
-                        widget.rect.w, widget.rect.h = widget.resize(w, h)
-
-                    # print self._rows[row][cell]["widget"].rect
-
-        # print columnsizes
-        # print sum(columnsizes)
-        # size = sum(columnsizes), sum(rowsizes); print size
+        # row/column offsets as prefix sums
+        xs, ys = [0], [0]
+        for v in columnsizes:
+            xs.append(xs[-1] + v)
+        for v in rowsizes:
+            ys.append(ys[-1] + v)
+
+        # set the widget's position, and resize the widgets whose cell changed
+        for row, r in enumerate(self._rows):
+            for col, cell in enumerate(r):
+                if cell and cell is not True:
+                    widget = cell["widget"]
+                    w = sum(columnsizes[col : col + cell["colspan"]])
+                    h = sum(rowsizes[row : row + cell["rowspan"]])
+                    widget.rect.x = xs[col]
+                    widget.rect.y = ys[row]
+                    if widget in changed:
+                        # the widget is at its smallest size right now
+                        if (w, h) != sizes[widget]:
+                            widget.rect.w, widget.rect.h = widget.resize(w, h)
+                    elif cells.get(widget) != (w, h):
+                        if (w, h) != sizes[widget]:
+                            widget.rect.w, widget.rect.h = widget.resize(w, h)
+                        else:
+                            widget.rect.w, widget.rect.h = widget.resize()
+                    cells[widget] = w, h
 
         # return the tables final size
-        return sum(columnsizes), sum(rowsizes)
+        self._size = xs[-1], ys[-1]
+        return self._size
 
 
 def _table_div(a, b, c):
@@ -1,10 +1,14 @@
 """ """
 
+import io
 import os, re
+import threading
 import pygame
 
 from .const import *
 from . import surface
+from .cache import LRUCache
+from . import bundle
 
 
 def _list_themes(dir):
@@ -23,11 +27,14 @@ class Theme:
 
     <strong>Default Theme</strong>
 
-    <pre>Theme(dirs='default')</pre>
+    <pre>Theme(dirs='default',preload=False)</pre>
     <dl>
     <dt>dirs<dd>Name of the theme dir to load a theme from.  May be an absolute path to a theme, if pgu is not installed, or if you created your own theme.  May include several dirs in a list if data is spread across several themes.
+    <dt>preload<dd>if True, read every image and font file of the theme in a background thread, instead of the first time they are used
     </dl>
 
+    <p>A theme dir that has a compiled bundle (see pgu.gui.bundle) is loaded from the bundle.</p>
+
     <strong>Example</strong>
 
     <code>
@@ -36,13 +43,61 @@ class Theme:
     </code>
     """
 
-    def __init__(self, dirs="default"):
+    def __init__(self, dirs="default", preload=False):
         self.config = {}
         self.dict = {}
         self._loaded = []
         self.cache = {}
+        self.boxes = LRUCache(64)
+        self.bundles = {}
+        # files read by the loader thread and not used yet, by key
+        self._files = {}
+        self._lock = threading.Lock()
         self._preload(dirs)
         pygame.font.init()
+        if preload:
+            self.loader = threading.Thread(target=self._prefetch)
+            self.loader.daemon = True
+            self.loader.start()
+
+    def load_all(self):
+        """Load every image and font of the theme now.
+
+        <pre>Theme.load_all()</pre>
+        """
+        for key in list(self.config.keys()):
+            try:
+                self._get(key)
+            except (OSError, pygame.error):
+                # a missing file fails again when the widget asks for it
+                pass
+
+    def _prefetch(self):
+        # On the loader thread: decode the images and read the font files,
+        # _get makes the fonts on the main thread, pygame.font is not thread
+        # safe.  Missing files fail again when a widget asks for them.
+        fonts = {}
+        for key, (dname, vals) in list(self.config.items()):
+            v0 = vals[0]
+            b = self.bundles.get(dname)
+            if b is not None and (v0 in b.fonts or v0 in b.images):
+                continue
+            fname = os.path.join(dname, v0)
+            try:
+                if v0.endswith(".ttf") or v0.endswith(".TTF"):
+                    if fname not in fonts:
+                        with open(fname, "rb") as f:
+                            fonts[fname] = f.read()
+                    data = fonts[fname]
+                elif v0[0] != "#" and self.is_image.search(v0) is not None:
+                    data = pygame.image.load(fname)
+                else:
+                    continue
+            except (OSError, pygame.error):
+                continue
+            with self._lock:
+                if key not in self.dict:
+                    self._files[key] = data
 
     def _preload(self, ds):
         if not isinstance(ds, list):
@@ -54,6 +109,7 @@ class Theme:
 
     def _load(self, name):
         # theme_dir = themes[name]
+        self.boxes.clear()
 
         # try to load the local dir, or absolute path
         dnames = [name]
@@ -105,47 +161,54 @@ class Theme:
                 t.append(os.path.abspath(n))
             raise "could not find theme " + name + " : " + str(t)
 
-        fname = os.path.join(dname, "config.txt")
-        try:
-            f = open(fname)
-            for line in f.readlines():
-                vals = line.strip().split()
-                if len(vals) < 3:
-                    continue
-                cls = vals[0]
-                del vals[0]
-                pcls = ""
-                if cls.find(":") >= 0:
-                    cls, pcls = cls.split(":")
-                attr = vals[0]
-                del vals[0]
-                self.config[cls + ":" + pcls + " " + attr] = (dname, vals)
-        finally:
-            f.close()
+        b = bundle.load(dname)
+        if b is not None:
+            self.bundles[dname] = b
+            config = b.config
+        else:
+            config = bundle.parse_config(os.path.join(dname, "config.txt"))
+        for key, vals in config.items():
+            self.config[key] = (dname, vals)
 
     is_image = re.compile(r"\.(gif|jpg|bmp|png|tga)$", re.I)
 
     def _get(self, key):
         if not key in self.config:
             return
-        if key in self.dict:
-            return self.dict[key]
+        with self._lock:
+            if key in self.dict:
+                return self.dict[key]
+            v = self._load_value(key, self._files.pop(key, None))
+            self.dict[key] = v
+            return v
+
+    def _load_value(self, key, data):
+        # data is what the loader thread read for key, or None
         dvals = self.config[key]
         dname, vals = dvals
         # theme_dir = themes[name]
         v0 = vals[0]
         if v0[0] == "#":
             v = pygame.color.Color(v0)
+        elif dname in self.bundles and v0 in self.bundles[dname].fonts:
+            v = self.bundles[dname].font(v0, int(vals[1]))
+        elif dname in self.bundles and v0 in self.bundles[dname].images:
+            v = self.bundles[dname].image(v0)
         elif v0.endswith(".ttf") or v0.endswith(".TTF"):
-            v = pygame.font.Font(os.path.join(dname, v0), int(vals[1]))
+            if data is not None:
+                v = pygame.font.Font(io.BytesIO(data), int(vals[1]))
+            else:
+                v = pygame.font.Font(os.path.join(dname, v0), int(vals[1]))
         elif self.is_image.search(v0) is not None:
-            v = pygame.image.load(os.path.join(dname, v0))
+            if data is not None:
+                v = data
+            else:
+                v = pygame.image.load(os.path.join(dname, v0))
         else:
             try:
                 v = int(v0)
             except:
                 v = pygame.font.SysFont(v0, int(vals[1]))
-        self.dict[key] = v
         return v
 
     def get(self, cls, pcls, attr):
@@ -446,10 +509,23 @@ class Theme:
         if box == 0:
             return
 
-        if type(box) == tuple:
+        if isinstance(box, (tuple, pygame.Color)):
             s.fill(box, r)
             return
 
+        if r.w <= 0 or r.h <= 0:
+            return
+
+        # the tiled box is rendered once per size, after that it is one blit
+        key = (box, r.w, r.h)
+        b = self.boxes.get(key)
+        if b is None:
+            b = pygame.Surface((r.w, r.h), pygame.SRCALPHA, 32)
+            self._render_box(b, box, b.get_rect())
+            self.boxes[key] = b
+        s.blit(b, r)
+
+    def _render_box(self, s, box, r):
         x, y, w, h = r.x, r.y, r.w, r.h
         ww, hh = box.get_width() // 3, box.get_height() // 3
         xx, yy = x + w, y + h
@@ -522,7 +598,7 @@ class Background(widget.Widget):
     def paint(self, s):
         r = pygame.Rect(0, 0, s.get_width(), s.get_height())
         v = self.value.style.background
-        if type(v) == tuple:
+        if isinstance(v, (tuple, pygame.Color)):
             s.fill(v)
         else:
             self.theme.render(s, v, r)
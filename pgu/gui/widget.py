@@ -133,6 +133,13 @@ class Widget:
         
         <pre>Widget.chsize()</pre>
         """
+        #mark the way up to the app, so a Table only has to measure again
+        #the widgets that changed
+        self._layout_all = True
+        w = self
+        while w is not None:
+            w._layout_dirty = True
+            w = getattr(w,'container',None)
         if not hasattr(self,'container'): return
         from . import app
         if hasattr(app.App,'app'):
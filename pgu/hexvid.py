@@ -73,7 +73,7 @@ class Hexvid(Vid):
             x -= tile_w/2
             for i1 in range(-1,self.view.w/tile_wi+1):
                 if ty >= 0 and ty < h and tx >= 0 and tx < w:
-                    if blayer != None:
+                    if blayer is not None:
                         n = blayer[ty][tx]
                         if n != 0:
                             t = tiles[n]
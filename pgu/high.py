@@ -1,7 +1,15 @@
 """Classes for handling high score tables.
+
+<p>The scores are stored in a text file, one tab separated line per entry:
+table name, score, name and data.  Highs.save() rewrites the file through a
+temporary file, so a crash leaves either the old or the new file.
+_High.append() adds a single line at the end of the file instead.  When the
+file is loaded, each line is submitted again in order, so appended lines
+end up in the right place.</p>
 """
 
 import os
+from bisect import bisect_right
 
 def High(fname,limit=10):
     """Create a Highs object and returns the default high score table.
@@ -42,6 +50,7 @@ class _High:
     def __init__(self,highs,limit=10):
         self.highs = highs
         self._list = []
+        self._keys = [] #-score of each entry, ascending, for bisect
         self.limit = limit
         
     def save(self):
@@ -56,17 +65,31 @@ class _High:
         
         <pre>_High.submit(score,name,data=None)</pre>
         
+        <p>A score goes below the equal scores already in the table.</p>
+        
         <p>return -- the position in the table that the score attained.  None if the score did not attain a position in the table.</p>
         """
-        n = 0
-        for e in self._list:
-            if score > e.score:
-                self._list.insert(n,_Score(score,name,data))
-                self._list = self._list[0:self.limit]
-                return n
-        if len(self._list) < self.limit:
-            self._list.append(_Score(score,name,data))
-            return len(self._list)-1
+        n = self.check(score)
+        if n == None: return None
+        self._list.insert(n,_Score(score,name,data))
+        self._keys.insert(n,-score)
+        del self._list[self.limit:]
+        del self._keys[self.limit:]
+        return n
+    
+    def append(self,score,name,data=None):
+        """Submit a high score, and add it to the end of the file.
+        
+        <pre>_High.append(score,name,data=None)</pre>
+        
+        <p>Unlike save(), this only writes the one new line.  Use it when
+        scores are submitted often.</p>
+        
+        <p>return -- the same as submit()</p>
+        """
+        n = self.submit(score,name,data)
+        if n != None: self.highs._append(self,score,name,data)
+        return n
     
     def check(self,score):
         """Check if a score will attain a position in the table.
@@ -75,13 +98,8 @@ class _High:
         
         <p>return -- the position the score will attain, else None</p>
         """
-        n = 0
-        for e in self._list:
-            if score > e.score:
-                return n
-        if len(self._list) < self.limit:
-            return len(self._list)
-        
+        n = bisect_right(self._keys,-score)
+        if n < self.limit: return n
         
     def __iter__(self):
         return self._list.__iter__()
@@ -102,6 +120,9 @@ class Highs:
     <dt>limit <dd>limit of scores to be recorded, defaults to 10
     </ul>
     
+    <p>After compact lines have been appended, the next append saves the
+    whole file instead.</p>
+    
     <p>You may access _High objects through this object:</p>
    
     <code> 
@@ -110,6 +131,8 @@ class Highs:
     </code>
     
     """
+    compact = 1000
+    
     def __init__(self,fname,limit=10):
         self.fname = fname
         self.limit = limit
@@ -122,17 +145,21 @@ class Highs:
         """
         
         self._dict = {}
+        self._names = {}
+        self._appended = 0
         try:
             f = open(self.fname)
-            for line in f.readlines():
-                key,score,name,data = line.strip().split("\t")
-                if key not in self._dict:
-                    self._dict[key] = _High(self,self.limit)
-                high = self._dict[key]
-                high.submit(int(score),name,data)
-            f.close()
-        except:
-            pass
+        except IOError:
+            return
+        for line in f.readlines():
+            try:
+                key,score,name,data = line.rstrip("\n").split("\t")
+                score = int(score)
+            except ValueError:
+                #eg. a line cut short by a crash while appending
+                continue
+            self[key].submit(score,name,data)
+        f.close()
     
     def save(self):
         """Save the high scores.
@@ -140,13 +167,44 @@ class Highs:
         <pre>Highs.save()</pre>
         """
         
-        f = open(self.fname,"w")
+        tmp = self.fname+".tmp"
+        f = open(tmp,"w")
         for key,high in self._dict.items():
             for e in high:
-                f.write("%s\t%d\t%s\t%s\n"%(key,e.score,e.name,str(e.data)))
+                f.write(self._line(key,e.score,e.name,e.data))
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(tmp,self.fname)
+        self._appended = 0
+        
+    def _line(self,key,score,name,data):
+        return "%s\t%d\t%s\t%s\n"%(key,score,name,str(data))
+        
+    def _append(self,high,score,name,data):
+        if self._appended >= self.compact:
+            #the file has grown enough, write it out in full again
+            return self.save()
+        f = open(self.fname,"a")
+        f.write(self._line(self._names[high],score,name,data))
+        f.flush()
+        os.fsync(f.fileno())
         f.close()
+        self._appended += 1
+        
+    def keys(self):
+        """Return the names of the tables.
+        
+        <pre>Highs.keys()</pre>
+        """
+        return self._dict.keys()
+        
+    def __contains__(self,key):
+        return key in self._dict
         
     def __getitem__(self,key):
         if key not in self._dict:
-            self._dict[key] = _High(self,self.limit)
+            high = _High(self,self.limit)
+            self._dict[key] = high
+            self._names[high] = key
         return self._dict[key]
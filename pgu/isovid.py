@@ -74,7 +74,7 @@ class Isovid(Vid):
             for i1 in range(-1,self.view.w/base_w+2): #NOTE: not sure why +2
                 if ty >= 0 and ty < h and tx >= 0 and tx < w:
                     z = zlayer[ty][tx]*iso_z
-                    if blayer != None:
+                    if blayer is not None:
                         n = blayer[ty][tx]
                         if n != 0:
                             t = tiles[n]
@@ -1,10 +1,70 @@
 """Square tile based engine."""
 
+from collections import OrderedDict
+
+import numpy
+
 from pgu.vid import *
 import pygame
 
 class Tilevid(Vid):
-    """Based on [[vid]] -- see for reference."""
+    """Based on [[vid]] -- see for reference.
+    
+    <p>paint() draws the tiles in blocks of chunk_size x chunk_size tiles,
+    each pre-rendered to a surface.  A block is rendered again only when
+    its tiles have changed since it was rendered, so scrolling over an
+    unchanged level costs one blit per block.  At most chunk_limit blocks are
+    kept.  Call clear_chunks() after changing the images of the tiles.</p>
+    """
+    chunk_size = 8
+    chunk_limit = 256
+    
+    def __init__(self):
+        self.chunks = OrderedDict()
+        Vid.__init__(self)
+    
+    def resize(self,size,bg=0):
+        Vid.resize(self,size,bg)
+        self.clear_chunks()
+    
+    def clear_chunks(self):
+        """Drop all pre-rendered blocks of tiles.
+        
+        <pre>Tilevid.clear_chunks()</pre>
+        """
+        self.chunks.clear()
+    
+    def _chunk(self,cx,cy,tw,th):
+        """Return the surface of block cx,cy, rendering it if needed."""
+        n = self.chunk_size
+        ys,xs = slice(cy*n,cy*n+n),slice(cx*n,cx*n+n)
+        trow = self.tlayer[ys,xs]
+        brow = None
+        if self.blayer is not None: brow = self.blayer[ys,xs]
+        
+        key = (cx,cy)
+        c = self.chunks.get(key)
+        if c is not None:
+            self.chunks.move_to_end(key)
+            img,t,b = c
+            if (t == trow).all() and (b is None or (b == brow).all()):
+                return img
+        
+        tiles = self.tiles
+        img = pygame.Surface((n*tw,n*th),SRCALPHA,32)
+        blit = img.blit
+        if brow is not None:
+            for y,row in enumerate(brow.tolist()):
+                for x,v in enumerate(row): blit(tiles[v].image,(x*tw,y*th))
+        for y,row in enumerate(trow.tolist()):
+            for x,v in enumerate(row): blit(tiles[v].image,(x*tw,y*th))
+        
+        if brow is not None: brow = brow.copy()
+        self.chunks[key] = (img,trow.copy(),brow)
+        while len(self.chunks) > self.chunk_limit:
+            self.chunks.popitem(last=False)
+        return img
+    
     def paint(self,s):
         sw,sh = s.get_width(),s.get_height()
         self.view.w,self.view.h = sw,sh
@@ -16,47 +76,21 @@ class Tilevid(Vid):
         if self.bounds != None: self.view.clamp_ip(self.bounds)
         
         ox,oy = self.view.x,self.view.y
-        tlayer = self.tlayer
-        blayer = self.blayer
-        alayer = self.alayer
         sprites = self.sprites
-        
         blit = s.blit
-        yy = - (self.view.y%th) 
-        my = (oy+sh)/th
+        
+        n = self.chunk_size
+        cw,ch = n*tw,n*th
+        for cy in range(max(0,oy//ch),min((h+n-1)//n,(oy+sh+ch-1)//ch)):
+            for cx in range(max(0,ox//cw),min((w+n-1)//n,(ox+sw+cw-1)//cw)):
+                blit(self._chunk(cx,cy,tw,th),(cx*cw-ox,cy*ch-oy))
+        
+        my = (oy+sh)//th
         if (oy+sh)%th: my += 1
+        mx = (ox+sw)//tw+1
+        self.alayer[max(0,oy//th):max(0,min(h,my)),
+            max(0,ox//tw):max(0,min(w,mx))] = 0
         
-        if blayer != None:
-            for y in range(oy/th,my):
-                if y >=0 and y < h:
-                    trow = tlayer[y]
-                    brow = blayer[y]
-                    arow = alayer[y]
-                    xx= - (self.view.x%tw)
-                    mx = (ox+sw)/tw
-                    #if (ox+sh)%tw: mx += 1
-                    for x in range(ox/tw,mx+1):
-                        if x >=0and x<w:
-                            blit(tiles[brow[x]].image,(xx,yy))
-                            blit(tiles[trow[x]].image,(xx,yy))
-                            arow[x]=0
-                        xx += tw
-                yy+=th
-        else:
-            for y in range(oy/th,my):
-                if y >=0 and y<h:
-                    trow = tlayer[y]
-                    arow = alayer[y]
-                    xx= - (self.view.x%tw)
-                    mx = (ox+sw)/tw
-                    #if (ox+sh)%tw: mx += 1
-                    for x in range(ox/tw,mx+1):
-                        if x >=0 and x<w:
-                            blit(tiles[trow[x]].image,(xx,yy))
-                            arow[x]=0
-                        xx += tw
-                yy+=th
-
         for s in sprites:
             s.irect.x = s.rect.x-s.shape.x
             s.irect.y = s.rect.y-s.shape.y
@@ -64,10 +98,22 @@ class Tilevid(Vid):
             s.updated=0
             s._irect = Rect(s.irect)
             #s._rect = Rect(s.rect)
-
+        
         self.updates = []
         self._view = pygame.Rect(self.view)
         return [Rect(0,0,sw,sh)]
+    
+    def _cells(self,r,tw,th):
+        """Return the part of the alayer under rect r, and its top left."""
+        w,h = self.size
+        x,y = max(0,r.x//tw),max(0,r.y//th)
+        return self.alayer[y:min(h,r.bottom//th+1),x:min(w,r.right//tw+1)],x,y
+    
+    def _mark(self,a,x,y,v):
+        """Append the cells of a that are 0 to updates, and set them to v."""
+        ys,xs = numpy.nonzero(a == 0)
+        self.updates.extend(zip((xs+x).tolist(),(ys+y).tolist()))
+        a[ys,xs] = v
         
     def update(self,s):
         sw,sh = s.get_width(),s.get_height()
@@ -79,7 +125,6 @@ class Tilevid(Vid):
         
         ox,oy = self.view.x,self.view.y
         sw,sh = s.get_width(),s.get_height()
-        w,h = self.size
         tlayer = self.tlayer
         blayer = self.blayer
         alayer = self.alayer
@@ -104,55 +149,25 @@ class Tilevid(Vid):
                  #w,h can be skipped, image covers that...
                  s.updated = 1
             if s.updated:
-                r = s._irect
-                y = max(0,r.y/th)
-                yy = min(h,r.bottom/th+1)
-                while y < yy:
-                    x = max(0,r.x/tw)
-                    xx = min(w,r.right/tw+1)
-                    while x < xx:
-                        if alayer[y][x] == 0:
-                            self.updates.append((x,y))
-                        alayer[y][x]=1
-                        x += 1
-                    y += 1
-
-                r = s.irect
-                y = max(0,r.y/th)
-                yy = min(h,r.bottom/th+1)
-                while y < yy:
-                    x = r.x/tw
-                    xx = min(w,r.right/tw+1)
-                    while x < xx:
-                        if alayer[y][x]==0:
-                            alayer[y][x]=2
-                            self.updates.append((x,y))
-                        x += 1
-                    y += 1
-                    
-
+                a,x,y = self._cells(s._irect,tw,th)
+                self._mark(a,x,y,1)
+                a[:] = 1
+                
+                a,x,y = self._cells(s.irect,tw,th)
+                self._mark(a,x,y,2)
+        
         #mark sprites that are not being updated that need to be updated because
         #they are being overwritte by sprites / tiles
         for s in sprites:
             if s.updated==0:
-                r = s.irect
-                y = max(0,r.y/th)
-                yy = min(h,r.bottom/th+1)
-                while y < yy:
-                    x = max(0,r.x/tw)
-                    xx = min(w,r.right/tw+1)
-                    while x < xx:
-                        if alayer[y][x]==1:
-                            s.updated=1
-                        x += 1
-                    y += 1
-
+                a,x,y = self._cells(s.irect,tw,th)
+                if (a == 1).any(): s.updated=1
         
         for u in self.updates:
             x,y=u
             xx,yy=x*tw-ox,y*th-oy
             if alayer[y][x] == 1:
-                if blayer != None: blit(tiles[blayer[y][x]].image,(xx,yy))
+                if blayer is not None: blit(tiles[blayer[y][x]].image,(xx,yy))
                 blit(tiles[tlayer[y][x]].image,(xx,yy))
             alayer[y][x]=0
             us.append(Rect(xx,yy,tw,th))
@@ -171,7 +186,7 @@ class Tilevid(Vid):
         x,y = pos
         tiles = self.tiles
         tw,th = tiles[0].image.get_width(),tiles[0].image.get_height()
-        return x/tw,y/th
+        return x//tw,y//th
         
     def tile_to_view(self,pos):
         x,y = pos
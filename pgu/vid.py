@@ -24,6 +24,7 @@ import pygame
 from pygame.rect import Rect
 from pygame.locals import *
 import math
+import numpy
 
 class Sprite:
     """The object used for Sprites.
@@ -128,6 +129,67 @@ class _Sprites(list):
         v.updated = 1
         self.removed.append(v)
         
+class _SpriteHash:
+    """A uniform grid of the sprites, for finding the sprites a sprite may hit.
+    
+    <p>It is kept between frames, and only sprites that moved to other cells
+    are rehashed.</p>
+    """
+    def __init__(self,size):
+        self.size = size
+        self.cells = {}
+        self.sprites = {} #sprite: the (x1,y1,x2,y2) cell range it is in
+        
+    def _range(self,rect):
+        size = self.size
+        return (rect.left//size,rect.top//size,
+            max(rect.right-1,rect.left)//size,max(rect.bottom-1,rect.top)//size)
+    
+    def _add(self,s,r):
+        cells = self.cells
+        x1,y1,x2,y2 = r
+        for y in range(y1,y2+1):
+            for x in range(x1,x2+1):
+                c = cells.get((x,y))
+                if c is None: c = cells[x,y] = set()
+                c.add(s)
+        self.sprites[s] = r
+    
+    def _remove(self,s):
+        cells = self.cells
+        x1,y1,x2,y2 = self.sprites.pop(s)
+        for y in range(y1,y2+1):
+            for x in range(x1,x2+1):
+                c = cells[x,y]
+                c.discard(s)
+                if not c: del cells[x,y]
+        
+    def sync(self,sprites):
+        """Bring the grid up to date with sprites, the current list of sprites."""
+        current = set(sprites)
+        for s in [s for s in self.sprites if s not in current]:
+            self._remove(s)
+        for s in sprites: self.update(s)
+    
+    def update(self,s):
+        """Rehash s if it moved to other cells."""
+        r = self._range(s.rect)
+        old = self.sprites.get(s)
+        if old == r: return
+        if old is not None: self._remove(s)
+        self._add(s,r)
+    
+    def near(self,s):
+        """Return the set of sprites that share a cell with s, s included."""
+        cells = self.cells
+        x1,y1,x2,y2 = self.sprites[s]
+        if x1 == x2 and y1 == y2: return cells[x1,y1]
+        r = set()
+        for y in range(y1,y2+1):
+            for x in range(x1,x2+1):
+                r.update(cells[x,y])
+        return r
+
 class Vid:
     """An engine for rendering Sprites and Tiles.
     
@@ -147,8 +209,17 @@ class Vid:
     <dt>tlayer  <dd>the foreground tiles layer
     <dt>clayer  <dd>the code layer (optional)
     <dt>blayer  <dd>the background tiles layer (optional)
+    <dt>alayer  <dd>marks tiles that need to be drawn again
+    </dl>
+    
+    <p>The layers are 2-D numpy arrays, indexed [y][x] or [y,x].  Use
+    set, fill and set_region to change tlayer, so the screen is updated.</p>
+    
+    <dl>
     <dt>groups  <dd>a hash of group names to group values (32 groups max, as a tile/sprites 
             membership in a group is determined by the bits in an integer)
+    <dt>hash_size <dd>size in pixels of the cells of the grid used to find
+            sprite-sprite collisions.  Set it before the first loop().
     </dl>
     """
     
@@ -163,6 +234,8 @@ class Vid:
         self.bounds = None
         self.updates = []
         self.groups = {}
+        self.hash_size = 64
+        self._hash = None
     
         
     def resize(self,size,bg=0):
@@ -178,8 +251,7 @@ class Vid:
         """
         self.size = size
         w,h = size
-        self.layers = [[[0 for x in range(0,w)] for y in range(0,h)]
-            for z in range(0,4)]
+        self.layers = numpy.zeros((4,h,w),numpy.int32)
         self.tlayer = self.layers[0]
         self.blayer = self.layers[1]
         if not bg: self.blayer = None
@@ -223,6 +295,52 @@ class Vid:
         """
         return self.tlayer[pos[1]][pos[0]]
     
+    def set_region(self,pos,values):
+        """Set a block of tiles in the foreground.
+        
+        <pre>Vid.set_region(pos,values)</pre>
+        
+        <dl>
+        <dt>pos <dd>(x,y) of the top left tile
+        <dt>values <dd>2-D array of values, indexed [y][x]
+        </dl>
+        """
+        values = numpy.asarray(values)
+        x,y = pos
+        h,w = values.shape
+        t = self.tlayer[y:y+h,x:x+w]
+        changed = t != values
+        if not changed.any(): return
+        t[changed] = values[changed]
+        self.alayer[y:y+h,x:x+w][changed] = 1
+        ys,xs = numpy.nonzero(changed)
+        self.updates.extend(zip((xs+x).tolist(),(ys+y).tolist()))
+    
+    def get_region(self,rect):
+        """Get a copy of a block of the foreground.
+        
+        <pre>Vid.get_region(rect): return array</pre>
+        
+        <dl>
+        <dt>rect <dd>(x,y,w,h) in tiles
+        </dl>
+        """
+        x,y,w,h = rect
+        return self.tlayer[y:y+h,x:x+w].copy()
+    
+    def fill(self,rect,v):
+        """Set every tile of a block of the foreground to v.
+        
+        <pre>Vid.fill(rect,v)</pre>
+        
+        <dl>
+        <dt>rect <dd>(x,y,w,h) in tiles
+        <dt>v <dd>value
+        </dl>
+        """
+        x,y,w,h = rect
+        self.set_region((x,y),numpy.full(self.tlayer[y:y+h,x:x+w].shape,v))
+    
     def paint(self,s):
         """Paint the screen.
         
@@ -265,12 +383,10 @@ class Vid:
         else: img = fname
         w,h = img.get_width(),img.get_height()
         self.resize((w,h),bg)
-        for y in range(0,h):
-            for x in range(0,w):
-                t,b,c,_a = img.get_at((x,y))
-                self.tlayer[y][x] = t
-                if bg: self.blayer[y][x] = b
-                self.clayer[y][x] = c
+        rgb = pygame.surfarray.array3d(img).transpose(1,0,2)
+        self.tlayer[:] = rgb[:,:,0]
+        if bg: self.blayer[:] = rgb[:,:,1]
+        self.clayer[:] = rgb[:,:,2]
                 
     def tga_save_level(self,fname):
         """Save a TGA level.
@@ -284,15 +400,12 @@ class Vid:
         w,h = self.size
         img = pygame.Surface((w,h),SWSURFACE,32)
         img.fill((0,0,0,0))
-        for y in range(0,h):
-            for x in range(0,w):
-                t = self.tlayer[y][x]
-                b = 0
-                if self.blayer:
-                    b = self.blayer[y][x]
-                c = self.clayer[y][x]
-                _a = 0
-                img.set_at((x,y),(t,b,c,_a))
+        rgb = numpy.zeros((h,w,3),numpy.uint8)
+        rgb[:,:,0] = self.tlayer
+        if self.blayer is not None:
+            rgb[:,:,1] = self.blayer
+        rgb[:,:,2] = self.clayer
+        pygame.surfarray.blit_array(img,rgb.transpose(1,0,2))
         pygame.image.save(img,fname)
                 
                 
@@ -416,8 +529,8 @@ class Vid:
             s._rect = pygame.Rect(s.rect)
         
     def loop_sprites(self):
-        as = self.sprites[:]
-        for s in as:
+        sprites = self.sprites[:]
+        for s in sprites:
             if hasattr(s,'loop'):
                 s.loop(self,s)
 
@@ -427,8 +540,8 @@ class Vid:
 
         layer = self.layers[0]
 
-        as = self.sprites[:]
-        for s in as:
+        sprites = self.sprites[:]
+        for s in sprites:
             self._tilehits(s)
     
     def _tilehits(self,s):
@@ -436,111 +549,99 @@ class Vid:
         tw,th = tiles[0].image.get_width(),tiles[0].image.get_height()
         layer = self.layers[0]
         
-        for _z in (0,): 
-            if s.groups != 0:
-
-                _rect = s._rect
-                rect = s.rect
-
-                _rectx = _rect.x
-                _recty = _rect.y
-                _rectw = _rect.w
-                _recth = _rect.h
-
-                rectx = rect.x
-                recty = rect.y
-                rectw = rect.w
-                recth = rect.h
-
-                rect.y = _rect.y
-                rect.h = _rect.h
+        if s.groups == 0: return
+        
+        _rect = s._rect
+        rect = s.rect
 
-                hits = []
-                ct,cb,cl,cr = rect.top,rect.bottom,rect.left,rect.right
-                #nasty ol loops
-                y = ct/th*th
-                while y < cb:
-                    x = cl/tw*tw
-                    yy = y/th
-                    while x < cr:
-                        xx = x/tw
-                        t = tiles[layer[yy][xx]]
-                        if (s.groups & t.agroups)!=0:
-                            #self.hit(xx,yy,t,s)
-                            d = math.hypot(rect.centerx-(xx*tw+tw/2),
-                                rect.centery-(yy*th+th/2))
-                            hits.append((d,t,xx,yy))
+        _rectx = _rect.x
+        _recty = _rect.y
 
-                        x += tw
-                    y += th
-                
-                hits.sort()
-                #if len(hits) > 0: print self.frame,hits
-                for d,t,xx,yy in hits:
-                    self.hit(xx,yy,t,s)
-                
-                #switching directions...
-                _rect.x = rect.x
-                _rect.w = rect.w
-                rect.y = recty
-                rect.h = recth
+        recty = rect.y
+        recth = rect.h
 
-                hits = []
-                ct,cb,cl,cr = rect.top,rect.bottom,rect.left,rect.right
-                #nasty ol loops
-                y = ct/th*th
-                while y < cb:
-                    x = cl/tw*tw
-                    yy = y/th
-                    while x < cr:
-                        xx = x/tw
-                        t = tiles[layer[yy][xx]]
-                        if (s.groups & t.agroups)!=0:
-                            d = math.hypot(rect.centerx-(xx*tw+tw/2),
-                                rect.centery-(yy*th+th/2))
-                            hits.append((d,t,xx,yy))
-                            #self.hit(xx,yy,t,s)
-                        x += tw
-                    y += th
-                
-                hits.sort()    
-                #if len(hits) > 0: print self.frame,hits
-                for d,t,xx,yy in hits:
-                    self.hit(xx,yy,t,s)
+        #first move along x only, then along y
+        rect.y = _rect.y
+        rect.h = _rect.h
+        for d,xx,yy,t in self._tilehits_in(s,rect,tw,th,layer):
+            self.hit(xx,yy,t,s)
+        
+        #switching directions...
+        _rect.x = rect.x
+        _rect.w = rect.w
+        rect.y = recty
+        rect.h = recth
+        for d,xx,yy,t in self._tilehits_in(s,rect,tw,th,layer):
+            self.hit(xx,yy,t,s)
 
-                #done with loops
-                _rect.x = _rectx
-                _rect.y = _recty
+        #done with loops
+        _rect.x = _rectx
+        _rect.y = _recty
+    
+    def _tilehits_in(self,s,rect,tw,th,layer):
+        #the tiles under rect that s can hit, nearest first
+        tiles = self.tiles
+        groups = s.groups
+        cx2,cy2 = 2*rect.centerx,2*rect.centery
+        hits = []
+        for yy in range(rect.top//th,(rect.bottom-1)//th+1):
+            row = layer[yy]
+            dy = cy2-(2*yy*th+th)
+            for xx in range(rect.left//tw,(rect.right-1)//tw+1):
+                t = tiles[row[xx]]
+                if (groups & t.agroups)!=0:
+                    #doubled coordinates, so the distances stay exact integers
+                    dx = cx2-(2*xx*tw+tw)
+                    hits.append((dx*dx+dy*dy,xx,yy,t))
+        hits.sort(key=lambda h: h[:3])
+        return hits
 
 
     def loop_spritehits(self):
-        as = self.sprites[:]
-        
-        groups = {}
-        for n in range(0,31):
-            groups[1<<n] = []
-        for s in as:
-            g = s.groups
-            n = 1
-            while g:
-                if (g&1)!=0: groups[n].append(s)
-                g >>= 1
-                n <<= 1
-                
-        for s in as:
+        sprites = self.sprites[:]
+        
+        if self._hash is None or self._hash.size != self.hash_size:
+            self._hash = _SpriteHash(self.hash_size)
+        self._hash.sync(sprites)
+        near,update = self._hash.near,self._hash.update
+        order = dict((s,n) for n,s in enumerate(sprites))
+        groups = dict((s,s.groups) for s in sprites)
+        
+        def candidates(s,after=-1):
+            rect,agroups = s.rect,s.agroups
+            hits = [b for b in near(s) if b is not s and order[b] > after
+                and (agroups & b.groups)!=0 and rect.colliderect(b.rect)]
+            hits.sort(key=order.__getitem__)
+            return hits
+        
+        #hits are reported as if every sprite was tested against each of
+        #the groups it can hit, in order of group bit and then of sprite,
+        #but only sprites in the same cells are tested.  A hit handler may
+        #move s or b, they are rehashed after the call and the sprites
+        #left to test are looked up again.
+        for s in sprites:
             if s.agroups!=0:
-                rect1,rect2 = s.rect,Rect(s.rect)
-                #if rect1.centerx < 320: rect2.x += 640
-                #else: rect2.x -= 640
+                hits = candidates(s)
+                if not hits: continue
+                stale = False
                 g = s.agroups
                 n = 1
-                while g:
+                while g and n < 1<<31:
                     if (g&1)!=0:
-                        for b in groups[n]:    
-                            if (s != b and (s.agroups & b.groups)!=0
+                        if stale: hits,stale = candidates(s),False
+                        i = 0
+                        while i < len(hits):
+                            b = hits[i]
+                            i += 1
+                            if ((groups[b] & n)!=0 and (s.agroups & b.groups)!=0
                                     and s.rect.colliderect(b.rect)):
+                                r1,r2 = Rect(s.rect),Rect(b.rect)
                                 s.hit(self,s,b)
-
+                                if s.rect != r1 or b.rect != r2:
+                                    update(s)
+                                    update(b)
+                                    hits[i:] = candidates(s,order[b])
+                                    stale = True
                     g >>= 1
                     n <<= 1
 
@@ -7,12 +7,13 @@ import os
 from random import *
 
 import pygame
-from configobj import ConfigObj
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
 from pygame.locals import *
 
+import config
+from batch import BACKGROUNDS, ICONS, WHITE, QuadBatch
 from blockfield import *
 from blocks import *
 from eit_constants import *
@@ -22,9 +23,70 @@ def glutBitmapCharacter(*args):
     pass
 
 
+### Everything a player can do, the same for every player whatever the keys.
+### netplay sends an action as its index in this tuple.
+ACTIONS = ("Down", "Left", "Right", "CW", "CCW", "Drop", "Anti", "Target", "Special")
+
+
+def template(rows):
+    """Compile (y, text) rows into (y, fill, clear) row masks.  In text "#" is
+    a new part, "." a cell that is emptied and " " a cell left as it is."""
+    masks = []
+    for y, text in rows:
+        fill = sum(1 << x for x, c in enumerate(text) if c == "#")
+        clear = sum(1 << x for x, c in enumerate(text) if c == ".")
+        masks.append((y, fill, clear))
+    return tuple(masks)
+
+
+### The rows the Stair, Ring and Castle specials build on the target's field,
+### added one at a time from the first
+STAIR = template(
+    [(22, "#.        ")]
+    + [(22 - x, " " * (x - 1) + ".#." + " " * (8 - x)) for x in range(1, 9)]
+    + [(13, "        .#")]
+)
+RING = template(
+    [
+        (22, "   ....   "),
+        (21, " ..####.. "),
+        (20, ".##....##."),
+        (19, ".#.    .#."),
+        (18, "#.      .#"),
+        (17, "#.      .#"),
+        (16, "#.      .#"),
+        (15, "#.      .#"),
+        (14, ".#.    .#."),
+        (13, ".##....##."),
+        (12, " ..####.. "),
+        (11, "   ....   "),
+    ]
+)
+CASTLE = template(
+    [
+        (22, "  ######  "),
+        (21, "  ### ##  "),
+        (20, "  ### ##  "),
+        (19, "  # ####  "),
+        (18, "  # ####  "),
+        (17, "  #### #  "),
+        (16, "  #### #  "),
+        (15, "  ## ###  "),
+        (14, "  ## ###  "),
+        (13, " ######## "),
+        (12, " ######## "),
+        (11, " ## ## ## "),
+    ]
+)
+FULL_ROW = (1 << 10) - 1
+
+
 class PlayerField:
     """Player class. Holds info about a player."""
 
+    ### Post a GameOver event on game over, netplay reports it itself
+    post_gameover = True
+
     def __init__(self, dm, id, name, px, py):
 
         self.dm = dm
@@ -64,7 +126,7 @@ class PlayerField:
         self.load_controls()
 
     def load_controls(self):
-        profiles = ConfigObj("profiles.cfg")
+        profiles = config.profiles().data
         if self.name in profiles:
             self.left = int(profiles[self.name]["Left"])
             self.right = int(profiles[self.name]["Right"])
@@ -115,6 +177,10 @@ class PlayerField:
             self.drop = K_KP_ENTER
             self.use_anti = K_KP_DIVIDE
             self.change_target = K_KP_MULTIPLY
+        else:
+            ### No keys left, a player past the fourth needs a profile
+            self.left = self.right = self.cw = self.ccw = None
+            self.down = self.drop = self.use_anti = self.change_target = None
 
     def do_score(self, lines):
 
@@ -165,28 +231,19 @@ class PlayerField:
 
             elif special_block.type == "Stair":
                 if self.target is not None:
-                    bp = choice(STANDARD_PARTS)(self.dm)
-                    self.target.lines_to_add.append((22, [(0, bp), (1, None)]))
-
-                    for x in range(1, 9):
-                        bp = choice(STANDARD_PARTS)(self.dm)
-                        self.target.lines_to_add.append(
-                            (22 - x, [(x - 1, None), (x, bp), (x + 1, None)])
-                        )
-
-                    bp = choice(STANDARD_PARTS)(self.dm)
-                    self.target.lines_to_add.append((13, [(8, None), (9, bp)]))
+                    self.target.lines_to_add += self.rows(STAIR)
             elif special_block.type == "Fill":
                 if self.target is not None:
                     for y in range(22, 12, -1):
-                        bps = [None]
+                        kinds = [None]
                         for i in range(9):
-                            bps.append(choice(STANDARD_PARTS)(self.dm))
-                        shuffle(bps)
-                        line = []
-                        for bp, x in zip(bps, range(10)):
-                            line.append((x, bp))
-                        self.target.lines_to_add.append((y, line))
+                            kinds.append(choice(STANDARD_PARTS))
+                        shuffle(kinds)
+                        hole = 1 << kinds.index(None)
+                        kinds.remove(None)
+                        self.target.lines_to_add.append(
+                            (y, FULL_ROW & ~hole, hole, tuple(kinds))
+                        )
             elif special_block.type == "Rumble":
                 if self.target is not None:
                     self.target.rumbles = 5
@@ -194,8 +251,8 @@ class PlayerField:
             elif special_block.type == "Inverse":
                 self.dm.specialsounds["Inverse"].play()
                 if self.target is not None:
-                    self.target.field.effects["Inverse"] = BlockPartInverse(
-                        self.target.dm, 0, 1
+                    self.target.field.set_effect(
+                        "Inverse", BlockPartInverse(self.target.dm, 0, 1)
                     )
             elif special_block.type == "Switch":
                 self.dm.specialsounds["Switch"].play()
@@ -212,6 +269,10 @@ class PlayerField:
                         self.target.field.special_block,
                         self.field.special_block,
                     )
+                    self.field.mark_all()
+                    self.target.field.mark_all()
+                    self.field.rehash()
+                    self.target.field.rehash()
                     self.rumbles = 0
                     self.rumbleblocks = []
                     self.target.rumbles = 0
@@ -225,20 +286,20 @@ class PlayerField:
             elif special_block.type == "Mini":
                 self.dm.specialsounds["Mini"].play()
                 if self.target is not None:
-                    self.target.field.effects["Mini"] = BlockPartMini(
-                        self.target.dm, 1, 1
+                    self.target.field.set_effect(
+                        "Mini", BlockPartMini(self.target.dm, 1, 1)
                     )
             elif special_block.type == "Blink":
                 self.dm.specialsounds["Blink"].play()
                 if self.target is not None:
-                    self.target.field.effects["Blink"] = BlockPartBlink(
-                        self.target.dm, 2, 1
+                    self.target.field.set_effect(
+                        "Blink", BlockPartBlink(self.target.dm, 2, 1)
                     )
             elif special_block.type == "Blind":
                 self.dm.specialsounds["Blind"].play()
                 if self.target is not None:
-                    self.target.field.effects["Blind"] = BlockPartBlind(
-                        self.target.dm, 3, 1
+                    self.target.field.set_effect(
+                        "Blind", BlockPartBlind(self.target.dm, 3, 1)
                     )
             elif special_block.type == "Background":
                 self.dm.specialsounds["Background"].play()
@@ -258,8 +319,8 @@ class PlayerField:
             elif special_block.type == "Trans":
                 self.dm.specialsounds["Trans"].play()
                 if self.target is not None:
-                    self.target.field.effects["Trans"] = BlockPartTrans(
-                        self.target.dm, 4, 1
+                    self.target.field.set_effect(
+                        "Trans", BlockPartTrans(self.target.dm, 4, 1)
                     )
             elif special_block.type == "Clear":
                 self.dm.specialsounds["Clear"].play()
@@ -274,12 +335,14 @@ class PlayerField:
             elif special_block.type == "SZ":
                 self.dm.specialsounds["SZ"].play()
                 if self.target is not None:
-                    self.target.field.effects["SZ"] = BlockPartSZ(self.target.dm, 5, 1)
+                    self.target.field.set_effect(
+                        "SZ", BlockPartSZ(self.target.dm, 5, 1)
+                    )
             elif special_block.type == "Color":
                 self.dm.specialsounds["Color"].play()
                 if self.target is not None:
-                    self.target.field.effects["Color"] = BlockPartColor(
-                        self.target.dm, 6, 1
+                    self.target.field.set_effect(
+                        "Color", BlockPartColor(self.target.dm, 6, 1)
                     )
             elif special_block.type == "Ring":
                 if self.target is not None:
@@ -289,284 +352,31 @@ class PlayerField:
                     self.target.field.clear_field()
                     self.target.lines_to_add += self.castle()
 
-    def castle(self):
-        lines = []
-        lines.append(
-            (
-                22,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-
-        lines.append(
-            (
-                21,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        lines.append(
-            (
-                20,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-
-        lines.append(
-            (
-                19,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        lines.append(
-            (
-                18,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-
-        lines.append(
-            (
-                17,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        lines.append(
-            (
-                16,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-
-        lines.append(
-            (
-                15,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        lines.append(
-            (
-                14,
-                [
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
+    def rows(self, template, kind=None):
+        """The rows of a template for lines_to_add, as (y, fill, clear,
+        kinds) with the kind of each new part, of random standard kinds if
+        kind is None.  The parts are only made when a row is added."""
+        rows = []
+        for y, fill, clear in template:
+            n = len(MASK_BITS[fill])
+            if kind is None:
+                kinds = tuple(choice(STANDARD_PARTS) for i in range(n))
+            else:
+                kinds = (kind,) * n
+            rows.append((y, fill, clear, kinds))
+        return rows
 
-        lines.append(
-            (
-                13,
-                [
-                    (1, BlockPartGrey(self.dm)),
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                    (8, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        lines.append(
-            (
-                12,
-                [
-                    (1, BlockPartGrey(self.dm)),
-                    (2, BlockPartGrey(self.dm)),
-                    (3, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (6, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                    (8, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        lines.append(
-            (
-                11,
-                [
-                    (1, BlockPartGrey(self.dm)),
-                    (2, BlockPartGrey(self.dm)),
-                    (4, BlockPartGrey(self.dm)),
-                    (5, BlockPartGrey(self.dm)),
-                    (7, BlockPartGrey(self.dm)),
-                    (8, BlockPartGrey(self.dm)),
-                ],
-            )
-        )
-        return lines
+    def castle(self):
+        return self.rows(CASTLE, BlockPartGrey)
 
     def ring(self):
-        lines = []
-        lines.append((22, [(3, None), (4, None), (5, None), (6, None)]))
-        lines.append(
-            (
-                21,
-                [
-                    (1, None),
-                    (2, None),
-                    (3, choice(STANDARD_PARTS)(self.dm)),
-                    (4, choice(STANDARD_PARTS)(self.dm)),
-                    (5, choice(STANDARD_PARTS)(self.dm)),
-                    (6, choice(STANDARD_PARTS)(self.dm)),
-                    (7, None),
-                    (8, None),
-                ],
-            )
-        )
-        lines.append(
-            (
-                20,
-                [
-                    (0, None),
-                    (1, choice(STANDARD_PARTS)(self.dm)),
-                    (2, choice(STANDARD_PARTS)(self.dm)),
-                    (3, None),
-                    (4, None),
-                    (5, None),
-                    (6, None),
-                    (7, choice(STANDARD_PARTS)(self.dm)),
-                    (8, choice(STANDARD_PARTS)(self.dm)),
-                    (9, None),
-                ],
-            )
-        )
-        lines.append(
-            (
-                19,
-                [
-                    (0, None),
-                    (1, choice(STANDARD_PARTS)(self.dm)),
-                    (2, None),
-                    (7, None),
-                    (8, choice(STANDARD_PARTS)(self.dm)),
-                    (9, None),
-                ],
-            )
-        )
-        for y in range(18, 14, -1):
-            lines.append(
-                (
-                    y,
-                    [
-                        (0, choice(STANDARD_PARTS)(self.dm)),
-                        (1, None),
-                        (8, None),
-                        (9, choice(STANDARD_PARTS)(self.dm)),
-                    ],
-                )
-            )
-        lines.append(
-            (
-                14,
-                [
-                    (0, None),
-                    (1, choice(STANDARD_PARTS)(self.dm)),
-                    (2, None),
-                    (7, None),
-                    (8, choice(STANDARD_PARTS)(self.dm)),
-                    (9, None),
-                ],
-            )
-        )
-        lines.append(
-            (
-                13,
-                [
-                    (0, None),
-                    (1, choice(STANDARD_PARTS)(self.dm)),
-                    (2, choice(STANDARD_PARTS)(self.dm)),
-                    (3, None),
-                    (4, None),
-                    (5, None),
-                    (6, None),
-                    (7, choice(STANDARD_PARTS)(self.dm)),
-                    (8, choice(STANDARD_PARTS)(self.dm)),
-                    (9, None),
-                ],
-            )
-        )
-        lines.append(
-            (
-                12,
-                [
-                    (1, None),
-                    (2, None),
-                    (3, choice(STANDARD_PARTS)(self.dm)),
-                    (4, choice(STANDARD_PARTS)(self.dm)),
-                    (5, choice(STANDARD_PARTS)(self.dm)),
-                    (6, choice(STANDARD_PARTS)(self.dm)),
-                    (7, None),
-                    (8, None),
-                ],
-            )
-        )
-        lines.append((11, [(3, None), (4, None), (5, None), (6, None)]))
-        return lines
+        return self.rows(RING)
 
     def handle_specials(self):
         if self.lines_to_add != []:
             self.dm.specialsounds["Stair"].play()
-            y, line = self.lines_to_add.pop(0)
-            for x, bp in line:
-                if bp is not None:
-                    self.field.insert_bp((x, y), bp)
-                else:
-                    self.field.remove_bp((x, y))
+            y, fill, clear, kinds = self.lines_to_add.pop(0)
+            self.field.apply_row(y, fill, clear, [kind(self.dm) for kind in kinds])
         if self.rumbles > 0:
             self.dm.specialsounds["Rumble"].play()
             for rb in self.rumbleblocks:
@@ -576,10 +386,7 @@ class PlayerField:
                     pass
                 else:
                     if self.field.blockparts[ny][nx] is None:
-                        self.field.blockparts[rb.y][rb.x] = None
-                        self.field.blockparts[ny][nx] = rb
-                        rb.x = nx
-                        rb.y = ny
+                        self.field.shake_bp(rb, nx, ny)
             self.rumbles -= 1
             try:
                 if random() > 0.1:
@@ -589,7 +396,11 @@ class PlayerField:
 
     def do_gameover(self):
         self.dm.gameoversound.play()
-        pygame.event.post(pygame.event.Event(USEREVENT, utype="GameOver", player=self))
+        ### A headless simulation has no event queue, it checks self.gameover
+        if self.post_gameover and pygame.display.get_init():
+            pygame.event.post(
+                pygame.event.Event(USEREVENT, utype="GameOver", player=self)
+            )
         # self.dm.gameover_players.append(self)
         self.gameover = True
 
@@ -600,23 +411,15 @@ class PlayerField:
                 self.do_gameover()
             return False
         if dir == "Down":
-            self.field.currentblock.move(0, 1)
-            if not self.field.in_valid_position(self.field.currentblock):
-                self.field.currentblock.move(0, -1)
+            if not self.field.move_block(0, 1):
                 self.field.place_currentblock()
             else:
                 return False
         elif dir == "Left":
-            self.field.currentblock.move(-1, 0)
-            if not self.field.in_valid_position(self.field.currentblock):
-                self.field.currentblock.move(1, 0)
-            else:
+            if self.field.move_block(-1, 0):
                 return False
         elif dir == "Right":
-            self.field.currentblock.move(1, 0)
-            if not self.field.in_valid_position(self.field.currentblock):
-                self.field.currentblock.move(-1, 0)
-            else:
+            if self.field.move_block(1, 0):
                 return False
         return True
 
@@ -631,7 +434,70 @@ class PlayerField:
         if self.target is self:
             self.target = None
 
+    def actions(self, events):
+        """Translate the key presses in events to this player's actions"""
+        keys = (
+            (self.down, "Down"),
+            (self.left, "Left"),
+            (self.right, "Right"),
+            (self.cw, "CW"),
+            (self.ccw, "CCW"),
+            (self.drop, "Drop"),
+            (self.use_anti, "Anti"),
+            (self.change_target, "Target"),
+            (K_y, "Special"),
+        )
+        actions = []
+        for event in events:
+            if event.type == KEYDOWN:
+                for key, action in keys:
+                    if event.key == key:
+                        actions.append(action)
+                        break
+        return actions
+
+    def do_action(self, action):
+        if action == "Down":
+            self.move_block("Down")
+        elif action == "Left":
+            if self.field.effects["Inverse"] is not None:
+                self.move_block("Right")
+            else:
+                self.move_block("Left")
+        elif action == "Right":
+            if self.field.effects["Inverse"] is not None:
+                self.move_block("Left")
+            else:
+                self.move_block("Right")
+        elif action == "CW":
+            if self.field.effects["Inverse"] is not None:
+                self.field.rotate_block("ccw")
+            else:
+                self.field.rotate_block("cw")
+        elif action == "CCW":
+            if self.field.effects["Inverse"] is not None:
+                self.field.rotate_block("cw")
+            else:
+                self.field.rotate_block("ccw")
+        elif action == "Drop":
+            self.dropping = True
+            self.droptime = 0
+        elif action == "Anti":
+            if self.antidotes > 0:
+                self.dm.specialsounds["Anti"].play()
+                for k in self.field.effects:
+                    self.field.set_effect(k, None)
+                self.antidotes -= 1
+        elif action == "Target":
+            self.next_target()
+        elif action == "Special":
+            self.field.spawn_special()
+
     def update(self, events, frametime):
+        self.step(self.actions(events), frametime)
+
+    def step(self, actions, frametime):
+        """Advance frametime ms, doing actions (see ACTIONS) first"""
 
         if self.gameover:
             return
@@ -644,42 +510,8 @@ class PlayerField:
         if self.packettime > 0:
             self.packettime -= frametime
 
-        for event in events:
-            if event.type == KEYDOWN and event.key == self.down:
-                self.move_block("Down")
-            elif event.type == KEYDOWN and event.key == self.left:
-                if self.field.effects["Inverse"] is not None:
-                    self.move_block("Right")
-                else:
-                    self.move_block("Left")
-            elif event.type == KEYDOWN and event.key == self.right:
-                if self.field.effects["Inverse"] is not None:
-                    self.move_block("Left")
-                else:
-                    self.move_block("Right")
-            elif event.type == KEYDOWN and event.key == self.cw:
-                if self.field.effects["Inverse"] is not None:
-                    self.field.rotate_block("ccw")
-                else:
-                    self.field.rotate_block("cw")
-            elif event.type == KEYDOWN and event.key == self.ccw:
-                if self.field.effects["Inverse"] is not None:
-                    self.field.rotate_block("cw")
-                else:
-                    self.field.rotate_block("ccw")
-            elif event.type == KEYDOWN and event.key == self.drop:
-                self.dropping = True
-                self.droptime = 0
-            elif event.type == KEYDOWN and event.key == self.use_anti:
-                if self.antidotes > 0:
-                    self.dm.specialsounds["Anti"].play()
-                    for k, v in self.field.effects.items():
-                        self.field.effects[k] = None
-                    self.antidotes -= 1
-            elif event.type == KEYDOWN and event.key == self.change_target:
-                self.next_target()
-            elif event.type == KEYDOWN and event.key == K_y:
-                self.field.spawn_special()
+        for action in actions:
+            self.do_action(action)
 
         ### FPS-safe block down
         while self.cstime > self.downtime and not self.dropping:
@@ -741,24 +573,71 @@ class PlayerField:
             self.spawntime = 0
 
     def draw(self):
+        draw_players([self])
+
+    def draw_batch(self, batch):
+        """Add the quads of the info box and the field to batch"""
+        color = WHITE
         if self.gameover:
-            glColor(0.7, 0.7, 0.7)
+            color = (0.7, 0.7, 0.7, 1.0)
+
+        batch.add(
+            BACKGROUNDS,
+            self.dm.textures["background_info"],
+            self.px,
+            self.py + 536,
+            self.px + 248,
+            self.py + 736,
+            0.0,
+            1.0,
+            0.96875,
+            1 - 0.78125,
+            color,
+        )
 
-        glBindTexture(GL_TEXTURE_2D, self.dm.textures["background_info"])
-        glLoadIdentity()
-        glTranslated(self.px, self.py + 536, 0.0)
-        glBegin(GL_QUADS)
-        glTexCoord2d(0.0, 1.0)
-        glVertex2d(0.0, 0.0)
-        glTexCoord2d(0.96875, 1.0)
-        glVertex2d(248.0, 0.0)
-        glTexCoord2d(0.96875, 1 - 0.78125)
-        glVertex2d(248.0, 200.0)
-        glTexCoord2d(0.0, 1 - 0.78125)
-        glVertex2d(0.0, 200.0)
-        glEnd()
-
-        ### Display some text
+        special = self.dm.textures["special"]
+        ### Packets
+        if self.packettime > 0:
+            s = self.packettime * 1.0 / PACKET_TIME
+            x = self.px + 155
+            for y in range(int(s * 4.0 + 0.99)):
+                y = self.py + 677 - y * 24
+                batch.add(
+                    ICONS,
+                    special,
+                    x - 12.0,
+                    y - 12.0,
+                    x + 12.0,
+                    y + 12.0,
+                    7 / 22.0 * 0.515625,
+                    1.0,
+                    8 / 22.0 * 0.515625,
+                    0.25,
+                    color,
+                )
+
+        ### Antidotes
+        for x in range(self.antidotes):
+            x = self.px + 27 + 24 * x
+            y = self.py + 669
+            batch.add(
+                ICONS,
+                special,
+                x - 12.0,
+                y,
+                x + 12.0,
+                y + 24.0,
+                13 / 22.0 * 0.515625,
+                1.0,
+                14 / 22.0 * 0.515625,
+                0.25,
+                color,
+            )
+        self.field.draw_batch(batch, color)
+
+    def draw_text(self):
+        if self.gameover:
+            glColor(0.7, 0.7, 0.7)
         glLoadIdentity()
         ### Name
         glRasterPos2d(self.px + 10, self.py + 560)
@@ -781,40 +660,37 @@ class PlayerField:
         glRasterPos2d(self.px + 10, self.py + 650)
         for c in "Level: " + str(self.level):
             glutBitmapCharacter(GLUT_BITMAP_HELVETICA_18, ord(c))
+        glColor(1, 1, 1)
 
-        ### Packets
-        if self.packettime > 0:
-            s = self.packettime * 1.0 / PACKET_TIME
-            glBindTexture(GL_TEXTURE_2D, self.dm.textures["special"])
-            for y in range(int(s * 4.0 + 0.99)):
-                glLoadIdentity()
-                glTranslated(self.px + 155, self.py + 677 - y * 24, 0.0)
-
-                glBegin(GL_QUADS)
-                glTexCoord2d(7 / 22.0 * 0.515625, 1.0)
-                glVertex2d(-12.0, -12.0)
-                glTexCoord2d(8 / 22.0 * 0.515625, 1.0)
-                glVertex2d(12.0, -12.0)
-                glTexCoord2d(8 / 22.0 * 0.515625, 0.25)
-                glVertex2d(12.0, 12.0)
-                glTexCoord2d(7 / 22.0 * 0.515625, 0.25)
-                glVertex2d(-12.0, 12.0)
-                glEnd()
 
-        ### Antidotes
-        for x in range(self.antidotes):
-            glBindTexture(GL_TEXTURE_2D, self.dm.textures["special"])
-            glLoadIdentity()
-            glTranslated(self.px + 27 + 24 * x, self.py + 669, 0.0)
-            glBegin(GL_QUADS)
-            glTexCoord2d(13 / 22.0 * 0.515625, 1.0)
-            glVertex2d(-12.0, 0.0)
-            glTexCoord2d(14 / 22.0 * 0.515625, 1.0)
-            glVertex2d(12.0, 0.0)
-            glTexCoord2d(14 / 22.0 * 0.515625, 0.25)
-            glVertex2d(12.0, 24 * 1.0)
-            glTexCoord2d(13 / 22.0 * 0.515625, 0.25)
-            glVertex2d(-12.0, 24 * 1.0)
-            glEnd()
-        self.field.draw()
-        glColor(1, 1, 1)
+class BotField(PlayerField):
+    """A player that presses random keys, for bot exhibitions"""
+
+    ### Key presses per second
+    rate = 5.0
+
+    def __init__(self, dm, id, name, px, py):
+        PlayerField.__init__(self, dm, id, name, px, py)
+        self.brain = Random(name)
+
+    def load_controls(self):
+        self.default_controls()
+
+    def actions(self, events):
+        return []
+
+    def update(self, events, frametime):
+        actions = []
+        if self.brain.random() < self.rate * frametime / 1000.0:
+            actions.append(self.brain.choice(ACTIONS[:6]))
+        self.step(actions, frametime)
+
+
+def draw_players(players):
+    """Draw players, the quads of all their fields in one batch"""
+    batch = QuadBatch()
+    for player in players:
+        player.draw_batch(batch)
+    batch.draw()
+    for player in players:
+        player.draw_text()
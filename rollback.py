@@ -0,0 +1,198 @@
+"""Rollback for network play.
+
+Instead of waiting for the other players like netplay.Lockstep, a Rollback
+session guesses that a remote player did nothing in the ticks it has not
+heard about yet and keeps simulating.  Before every tick it saves a snapshot
+of the match.  When an input turns out to differ from the guess, it restores
+the snapshot of that tick and simulates up to the present again, all before
+the next frame is drawn.
+
+A snapshot covers the PlayerFields and their BlockFields, including what
+players do to each other: fields swapped by Switch, the lines_to_add queue
+filled by Stair, Fill, Ring and Castle, packets, rumbles and effects.  It
+also covers the random state of the match.  Block parts are copied field by
+field without calling their constructors, which would compile display lists.
+"""
+
+import netplay
+
+### Most ticks the simulation may run ahead of the last tick with all inputs
+MAX_ROLLBACK = 10
+
+
+class _Silent:
+    def play(self, *args, **kwargs):
+        pass
+
+
+def _bp(bp, memo):
+    """Copy a block part, once per snapshot, so shared references stay shared"""
+    if bp is None:
+        return None
+    c = memo.get(id(bp))
+    if c is None:
+        c = object.__new__(bp.__class__)
+        c.__dict__.update(bp.__dict__)
+        memo[id(bp)] = c
+    return c
+
+
+def _block(block, memo):
+    if block is None:
+        return None
+    c = object.__new__(block.__class__)
+    c.__dict__.update(block.__dict__)
+    c.blockparts = [_bp(bp, memo) for bp in block.blockparts]
+    return c
+
+
+def _field_state(d, memo):
+    d = dict(d)
+    d["blockparts"] = [[_bp(bp, memo) for bp in row] for row in d["blockparts"]]
+    d["blockparts_list"] = [_bp(bp, memo) for bp in d["blockparts_list"]]
+    d["special_block"] = _bp(d["special_block"], memo)
+    d["effects"] = dict((k, _bp(v, memo)) for k, v in d["effects"].items())
+    d["currentblock"] = _block(d["currentblock"], memo)
+    d["nextblock"] = _block(d["nextblock"], memo)
+    d["dirty"] = set(d["dirty"])
+    return d
+
+
+def _player_state(d, memo):
+    d = dict(d)
+    d["lines_to_add"] = list(d["lines_to_add"])
+    d["rumbleblocks"] = [_bp(bp, memo) for bp in d["rumbleblocks"]]
+    return d
+
+
+def snapshot(players):
+    """Return a copy of the state of players, see restore"""
+    memo = {}
+    snap = []
+    for p in players:
+        d = _player_state(p.__dict__, memo)
+        d["field"] = _field_state(p.field.__dict__, memo)
+        snap.append(d)
+    return snap
+
+
+def restore(players, snap):
+    """Put players back in the state of snap.
+
+    The PlayerField and BlockField objects are kept, so references to them
+    stay valid, and snap can be restored again later.
+    """
+    memo = {}
+    for p, d in zip(players, snap):
+        field = p.field
+        d = _player_state(d, memo)
+        field.__dict__.clear()
+        field.__dict__.update(_field_state(d["field"], memo))
+        field.mark_all()
+        d["field"] = field
+        p.__dict__.clear()
+        p.__dict__.update(d)
+
+
+def save_match(match):
+    return (match.tick, match.random_state, snapshot(match.players))
+
+
+def load_match(match, state):
+    match.tick, match.random_state, snap = state
+    restore(match.players, snap)
+
+
+class _Muted:
+    """Silence the sounds of dm while ticks are simulated again"""
+
+    def __init__(self, dm):
+        self.dm = dm
+
+    def __enter__(self):
+        dm = self.dm
+        self.saved = (dm.placesound, dm.gameoversound, dm.specialsounds)
+        silent = _Silent()
+        dm.placesound = dm.gameoversound = silent
+        dm.specialsounds = dict((k, silent) for k in dm.specialsounds)
+
+    def __exit__(self, *args):
+        dm = self.dm
+        dm.placesound, dm.gameoversound, dm.specialsounds = self.saved
+
+
+class Rollback(netplay.Lockstep):
+    """Inputs of every player, with remote inputs guessed until they arrive.
+
+    Used like netplay.Lockstep, but ready() only holds the match back when it
+    is window ticks ahead of the inputs.  The guess for a missing input is
+    that the player did nothing, actions are single key presses so repeating
+    the last one would be wrong far more often.
+    """
+
+    def __init__(self, players, local, delay=netplay.INPUT_DELAY, window=MAX_ROLLBACK):
+        netplay.Lockstep.__init__(self, players, local, delay)
+        self.window = window
+        ### All inputs are known for the ticks before confirmed
+        self.confirmed = delay
+        self.used = {}
+        self.states = {}
+        self.rollback = None
+        self.rollbacks = 0
+
+    def receive(self, tick, player, actions):
+        if tick < self.confirmed:
+            raise netplay.NetplayError("input for tick %d arrived twice" % tick)
+        self.inputs.setdefault(tick, [None] * self.players)[player] = actions
+        used = self.used.get(tick)
+        if used is not None and used[player] != actions:
+            if self.rollback is None or tick < self.rollback:
+                self.rollback = tick
+        inputs = self.inputs.get(self.confirmed)
+        while inputs is not None and None not in inputs:
+            self.confirmed += 1
+            inputs = self.inputs.get(self.confirmed)
+
+    def ready(self):
+        return self.tick < self.confirmed + self.window
+
+    def final(self):
+        if self.rollback is not None:
+            return min(self.confirmed, self.rollback)
+        return self.confirmed
+
+    def guess(self, tick):
+        """The inputs of tick, nothing for the players not heard from yet"""
+        if tick < self.delay:
+            return [[]] * self.players
+        inputs = self.inputs.get(tick, [None] * self.players)
+        return [[] if a is None else a for a in inputs]
+
+    def _step(self, match):
+        tick = match.tick
+        self.states[tick] = save_match(match)
+        self.used[tick] = inputs = self.guess(tick)
+        match.step(inputs)
+        self.record(match)
+
+    def settle(self, match):
+        if self.rollback is None:
+            return
+        present = match.tick
+        load_match(match, self.states[self.rollback])
+        self.rollback = None
+        self.rollbacks += 1
+        with _Muted(match.dm):
+            while match.tick < present:
+                self._step(match)
+
+    def run(self, match):
+        self.settle(match)
+        self._step(match)
+        self.tick = match.tick
+
+        ### Forget what can no longer change
+        for old in [t for t in self.states if t < self.confirmed]:
+            del self.states[old]
+            del self.used[old]
+            self.inputs.pop(old, None)
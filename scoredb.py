@@ -0,0 +1,253 @@
+"""SQLite backed scoretable with per-match history.
+
+Every finished match is stored as one row in ``matches`` plus one row per
+player in ``results``.  The per-player aggregates shown in the highscore
+dialog live in ``players`` and are updated incrementally in the same
+transaction, so a crash mid-write never leaves a half written table behind.
+"""
+
+import pickle
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    matches INTEGER NOT NULL DEFAULT 0,
+    score INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0,
+    max_level INTEGER NOT NULL DEFAULT 0,
+    rank_points INTEGER NOT NULL DEFAULT 0,
+    winns INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS players_rank ON players (rank_points DESC, name);
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    played INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    name TEXT NOT NULL,
+    won INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    rank_points INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_name ON results (name, match_id);
+"""
+
+COLUMNS = "name, matches, score, lines, max_level, rank_points, winns"
+
+
+def _stat(row):
+    """Convert a players row to the dict layout used by Scoretable.stats"""
+    return {
+        "Matches": row[1],
+        "Score": row[2],
+        "Lines": row[3],
+        "Max Level": row[4],
+        "Rank Points": row[5],
+        "Winns": row[6],
+    }
+
+
+class _StatsView:
+    """Read-only mapping of name -> stat dict, backed by the players table"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __contains__(self, name):
+        return self.db.get_stat(name) is not None
+
+    def __getitem__(self, name):
+        stat = self.db.get_stat(name)
+        if stat is None:
+            raise KeyError(name)
+        return stat
+
+    def __iter__(self):
+        for name, _ in self.db.get_list():
+            yield name
+
+    def __len__(self):
+        return self.db.count()
+
+    def items(self):
+        return self.db.get_list()
+
+
+class ScoreDB:
+    """Scoretable stored in an SQLite database.
+
+    Has the same insert_result/get_list interface as eit.Scoretable, plus
+    ranked and paged queries that don't need to load the whole table.
+    """
+
+    def __init__(self, filename="scoretable.db"):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.stats = _StatsView(self)
+
+    def close(self):
+        self.conn.close()
+
+    def count(self):
+        """Number of players in the table"""
+        return self.conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+    def get_stat(self, name):
+        row = self.conn.execute(
+            "SELECT " + COLUMNS + " FROM players WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return _stat(row)
+
+    def get_list(self, offset=0, limit=None):
+        """Return [(name, stat), ...] ordered by rank points, best first.
+
+        offset and limit select a page of the ranking, so the caller only
+        pays for the rows it is going to show.
+        """
+        if limit is None:
+            limit = -1
+        rows = self.conn.execute(
+            "SELECT " + COLUMNS + " FROM players "
+            "ORDER BY rank_points DESC, name LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+        return [(row[0], _stat(row)) for row in rows]
+
+    def get_rank(self, name):
+        """1-based position of name in the ranking, or None if unknown"""
+        row = self.conn.execute(
+            "SELECT rank_points FROM players WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        (rp,) = row
+        (better,) = self.conn.execute(
+            "SELECT COUNT(*) FROM players "
+            "WHERE rank_points > ? OR (rank_points = ? AND name < ?)",
+            (rp, rp, name),
+        ).fetchone()
+        return better + 1
+
+    def get_history(self, name, limit=10):
+        """Return the latest matches of name, newest first"""
+        rows = self.conn.execute(
+            "SELECT r.match_id, m.played, r.won, r.score, r.lines, r.level, "
+            "r.rank_points FROM results r JOIN matches m ON m.id = r.match_id "
+            "WHERE r.name = ? ORDER BY r.match_id DESC LIMIT ?",
+            (name, limit),
+        )
+        return [
+            {
+                "Match": row[0],
+                "Played": row[1],
+                "W": bool(row[2]),
+                "Score": row[3],
+                "Lines": row[4],
+                "Level": row[5],
+                "Rank Points": row[6],
+            }
+            for row in rows
+        ]
+
+    def _rank_points(self, name):
+        row = self.conn.execute(
+            "SELECT rank_points FROM players WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0]
+
+    def _update_player(self, stat, won, rp):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO players (name) VALUES (?)", (stat["Name"],)
+        )
+        self.conn.execute(
+            "UPDATE players SET matches = matches + 1, score = score + ?, "
+            "lines = lines + ?, max_level = MAX(max_level, ?), "
+            "rank_points = rank_points + ?, winns = winns + ? WHERE name = ?",
+            (stat["Score"], stat["Lines"], stat["Level"], rp, int(won), stat["Name"]),
+        )
+
+    def insert_result(self, winner, losers):
+        """Record one match. Same rank point rules as eit.Scoretable"""
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO matches (played) VALUES (?)", (int(time.time()),)
+            )
+            match_id = cur.lastrowid
+            self._update_player(winner, True, 0)
+            won_rp = 0
+            for stat in losers:
+                self._update_player(stat, False, 0)
+                w = self._rank_points(winner["Name"])
+                l = self._rank_points(stat["Name"])
+                ### Calc new rank points
+                if w > l + 5:
+                    rp = 5
+                else:
+                    rp = (w - l) // 2 + 5
+                self.conn.execute(
+                    "UPDATE players SET rank_points = rank_points + ? WHERE name = ?",
+                    (rp, winner["Name"]),
+                )
+                self.conn.execute(
+                    "UPDATE players SET rank_points = rank_points - ? WHERE name = ?",
+                    (rp, stat["Name"]),
+                )
+                won_rp += rp
+                self._insert_row(match_id, stat, False, -rp)
+            self._insert_row(match_id, winner, True, won_rp)
+
+    def _insert_row(self, match_id, stat, won, rp):
+        self.conn.execute(
+            "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                match_id,
+                stat["Name"],
+                int(won),
+                stat["Score"],
+                stat["Lines"],
+                stat["Level"],
+                rp,
+            ),
+        )
+
+    def import_stats(self, stats):
+        """Import the aggregates of an old pickled Scoretable.stats dict"""
+        with self.conn:
+            for name, stat in stats.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO players (" + COLUMNS + ") "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        name,
+                        stat["Matches"],
+                        stat["Score"],
+                        stat["Lines"],
+                        stat["Max Level"],
+                        stat["Rank Points"],
+                        stat["Winns"],
+                    ),
+                )
+
+    def import_pickle(self, filename):
+        """Import a legacy scoretable.dat once, if the database is still empty.
+
+        Returns True if anything was imported.
+        """
+        if self.count() > 0:
+            return False
+        try:
+            with open(filename, "rb") as f:
+                old = pickle.load(f)
+        except Exception:
+            return False
+        self.import_stats(old.stats)
+        return True
@@ -0,0 +1,218 @@
+"""Render seeded game states offscreen and compare them with stored hashes.
+
+Run from the game directory:
+
+    python snapshot.py            check every scene against snapshots.json
+    python snapshot.py --update   store the current hashes as the goldens
+    python snapshot.py --json     print the hashes and times as JSON
+    python snapshot.py --save DIR also write each scene as a PNG
+
+Each scene is a match simulated from a seed, drawn with draw_players into a
+framebuffer object of a surfaceless EGL context, so no window or display is
+needed.  The pixels are hashed and each render is timed, which shows in
+seconds whether a change to the drawing code changed any pixels and what it
+did to the frame time.  Render the scenes with --save before and after a
+change to look at the difference.
+
+The hashes depend on the OpenGL driver, the goldens were made with Mesa's
+software renderer.  Exits with UNAVAILABLE when there is no EGL.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+SNAPSHOT_FILE = "snapshots.json"
+SIZE = (1024, 768)
+### Renders of each scene, the fastest is reported
+REPEAT = 5
+### Exit code when no OpenGL context can be made
+UNAVAILABLE = 77
+
+
+class Unavailable(Exception):
+    pass
+
+
+def open_context(size=SIZE):
+    """Make a surfaceless EGL context current, drawing into an FBO of size"""
+    import ctypes
+
+    try:
+        from OpenGL import EGL, GL
+
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    except Exception as e:
+        raise Unavailable("no EGL: %s" % e)
+    if not display or not EGL.eglInitialize(display, None, None):
+        raise Unavailable("no EGL display")
+    ### Without a matching config, Mesa makes a context with no config
+    config = EGL.EGLConfig()
+    n = EGL.EGLint()
+    attributes = (EGL.EGLint * 3)(
+        EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE
+    )
+    EGL.eglChooseConfig(
+        display, attributes, ctypes.pointer(config), 1, ctypes.pointer(n)
+    )
+    if not EGL.eglBindAPI(EGL.EGL_OPENGL_API):
+        raise Unavailable("no OpenGL API")
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not context or not EGL.eglMakeCurrent(
+        display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context
+    ):
+        raise Unavailable("no surfaceless context")
+    width, height = size
+    GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, GL.glGenFramebuffers(1))
+    GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, GL.glGenRenderbuffers(1))
+    GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_RGBA8, width, height)
+    GL.glFramebufferRenderbuffer(
+        GL.GL_FRAMEBUFFER,
+        GL.GL_COLOR_ATTACHMENT0,
+        GL.GL_RENDERBUFFER,
+        GL.glGetIntegerv(GL.GL_RENDERBUFFER_BINDING),
+    )
+
+
+def simulate(dm, n, ticks, seed):
+    """A match of n players after ticks of seeded random input"""
+    import random
+
+    import netplay
+    from playerfield import ACTIONS
+
+    match = netplay.Match(dm, ["P%d" % i for i in range(n)], seed)
+    rnd = random.Random(seed)
+    for t in range(ticks):
+        match.step(
+            [[rnd.choice(ACTIONS[:6])] if rnd.random() < 0.1 else [] for i in range(n)]
+        )
+    return match.players
+
+
+def scene_start(dm):
+    return simulate(dm, 1, 0, 1)
+
+
+def scene_match(dm):
+    """Four fields mid-game with the effects that change how they're drawn"""
+    from blocks import BlockPartBlind, BlockPartColor, BlockPartMini, BlockPartTrans
+
+    players = simulate(dm, 4, 1500, 12)
+    players[0].field.set_effect("Blind", BlockPartBlind(dm, 3, 1))
+    players[1].field.set_effect("Mini", BlockPartMini(dm, 1, 1))
+    players[2].field.set_effect("Trans", BlockPartTrans(dm, 4, 1))
+    players[2].field.set_effect("Color", BlockPartColor(dm, 6, 1))
+    players[3].packettime = 15000
+    players[3].antidotes = 3
+    players[3].gameover = True
+    return players
+
+
+def scene_crowd(dm):
+    """Nine fields, scaled down to fit"""
+    return simulate(dm, 9, 800, 5)
+
+
+SCENES = [
+    ("start", scene_start),
+    ("match", scene_match),
+    ("crowd", scene_crowd),
+]
+
+
+def render(players, size=SIZE):
+    """Draw players, return the RGBA pixels and the time it took in ms"""
+    from OpenGL import GL
+
+    from eit import resize
+    from layout import grid
+    from playerfield import draw_players
+
+    resize(size, grid(len(players), size)[0])
+    start = time.perf_counter()
+    GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+    draw_players(players)
+    GL.glFinish()
+    ms = (time.perf_counter() - start) * 1000.0
+    pixels = GL.glReadPixels(0, 0, size[0], size[1], GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
+    return pixels, ms
+
+
+def save_png(pixels, filename, size=SIZE):
+    import pygame
+
+    image = pygame.image.frombuffer(pixels, size, "RGBA")
+    pygame.image.save(pygame.transform.flip(image, False, True), filename)
+
+
+def run(save=None, repeat=REPEAT):
+    """Render every scene, return {name: {"hash": ..., "ms": ...}}"""
+    import pygame
+
+    pygame.init()
+    open_context()
+    import eit
+    from datamanager import DataManager
+
+    eit.init()
+    dm = DataManager()
+    dm.load_textures()
+    dm.load_backgrounds()
+    results = {}
+    for name, scene in SCENES:
+        players = scene(dm)
+        digests = set()
+        times = []
+        for i in range(repeat):
+            pixels, ms = render(players)
+            digests.add(hashlib.sha256(pixels).hexdigest())
+            times.append(ms)
+        if len(digests) != 1:
+            raise AssertionError("%s renders differently each time" % name)
+        results[name] = {"hash": digests.pop(), "ms": round(min(times), 3)}
+        if save is not None:
+            save_png(pixels, os.path.join(save, name + ".png"))
+    return results
+
+
+def main(args):
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    save = None
+    if "--save" in args[:-1]:
+        save = args[args.index("--save") + 1]
+    try:
+        results = run(save)
+    except Unavailable as e:
+        print("snapshot: " + str(e))
+        return UNAVAILABLE
+    if "--json" in args:
+        print(json.dumps(results, sort_keys=True))
+        return 0
+    if "--update" in args:
+        with open(SNAPSHOT_FILE, "w") as f:
+            json.dump(
+                dict((k, v["hash"]) for k, v in results.items()),
+                f,
+                indent=4,
+                sort_keys=True,
+            )
+            f.write("\n")
+        return 0
+    with open(SNAPSHOT_FILE) as f:
+        goldens = json.load(f)
+    failed = 0
+    for name, result in sorted(results.items()):
+        ok = goldens.get(name) == result["hash"]
+        failed += not ok
+        print("%-8s %8.2f ms  %s" % (name, result["ms"], "ok" if ok else "CHANGED"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,120 @@
+"""Sound requests collected per frame and played on reserved channels.
+
+The game logic calls play() on the sounds in DataManager wherever something
+happens, which in a busy match means the same sound many times a frame:
+every rumbling field plays "Rumble" every SPECIAL_TIME ms, "Stair" plays
+for each queued line and "Packet" for each cleared line.  Mixing all of
+them makes the mixer glitch.  So the sounds in DataManager are Cues, and
+play() on a Cue only asks the SoundDispatcher to play it.  Once a frame
+flush() plays each requested sound once, skips sounds that played less than
+their interval ago, and plays them on mixer channels reserved for their
+category, so a burst of rumbles can't take the channels of the other
+sounds.
+"""
+
+import pygame
+
+### Shortest time between two plays of the same sound, in ms
+MIN_INTERVAL = 50
+### For the sounds that game logic plays over and over
+REPEAT_INTERVAL = 150
+
+### Mixer channels reserved for each category
+CHANNELS = {
+    "ui": 1,
+    "place": 2,
+    "gameover": 1,
+    "special": 3,
+    "repeat": 2,
+}
+
+### Category of each of DataManager.specialsounds, the rest are "special"
+REPEATING = ("Rumble", "Stair", "Packet")
+
+
+class Cue:
+    """Stands in for a pygame Sound, play() is a request to the dispatcher"""
+
+    def __init__(self, dispatcher, name, sound, category, interval):
+        self.dispatcher = dispatcher
+        self.name = name
+        self.sound = sound
+        self.category = category
+        self.interval = interval
+
+    def play(self, *args, **kwargs):
+        self.dispatcher.request(self)
+
+
+class SoundDispatcher:
+    """Plays the sounds requested since the last flush.
+
+    With enabled False, or without a mixer, requests are dropped and nothing
+    touches pygame.mixer, for simulations without audio.
+    """
+
+    def __init__(self, enabled=True, channels=CHANNELS):
+        self.enabled = enabled and pygame.mixer.get_init() is not None
+        self.pending = {}
+        self.last_played = {}
+        self.played = 0
+        self.dropped = 0
+        self.channels = {}
+        self.started = {}
+        if not self.enabled:
+            return
+        total = sum(channels.values())
+        if pygame.mixer.get_num_channels() < total + 4:
+            pygame.mixer.set_num_channels(total + 4)
+        pygame.mixer.set_reserved(total)
+        first = 0
+        for category, n in channels.items():
+            self.channels[category] = [
+                pygame.mixer.Channel(i) for i in range(first, first + n)
+            ]
+            first += n
+
+    def cue(self, name, sound, category="special", interval=MIN_INTERVAL):
+        return Cue(self, name, sound, category, interval)
+
+    def request(self, cue):
+        if not self.enabled:
+            return
+        if cue.name in self.pending:
+            self.dropped += 1
+        self.pending[cue.name] = cue
+
+    def flush(self, now=None):
+        """Play what was requested since the last call, once per sound"""
+        if not self.pending:
+            return
+        if now is None:
+            now = pygame.time.get_ticks()
+        pending = self.pending
+        self.pending = {}
+        for name, cue in pending.items():
+            last = self.last_played.get(name)
+            if last is not None and now - last < cue.interval:
+                self.dropped += 1
+                continue
+            self.last_played[name] = now
+            self.played += 1
+            channel = self.channel(cue.category, now)
+            if channel is not None:
+                channel.play(cue.sound)
+
+    def channel(self, category, now):
+        """A free channel of category, or the one that started playing first"""
+        channels = self.channels.get(category)
+        if not channels:
+            return None
+        best = None
+        for channel in channels:
+            if not channel.get_busy():
+                best = channel
+                break
+            started = self.started.get(channel, 0)
+            if best is None or started < self.started.get(best, 0):
+                best = channel
+        self.started[best] = now
+        return best
@@ -0,0 +1,435 @@
+"""Spectators for a running match.
+
+A SpectatorServer sends its viewers what changed in the fields of a match,
+not the whole state and not video: the cells that were set or cleared, the
+pose of the falling and the next piece, the effects and the score.
+BlockField keeps track of the cells it changes, so an update costs about as
+much as the changes in it.  A viewer rebuilds the players from these
+messages and draws them with the usual PlayerField.draw.
+
+Show a local or networked game to spectators with
+
+    python eit.py --spectate 7778
+
+and watch it with
+
+    python spectator.py watch HOST:7778
+
+Messages are framed like in netplay.  A viewer first gets SETUP with the
+player names and a FRAME with everything, then a FRAME every UPDATE_TIME ms
+in which something changed.  A FRAME is a player number and a byte of flags
+for every player that changed, each followed by the sections its flags name.
+"""
+
+import argparse
+import asyncio
+import struct
+import sys
+
+from blocks import *
+from eit_constants import PACKET_TIME
+from layout import SCREEN, grid
+from netplay import parse_address, read_message, write_message
+from playerfield import PlayerField, draw_players
+
+PORT = 7778
+### Time between two updates to the viewers, in ms
+UPDATE_TIME = 50
+### Viewers this many bytes behind are dropped, they can connect again
+MAX_BACKLOG = 64 * 1024
+
+SETUP = b"N"
+FRAME = b"F"
+
+PLAYER = struct.Struct("<BB")
+INFO = struct.Struct("<IHHBBBb")
+
+CELLS = 1
+PIECE = 2
+NEXT = 4
+EFFECTS = 8
+INFO_CHANGED = 16
+
+### Cell codes, 0 is an empty cell
+PARTS = [None] + STANDARD_PARTS + [BlockPartGrey] + SPECIAL_PARTS
+CODES = dict((cls, code) for code, cls in enumerate(PARTS) if cls is not None)
+
+### The effects in BlockField.effects, with the slot each is drawn in
+EFFECTS_ORDER = [
+    ("Inverse", BlockPartInverse),
+    ("Mini", BlockPartMini),
+    ("Blink", BlockPartBlink),
+    ("Blind", BlockPartBlind),
+    ("Trans", BlockPartTrans),
+    ("SZ", BlockPartSZ),
+    ("Color", BlockPartColor),
+]
+BLINK = 128
+
+
+def encode_block(block):
+    """A piece as the code of its parts and their positions, 9 bytes"""
+    if block is None:
+        return b"\0"
+    data = bytearray([CODES[block.blockparts[0].__class__]])
+    for bp in block.blockparts:
+        data += struct.pack("<bb", bp.x, bp.y)
+    return bytes(data)
+
+
+def decode_block(dm, data, offset):
+    """Return (block, offset after it) of the piece encoded at offset"""
+    code = data[offset]
+    if code == 0:
+        return None, offset + 1
+    block = Block(dm)
+    for i in range(4):
+        x, y = struct.unpack_from("<bb", data, offset + 1 + 2 * i)
+        block.blockparts.append(PARTS[code](dm, x, y))
+    return block, offset + 9
+
+
+class FieldEncoder:
+    """What the viewers were sent about one player.
+
+    Takes the dirty cells of the player's field, so there can only be one
+    encoder per field.
+    """
+
+    def __init__(self, player, players):
+        self.player = player
+        self.players = players
+        self.cells = bytearray(230)
+        self.piece = self.next = self.effects = self.info = None
+        ### The viewers start from an empty field
+        player.field.mark_all()
+
+    def delta(self):
+        """Return the sections that changed, and remember them as sent"""
+        p = self.player
+        field = p.field
+        flags = 0
+        out = []
+
+        cells = bytearray()
+        for x, y in field.take_dirty():
+            bp = field.blockparts[y][x]
+            code = 0 if bp is None else CODES[bp.__class__]
+            i = y * 10 + x
+            if self.cells[i] != code:
+                self.cells[i] = code
+                cells += bytes((i, code))
+        if cells:
+            flags |= CELLS
+            out.append(bytes((len(cells) // 2,)) + cells)
+
+        piece = encode_block(field.currentblock)
+        if piece != self.piece:
+            flags |= PIECE
+            out.append(piece)
+            self.piece = piece
+
+        nextblock = encode_block(field.nextblock)
+        if nextblock != self.next:
+            flags |= NEXT
+            out.append(nextblock)
+            self.next = nextblock
+
+        effects = self.encode_effects()
+        if effects != self.effects:
+            flags |= EFFECTS
+            out.append(effects)
+            self.effects = effects
+
+        info = self.encode_info()
+        if info != self.info:
+            flags |= INFO_CHANGED
+            out.append(info)
+            self.info = info
+
+        return flags, b"".join(out)
+
+    def keyframe(self):
+        """Return everything sent so far, for a viewer that just joined"""
+        cells = bytearray()
+        for i, code in enumerate(self.cells):
+            if code:
+                cells += bytes((i, code))
+        data = bytes((len(cells) // 2,)) + cells
+        data += self.piece + self.next + self.effects + self.info
+        return CELLS | PIECE | NEXT | EFFECTS | INFO_CHANGED, data
+
+    def encode_effects(self):
+        field = self.player.field
+        mask = 0
+        for i, (name, cls) in enumerate(EFFECTS_ORDER):
+            if field.effects[name] is not None:
+                mask |= 1 << i
+        if field.blink and field.effects["Blink"] is not None:
+            mask |= BLINK
+        backgrounds = sorted(field.dm.backgrounds)
+        background = 0
+        for i, name in enumerate(backgrounds):
+            if field.dm.backgrounds[name] == field.background_tile:
+                background = i
+        return bytes((mask, background))
+
+    def encode_info(self):
+        p = self.player
+        packets = int(p.packettime * 4.0 / PACKET_TIME + 0.99)
+        target = -1
+        if p.target is not None and p.target in self.players:
+            target = self.players.index(p.target)
+        return INFO.pack(
+            p.score, p.level, p.lines, p.gameover, p.antidotes, packets, target
+        )
+
+
+def encode_frame(encoders):
+    """The FRAME payload of what changed for all encoders, b"" if nothing"""
+    data = []
+    for i, encoder in enumerate(encoders):
+        flags, delta = encoder.delta()
+        if flags:
+            data.append(PLAYER.pack(i, flags) + delta)
+    return b"".join(data)
+
+
+def encode_keyframe(encoders):
+    data = []
+    for i, encoder in enumerate(encoders):
+        flags, delta = encoder.keyframe()
+        data.append(PLAYER.pack(i, flags) + delta)
+    return b"".join(data)
+
+
+def apply_frame(dm, players, data):
+    """Apply a FRAME payload to the PlayerFields of a viewer"""
+    offset = 0
+    while offset < len(data):
+        i, flags = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        p = players[i]
+        field = p.field
+        if flags & CELLS:
+            n = data[offset]
+            offset += 1
+            for j in range(n):
+                cell, code = data[offset], data[offset + 1]
+                offset += 2
+                x, y = cell % 10, cell // 10
+                if code:
+                    field.insert_bp((x, y), PARTS[code](dm))
+                else:
+                    field.remove_bp((x, y))
+            field.dirty.clear()
+        if flags & PIECE:
+            block, offset = decode_block(dm, data, offset)
+            field.set_currentblock(block)
+        if flags & NEXT:
+            field.nextblock, offset = decode_block(dm, data, offset)
+        if flags & EFFECTS:
+            mask, background = data[offset], data[offset + 1]
+            offset += 2
+            for j, (name, cls) in enumerate(EFFECTS_ORDER):
+                if not mask & (1 << j):
+                    field.set_effect(name, None)
+                elif field.effects[name] is None:
+                    field.set_effect(name, cls(dm, j, 1))
+            field.blink = 1 if mask & BLINK else 0
+            backgrounds = sorted(dm.backgrounds)
+            if background < len(backgrounds):
+                field.background_tile = dm.backgrounds[backgrounds[background]]
+        if flags & INFO_CHANGED:
+            score, level, lines, gameover, antidotes, packets, target = (
+                INFO.unpack_from(data, offset)
+            )
+            offset += INFO.size
+            p.score = score
+            p.level = level
+            p.lines = lines
+            p.gameover = bool(gameover)
+            p.antidotes = antidotes
+            p.packettime = packets * PACKET_TIME // 4
+            p.target = players[target] if target >= 0 else None
+
+
+class SpectatorServer:
+    """Sends the fields of players to every viewer that connects"""
+
+    def __init__(self, players=()):
+        self.writers = []
+        self.server = None
+        self.sent = 0
+        self.watch(players)
+
+    async def start(self, host="0.0.0.0", port=PORT):
+        """Start listening, return the port"""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    def watch(self, players):
+        """Show players from now on, after a new game was started"""
+        self.players = list(players)
+        self.encoders = [FieldEncoder(p, self.players) for p in self.players]
+        encode_frame(self.encoders)
+        for writer in self.writers:
+            self.send_setup(writer)
+
+    def send_setup(self, writer):
+        names = "\n".join(p.name for p in self.players).encode("utf-8")
+        write_message(writer, SETUP, names)
+        write_message(writer, FRAME, encode_keyframe(self.encoders))
+
+    async def handle(self, reader, writer):
+        self.send_setup(writer)
+        self.writers.append(writer)
+        try:
+            ### Viewers don't send anything, wait for them to hang up
+            while (await read_message(reader))[0] is not None:
+                pass
+        finally:
+            if writer in self.writers:
+                self.writers.remove(writer)
+            writer.close()
+
+    def broadcast(self):
+        """Send what changed since the last call to every viewer"""
+        data = encode_frame(self.encoders)
+        if not data:
+            return
+        for writer in list(self.writers):
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                self.writers.remove(writer)
+                writer.close()
+                continue
+            write_message(writer, FRAME, data)
+            self.sent += len(data) + 3
+
+
+class Spectators:
+    """Drives a SpectatorServer from the game loop in eit.Main, like
+    netplay.NetGame with its own event loop that only runs when called."""
+
+    def __init__(self, port=PORT, host="0.0.0.0"):
+        self.loop = asyncio.new_event_loop()
+        self.server = SpectatorServer()
+        self.port = self.loop.run_until_complete(self.server.start(host, port))
+        self.time = 0
+        print("spectator: listening on port", self.port)
+
+    def watch(self, players):
+        self.server.watch(players)
+        self.time = 0
+
+    def update(self, frametime):
+        self.time += frametime
+        if self.time >= UPDATE_TIME:
+            self.time = 0
+            self.server.broadcast()
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+    def close(self):
+        self.server.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+
+class Viewer:
+    """A connection to a SpectatorServer, keeps players up to date"""
+
+    def __init__(self, dm):
+        self.dm = dm
+        self.players = []
+        self.canvas = None
+        self.closed = False
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+    def setup(self, names):
+        self.players = []
+        self.canvas, positions = grid(len(names))
+        for i, (name, (px, py)) in enumerate(zip(names, positions)):
+            self.players.append(PlayerField(self.dm, i, name, px, py))
+
+    def receive(self, kind, payload):
+        if kind == SETUP:
+            self.setup(payload.decode("utf-8").split("\n"))
+        elif kind == FRAME:
+            apply_frame(self.dm, self.players, payload)
+
+    async def read(self):
+        """Apply messages until the server hangs up"""
+        while True:
+            kind, payload = await read_message(self.reader)
+            if kind is None:
+                self.closed = True
+                return
+            self.receive(kind, payload)
+
+
+def watch(host, port):
+    """Open a window and draw the match served at host:port"""
+    import pygame
+    from OpenGL.GL import glClear, GL_COLOR_BUFFER_BIT
+    from pygame.locals import DOUBLEBUF, KEYDOWN, K_ESCAPE, OPENGL, QUIT
+
+    import eit
+    from datamanager import DataManager
+
+    pygame.init()
+    pygame.display.set_mode(SCREEN, OPENGL | DOUBLEBUF)
+    pygame.display.set_caption("Eit - spectator")
+    eit.resize(SCREEN)
+    eit.init()
+    dm = DataManager()
+    dm.load_textures()
+    dm.load_backgrounds()
+    loop = asyncio.new_event_loop()
+    viewer = Viewer(dm)
+    loop.run_until_complete(viewer.connect(host, port))
+    task = loop.create_task(viewer.read())
+    clock = pygame.time.Clock()
+    try:
+        while not viewer.closed:
+            for event in pygame.event.get():
+                if event.type == QUIT or (
+                    event.type == KEYDOWN and event.key == K_ESCAPE
+                ):
+                    return 0
+            loop.run_until_complete(asyncio.sleep(0))
+            if viewer.canvas is not None:
+                eit.resize(SCREEN, viewer.canvas)
+            glClear(GL_COLOR_BUFFER_BIT)
+            draw_players(viewer.players)
+            pygame.display.flip()
+            clock.tick(60)
+    finally:
+        task.cancel()
+        viewer.close()
+        dm.cleanup()
+    return 0
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="spectator.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("watch", help="watch a match in a window")
+    p.add_argument("address", nargs="?", default="127.0.0.1:%d" % PORT)
+    options = parser.parse_args(args)
+    return watch(*parse_address(options.address))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -92,6 +92,17 @@ def make_minimal_dm():
     return dm
 
 
+@pytest.fixture(autouse=True)
+def isolated_scoretable(tmp_path, monkeypatch):
+    """Keep Main() from writing the score database into the game directory."""
+    import eit
+
+    monkeypatch.setattr(eit, "SCORETABLE_FILE", str(tmp_path / "scoretable.db"))
+    monkeypatch.setattr(
+        eit, "LEGACY_SCORETABLE_FILE", str(tmp_path / "scoretable.dat")
+    )
+
+
 # ---------------------------------------------------------------------------
 # 1. Module import tests
 # ---------------------------------------------------------------------------
@@ -846,7 +857,7 @@ class TestMainInit:
         from eit import Main
 
         m = Main()
-        assert isinstance(m.active_profiles, dict)
+        assert isinstance(m.active_profiles, list)
         assert len(m.active_profiles) == 4
 
     def test_main_init_menu(self, monkeypatch):
@@ -990,3 +1001,2357 @@ class TestCalcStats:
         assert m.scoretable.stats["Alice"]["Winns"] == 1
         assert "Bob" in m.scoretable.stats
         assert m.scoretable.stats["Bob"]["Winns"] == 0
+
+
+# ---------------------------------------------------------------------------
+# 13. SQLite scoretable
+# ---------------------------------------------------------------------------
+
+
+class TestScoreDB:
+    def setup_method(self):
+        from scoredb import ScoreDB
+
+        self.db = ScoreDB(":memory:")
+
+    def _make_stat(self, name, score=100, lines=5, level=2):
+        return {"Name": name, "Score": score, "Lines": lines, "Level": level}
+
+    def test_matches_in_memory_scoretable(self):
+        """Aggregates must match the old pickled Scoretable exactly."""
+        from eit import Scoretable
+
+        st = Scoretable()
+        matches = [
+            ("Alice", ["Bob", "Carol"]),
+            ("Bob", ["Alice"]),
+            ("Carol", ["Alice", "Bob"]),
+            ("Alice", ["Carol"]),
+        ]
+        for i, (w, ls) in enumerate(matches):
+            winner = self._make_stat(w, score=100 * i, level=i)
+            losers = [self._make_stat(n, score=10 * i) for n in ls]
+            st.insert_result(winner, losers)
+            self.db.insert_result(winner, losers)
+        assert dict(self.db.get_list()) == st.stats
+        assert [n for n, _ in self.db.get_list()] == [n for n, _ in st.get_list()]
+
+    def test_stats_view(self):
+        self.db.insert_result(self._make_stat("Alice"), [self._make_stat("Bob")])
+        assert "Alice" in self.db.stats
+        assert "Nobody" not in self.db.stats
+        assert self.db.stats["Alice"]["Winns"] == 1
+        assert len(self.db.stats) == 2
+
+    def test_paged_ranking(self):
+        for i in range(20):
+            self.db.insert_result(
+                self._make_stat("W%02d" % i), [self._make_stat("L%02d" % i)]
+            )
+        page = self.db.get_list(offset=5, limit=5)
+        assert len(page) == 5
+        assert page == self.db.get_list()[5:10]
+        name = page[0][0]
+        assert self.db.get_rank(name) == 6
+        assert self.db.get_rank("Nobody") is None
+
+    def test_history(self):
+        self.db.insert_result(self._make_stat("Alice"), [self._make_stat("Bob")])
+        self.db.insert_result(self._make_stat("Bob"), [self._make_stat("Alice")])
+        history = self.db.get_history("Alice")
+        assert [h["W"] for h in history] == [False, True]
+        assert sum(h["Rank Points"] for h in history) == (
+            self.db.stats["Alice"]["Rank Points"]
+        )
+
+    def test_import_pickle(self, tmp_path):
+        from eit import Scoretable
+
+        st = Scoretable()
+        st.insert_result(self._make_stat("Alice"), [self._make_stat("Bob")])
+        path = tmp_path / "scoretable.dat"
+        with open(path, "wb") as f:
+            pickle.dump(st, f)
+        assert self.db.import_pickle(str(path)) is True
+        assert self.db.stats["Alice"] == st.stats["Alice"]
+        # Only imported into an empty database
+        assert self.db.import_pickle(str(path)) is False
+
+
+# ---------------------------------------------------------------------------
+# 14. Virtualized highscore list
+# ---------------------------------------------------------------------------
+
+
+class CountingRows:
+    """Row source that records which slices the list asks for."""
+
+    def __init__(self, n):
+        self.n = n
+        self.slices = []
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, s):
+        self.slices.append((s.start, s.stop))
+        return [(i, "Player%d" % i) for i in range(s.start, min(s.stop, self.n))]
+
+
+class TestVirtualList:
+    @pytest.fixture
+    def app(self):
+        import pygame
+        from pygame.locals import SWSURFACE
+
+        pygame.init()
+        screen = pygame.display.set_mode((640, 500), SWSURFACE)
+        app = pgu.gui.App()
+        yield app, screen
+
+    def _open(self, app, screen, source):
+        vl = pgu.gui.VirtualList(200, 100, [50, 150], source, row_height=20)
+        app.init(vl, screen)
+        app.paint(screen)
+        return vl
+
+    def test_only_visible_rows_are_created(self, app):
+        rows = CountingRows(10000)
+        vl = self._open(*app, rows)
+        assert len(vl.rows) == 5
+        assert vl.vscrollbar in vl.widgets
+        assert rows.slices == [(0, 5)]
+
+    def test_scroll_reuses_rows(self, app):
+        rows = CountingRows(10000)
+        vl = self._open(*app, rows)
+        before = list(vl.rows)
+        vl.scroll(3)
+        app[0].paint(app[1])
+        assert vl.rows == before
+        assert vl.offset == 3
+        assert vl.vscrollbar.value == 3
+        assert rows.slices[-1] == (3, 8)
+        assert [r.values[0] for r in vl.rows] == [3, 4, 5, 6, 7]
+
+    def test_scroll_is_clamped(self, app):
+        vl = self._open(*app, CountingRows(8))
+        vl.scroll(-10)
+        assert vl.offset == 0
+        vl.scroll(100)
+        assert vl.offset == 3
+
+    def test_short_list_has_no_scrollbar(self, app):
+        vl = self._open(*app, CountingRows(2))
+        assert vl.vscrollbar not in vl.widgets
+        assert vl.rows[2].values is None
+
+    def test_score_dialog_pages_scoretable(self, monkeypatch):
+        import pygame
+        from pygame.locals import SWSURFACE
+
+        pygame.init()
+        pygame.display.set_mode((640, 500), SWSURFACE)
+        monkeypatch.chdir(GAME_DIR)
+
+        from eit import Main
+        from dialogs import ViewScoreDialog
+
+        m = Main()
+        for i in range(50):
+            stat = {"Name": "P%02d" % i, "Score": i, "Lines": i, "Level": 1}
+            loser = {"Name": "L%02d" % i, "Score": 0, "Lines": 0, "Level": 0}
+            m.scoretable.insert_result(stat, [loser])
+        calls = []
+        get_list = m.scoretable.get_list
+
+        def counting_get_list(offset=0, limit=None):
+            calls.append((offset, limit))
+            return get_list(offset, limit)
+
+        m.scoretable.get_list = counting_get_list
+        app = m.init_menu()
+        d = ViewScoreDialog(m.scoretable)
+        d.open()
+        app.paint(pygame.display.get_surface())
+        assert d.score_list.count == 100
+        assert calls and all(limit == len(d.score_list.rows) for _, limit in calls)
+        assert len(d.score_list.rows) < 100
+
+
+# ---------------------------------------------------------------------------
+# 15. Text render cache
+# ---------------------------------------------------------------------------
+
+
+class TestRenderCache:
+    def test_lru_drops_least_recently_used(self):
+        from pgu.gui.cache import LRUCache
+
+        c = LRUCache(2)
+        c["a"] = 1
+        c["b"] = 2
+        assert c.get("a") == 1
+        c["c"] = 3
+        assert "b" not in c
+        assert "a" in c and "c" in c
+        assert c.get("b") is None
+        assert (c.hits, c.misses) == (1, 1)
+
+    def test_same_text_is_rendered_once(self):
+        import pygame
+        from pgu.gui.cache import render_text, text_cache
+
+        pygame.init()
+        font = pygame.font.Font(None, 20)
+        text_cache.clear()
+        a = render_text(font, "Highscores", 1, pygame.Color(0, 255, 0))
+        b = render_text(font, "Highscores", 1, (0, 255, 0))
+        assert a is b
+        assert render_text(font, "Highscores", 1, (255, 0, 0)) is not a
+        assert render_text(font, "Other", 1, (0, 255, 0)) is not a
+        assert len(text_cache) == 3
+
+    def test_labels_share_rendered_text(self):
+        import pygame
+        from pygame.locals import SWSURFACE
+        from pgu.gui.cache import text_cache
+
+        pygame.init()
+        screen = pygame.display.set_mode((640, 500), SWSURFACE)
+        app = pgu.gui.App()
+        t = pgu.gui.Table()
+        t.tr()
+        t.td(pgu.gui.Label("Ok"))
+        t.td(pgu.gui.Label("Ok"))
+        t.td(pgu.gui.Button("Ok"))
+        app.init(t, screen)
+        text_cache.clear()
+        text_cache.misses = 0
+        app.paint(screen)
+        misses = text_cache.misses
+        # The two labels share a font and color, the button caption may not
+        assert misses <= 2
+        app.paint(screen)
+        assert text_cache.misses == misses
+
+
+# ---------------------------------------------------------------------------
+# 16. Dirty-rect menu loop
+# ---------------------------------------------------------------------------
+
+
+class TestMenuLoop:
+    @pytest.fixture
+    def menu(self, monkeypatch):
+        import pygame
+        from pygame.locals import SWSURFACE
+        import eit
+
+        pygame.init()
+        monkeypatch.chdir(GAME_DIR)
+        monkeypatch.setattr(eit, "MENU_IDLE_WAIT", 1)
+        m = eit.Main()
+        m.screen = pygame.display.set_mode((640, 500), SWSURFACE)
+        m.app = m.init_menu()
+        m.clock = pygame.time.Clock()
+        m.running = True
+        m.state = "Menu"
+        pygame.event.clear()
+        return m
+
+    def test_first_frame_is_full_repaint(self, menu, monkeypatch):
+        import pygame
+
+        updates = []
+        monkeypatch.setattr(pygame.display, "update", updates.append)
+        menu.loop()
+        assert updates == [[pygame.Rect(0, 0, 640, 500)]]
+        # The app background replaces the old per-frame fill
+        assert menu.app.style.background == (0, 0, 0)
+
+    def test_idle_frame_draws_nothing(self, menu, monkeypatch):
+        import pygame
+
+        menu.loop()
+        updates = []
+        monkeypatch.setattr(pygame.display, "update", updates.append)
+        menu.loop()
+        menu.loop()
+        assert updates == []
+        assert menu.running
+
+    def test_events_are_still_handled(self, menu):
+        import pygame
+        from pygame.locals import QUIT
+
+        menu.loop()
+        pygame.event.post(pygame.event.Event(QUIT))
+        menu.loop()
+        assert menu.running is False
+
+
+# ---------------------------------------------------------------------------
+# 17. Theme box cache
+# ---------------------------------------------------------------------------
+
+
+class TestThemeBoxCache:
+    @pytest.fixture
+    def theme(self, monkeypatch):
+        import pygame
+
+        pygame.init()
+        monkeypatch.chdir(GAME_DIR)
+        return pgu.gui.Theme(dirs=[os.path.join("data", "themes", "eit")])
+
+    @pytest.mark.parametrize(
+        "image", ["button.normal.png", "dialog.png", "list.png", "vslider.png"]
+    )
+    @pytest.mark.parametrize("size", [(120, 30), (77, 41), (450, 250)])
+    def test_cached_box_matches_tiled_render(self, theme, image, size):
+        import pygame
+
+        box = pygame.image.load(os.path.join("data", "themes", "eit", image))
+        r = pygame.Rect(5, 7, size[0], size[1])
+        expected = pygame.Surface((470, 270))
+        expected.fill((40, 80, 120))
+        got = expected.copy()
+        theme._render_box(expected, box, r)
+        theme.render(got, box, r)
+        assert pygame.image.tobytes(got, "RGB") == pygame.image.tobytes(
+            expected, "RGB"
+        )
+
+    def test_box_is_rendered_once_per_size(self, theme):
+        import pygame
+
+        box = pygame.image.load(
+            os.path.join("data", "themes", "eit", "button.normal.png")
+        )
+        s = pygame.Surface((200, 100))
+        theme.render(s, box, pygame.Rect(0, 0, 120, 30))
+        theme.render(s, box, pygame.Rect(10, 10, 120, 30))
+        theme.render(s, box, pygame.Rect(0, 0, 60, 30))
+        assert len(theme.boxes) == 2
+        assert theme.boxes.hits == 1
+
+    def test_reload_clears_boxes(self, theme):
+        import pygame
+
+        box = pygame.image.load(
+            os.path.join("data", "themes", "eit", "button.normal.png")
+        )
+        theme.render(pygame.Surface((200, 100)), box, pygame.Rect(0, 0, 120, 30))
+        theme._load(os.path.join("data", "themes", "eit"))
+        assert len(theme.boxes) == 0
+
+
+# ---------------------------------------------------------------------------
+# 18. Compiled theme bundles
+# ---------------------------------------------------------------------------
+
+
+class TestThemeBundle:
+    @pytest.fixture
+    def theme_dir(self, tmp_path):
+        import shutil
+        import pygame
+
+        pygame.init()
+        d = tmp_path / "eit"
+        shutil.copytree(os.path.join(GAME_DIR, "data", "themes", "eit"), d)
+        return str(d)
+
+    def _theme(self, d):
+        from pgu.gui import Theme
+
+        return Theme(dirs=[d])
+
+    def test_bundle_matches_theme_files(self, theme_dir):
+        import pygame
+        from pgu.gui import bundle
+
+        plain = self._theme(theme_dir)
+        bundle.compile_theme(theme_dir)
+        compiled = self._theme(theme_dir)
+        assert theme_dir in compiled.bundles
+        assert compiled.config == plain.config
+
+        images = 0
+        for key, (dname, vals) in plain.config.items():
+            if not os.path.exists(os.path.join(dname, vals[0])):
+                continue
+            a, b = plain._get(key), compiled._get(key)
+            if isinstance(a, pygame.Surface):
+                images += 1
+                assert a.get_size() == b.get_size()
+                assert pygame.image.tobytes(a, "RGBA") == pygame.image.tobytes(
+                    b, "RGBA"
+                )
+            elif isinstance(a, pygame.font.Font):
+                assert pygame.image.tobytes(
+                    a.render("Eit 123", 1, (0, 0, 0)), "RGBA"
+                ) == pygame.image.tobytes(b.render("Eit 123", 1, (0, 0, 0)), "RGBA")
+        assert images > 10
+
+    def test_stale_bundle_is_ignored(self, theme_dir):
+        from pgu.gui import bundle
+
+        fname = bundle.compile_theme(theme_dir)
+        new = os.path.getmtime(fname) + 10
+        os.utime(os.path.join(theme_dir, "config.txt"), (new, new))
+        assert bundle.load(theme_dir) is None
+        assert theme_dir not in self._theme(theme_dir).bundles
+
+    def test_not_a_bundle(self, theme_dir):
+        from pgu.gui import bundle
+
+        with open(os.path.join(theme_dir, bundle.BUNDLE_NAME), "wb") as f:
+            f.write(b"garbage garbage garbage")
+        assert bundle.load(theme_dir) is None
+
+    def test_background_preload(self, theme_dir):
+        from pgu.gui import Theme
+
+        t = Theme(dirs=[theme_dir], preload=True)
+        t.loader.join(10)
+        assert not t.loader.is_alive()
+        # the thread only reads files, the values are made on first use
+        assert t.dict == {}
+        image = t._files["button: background"]
+        assert t.get("button", "", "background") is image
+        assert "button: background" not in t._files
+        fonts = [k for k, (d, vals) in t.config.items() if vals[0].endswith(".ttf")]
+        for key in fonts:
+            assert isinstance(t._files[key], bytes)
+            assert t._get(key).render("Eit", 1, (0, 0, 0)).get_width() > 0
+
+    def test_preload_and_get_make_one_value(self, theme_dir, monkeypatch):
+        from pgu.gui import Theme
+
+        made = []
+        load_value = Theme._load_value
+
+        def counting(self, key, data):
+            v = load_value(self, key, data)
+            made.append(key)
+            return v
+
+        monkeypatch.setattr(Theme, "_load_value", counting)
+        t = Theme(dirs=[theme_dir], preload=True)
+        t.load_all()
+        t.loader.join(10)
+        t.load_all()
+        assert sorted(made) == sorted(set(made))
+        assert sorted(made) == sorted(t.dict)
+
+
+# ---------------------------------------------------------------------------
+# 19. Incremental table layout
+# ---------------------------------------------------------------------------
+
+
+class TestTableLayout:
+    def _table(self, grow=None):
+        import pygame
+
+        pygame.init()
+        pgu.gui.App()
+        t = pgu.gui.Table(width=500)
+        spacers = []
+        for row in range(20):
+            t.tr()
+            for col in range(5):
+                w, h = 10 + (row * 7 + col * 13) % 40, 5 + (row + col) % 9
+                if (row, col) == grow:
+                    w, h = w + 25, h + 6
+                s = pgu.gui.Spacer(w, h)
+                spacers.append(s)
+                t.td(s, align=col % 3 - 1)
+        t.tr()
+        t.td(pgu.gui.Spacer(300, 20), colspan=3)
+        t.td(pgu.gui.Spacer(10, 50), rowspan=2)
+        return t, spacers
+
+    def _layout(self, t):
+        t.rect.w, t.rect.h = t.resize()
+        return [tuple(w.rect) for w in t.widgets] + [
+            tuple(w.widget.rect) for w in t.widgets
+        ]
+
+    def test_changed_child_matches_fresh_layout(self):
+        t, spacers = self._table()
+        self._layout(t)
+        s = spacers[3 * 5 + 2]
+        s.style.width += 25
+        s.style.height += 6
+        s.chsize()
+        fresh, _ = self._table(grow=(3, 2))
+        assert self._layout(t) == self._layout(fresh)
+
+    def test_only_changed_children_are_measured(self):
+        t, spacers = self._table()
+        self._layout(t)
+        calls = []
+        for td in t.widgets:
+            orig = td.resize
+
+            def counting(width=None, height=None, td=td, orig=orig):
+                calls.append(td)
+                return orig(width, height)
+
+            td.resize = counting
+        self._layout(t)
+        assert calls == []
+
+        spacers[7].style.height += 3
+        spacers[7].chsize()
+        self._layout(t)
+        assert spacers[7]._table_td in calls
+        # only the cells of the grown row get a new height
+        assert len(set(calls)) <= 5 + 1
+
+    def test_table_chsize_measures_everything(self):
+        t, spacers = self._table()
+        self._layout(t)
+        t.td(pgu.gui.Spacer(400, 10))
+        fresh, _ = self._table()
+        fresh.td(pgu.gui.Spacer(400, 10))
+        assert self._layout(t) == self._layout(fresh)
+
+
+# ---------------------------------------------------------------------------
+# 20. Container hit testing index
+# ---------------------------------------------------------------------------
+
+
+class TestHitIndex:
+    @pytest.fixture
+    def table(self):
+        import pygame
+        from pygame.locals import SWSURFACE
+
+        pygame.init()
+        screen = pygame.display.set_mode((640, 500), SWSURFACE)
+        app = pgu.gui.App()
+        t = pgu.gui.Table()
+        for row in range(20):
+            t.tr()
+            for col in range(8):
+                t.td(pgu.gui.Button("%d,%d" % (row, col)))
+        app.init(t, screen)
+        return app, t
+
+    def _brute(self, c, pos):
+        return [w for w in c.widgets if w.rect.collidepoint(pos)]
+
+    def test_index_matches_linear_scan(self, table):
+        app, t = table
+        assert len(t.widgets) >= pgu.gui.container.INDEX_THRESHOLD
+        for x in range(-5, t.rect.w + 5, 7):
+            for y in range(-5, t.rect.h + 5, 5):
+                assert t.widgets_at((x, y)) == self._brute(t, (x, y))
+
+    def test_small_containers_scan(self):
+        import pygame
+
+        pygame.init()
+        pgu.gui.App()
+        c = pgu.gui.Container()
+        c.add(pgu.gui.Spacer(10, 10), 0, 0)
+        c.resize()
+        assert c.widgets_at((5, 5)) == c.widgets
+        assert c._index is None
+
+    def test_index_follows_layout(self, table):
+        app, t = table
+        w = t.widgets[0]
+        pos = (w.rect.centerx, w.rect.centery)
+        assert t.widgets_at(pos) == [w]
+        w.widget.value.value = "a much longer caption"
+        w.widget.value.style.width = 200
+        w.widget.value.chsize()
+        app.update(app.screen)
+        assert t.widgets_at(pos) == self._brute(t, pos)
+        far = (w.rect.right - 2, w.rect.centery)
+        assert t.widgets_at(far) == [w]
+
+    def test_hover_uses_index(self, table):
+        import pygame
+        from pygame.locals import MOUSEMOTION
+
+        app, t = table
+        target = t.widgets[8 * 5 + 3]
+        pos = target.rect.center
+        pgu.gui.Container.event(
+            t,
+            pygame.event.Event(
+                MOUSEMOTION, {"pos": pos, "rel": (0, 0), "buttons": (0, 0, 0)}
+            ),
+        )
+        assert t.myhover is target
+
+
+# ---------------------------------------------------------------------------
+# 21. Grid path finding
+# ---------------------------------------------------------------------------
+
+
+class TestGridSearch:
+    LAYER = [
+        [0, 0, 0, 0, 0, 0],
+        [0, 1, 1, 1, 1, 0],
+        [0, 0, 0, 0, 1, 0],
+        [1, 1, 1, 0, 1, 0],
+        [0, 0, 0, 0, 0, 0],
+    ]
+
+    def _check(self, path, start, end, diagonal, layer=LAYER):
+        cur = start
+        for p in path:
+            dx, dy = p[0] - cur[0], p[1] - cur[1]
+            assert max(abs(dx), abs(dy)) == 1
+            assert not layer[p[1]][p[0]]
+            if dx and dy:
+                assert diagonal
+                assert not layer[cur[1]][p[0]]
+                assert not layer[p[1]][cur[0]]
+            cur = p
+        assert cur == end
+
+    def test_astar_path(self):
+        from pgu.algo import astar, manhattan
+
+        path = astar((0, 2), (5, 4), self.LAYER, manhattan)
+        self._check(path, (0, 2), (5, 4), False)
+        assert len(path) == 7
+
+    def test_astar_blocked_and_outside(self):
+        from pgu.algo import astar, manhattan
+
+        assert astar((1, 1), (5, 4), self.LAYER, manhattan) == []
+        assert astar((0, 0), (9, 9), self.LAYER, manhattan) == []
+        assert astar((0, 0), (0, 0), self.LAYER, manhattan) == []
+        walled = [[0, 1, 0]]
+        assert astar((0, 0), (2, 0), walled, manhattan) == []
+
+    def test_context_is_reusable(self):
+        from pgu.algo import GridSearch
+
+        s = GridSearch(self.LAYER)
+        assert len(s.find((0, 0), (0, 4))) == 10
+        # close the gap in the middle, the path has to go round the right
+        s.set(3, 3, 1)
+        path = s.find((0, 0), (0, 4))
+        assert len(path) == 14
+        s.set(3, 3, 0)
+        path = s.find((0, 0), (0, 4))
+        self._check(path, (0, 0), (0, 4), False)
+        assert len(path) == 10
+
+    def test_jump_point_matches_plain_search(self):
+        import random
+        from pgu.algo import GridSearch, SQRT2
+
+        def cost(path, start):
+            c, cur = 0, start
+            for p in path:
+                c += SQRT2 if p[0] != cur[0] and p[1] != cur[1] else 1
+                cur = p
+            return c
+
+        rnd = random.Random(7)
+        for _ in range(30):
+            layer = [
+                [1 if rnd.random() < 0.3 else 0 for x in range(20)] for y in range(15)
+            ]
+            plain = GridSearch(layer, diagonal=True)
+            jump = GridSearch(layer, diagonal=True, jump=True)
+            pairs = [
+                (
+                    (rnd.randrange(20), rnd.randrange(15)),
+                    (rnd.randrange(20), rnd.randrange(15)),
+                )
+                for _ in range(5)
+            ]
+            for (start, end), a, b in zip(
+                pairs, plain.find_many(pairs), jump.find_many(pairs)
+            ):
+                assert bool(a) == bool(b)
+                assert abs(cost(a, start) - cost(b, start)) < 1e-9
+                if b:
+                    self._check(b, start, end, True, layer)
+
+    def test_jump_needs_diagonal(self):
+        from pgu.algo import GridSearch
+
+        with pytest.raises(ValueError):
+            GridSearch(self.LAYER, jump=True)
+
+
+# ---------------------------------------------------------------------------
+# 22. Sprite collision broadphase
+# ---------------------------------------------------------------------------
+
+
+class TestSpriteHash:
+    def _vid(self, n, seed):
+        import random
+        import pygame
+        from pgu import vid
+
+        rnd = random.Random(seed)
+        v = vid.Vid()
+        log = []
+
+        def hit(g, s, b):
+            log.append((s.name, b.name))
+
+        for i in range(n):
+            img = pygame.Surface((rnd.randint(4, 90), rnd.randint(4, 90)))
+            s = vid.Sprite(img, (rnd.randint(-50, 600), rnd.randint(-50, 400)))
+            s.name = i
+            s.groups = rnd.randint(0, 7)
+            s.agroups = rnd.randint(0, 7)
+            s.hit = hit
+            v.sprites.append(s)
+        return v, log, rnd
+
+    def _reference(self, v):
+        # the original all-pairs test, one pass per group bit
+        log = []
+        for s in v.sprites:
+            g, n = s.agroups, 1
+            while g:
+                if g & 1:
+                    for b in v.sprites:
+                        if (
+                            b.groups & n
+                            and s is not b
+                            and s.agroups & b.groups
+                            and s.rect.colliderect(b.rect)
+                        ):
+                            log.append((s.name, b.name))
+                g >>= 1
+                n <<= 1
+        return log
+
+    def test_hits_match_all_pairs(self):
+        for seed in range(5):
+            v, log, rnd = self._vid(150, seed)
+            for frame in range(4):
+                del log[:]
+                v.loop_spritehits()
+                assert log == self._reference(v)
+                assert log
+                # move some sprites and drop one, the grid follows
+                for s in rnd.sample(list(v.sprites), 40):
+                    s.rect.x += rnd.randint(-70, 70)
+                    s.rect.y += rnd.randint(-70, 70)
+                v.sprites.remove(v.sprites[0])
+
+    def test_hit_handlers_may_move_sprites(self):
+        import random
+
+        def run(seed, loop):
+            v, log, _ = self._vid(150, seed)
+            rnd = random.Random(seed)
+
+            def hit(g, s, b):
+                log.append((s.name, b.name))
+                # knock b away, or s, by a little or across cells
+                t = rnd.choice((s, b))
+                t.rect.move_ip(rnd.randint(-60, 60), rnd.randint(-60, 60))
+
+            for s in v.sprites:
+                s.hit = hit
+            loop(v)
+            return log, [tuple(s.rect) for s in v.sprites]
+
+        def reference(v):
+            # the original loop, testing the live rects after every hit
+            groups = [(b, b.groups) for b in v.sprites]
+            for s in v.sprites:
+                g, n = s.agroups, 1
+                while g:
+                    if g & 1:
+                        for b, bg in groups:
+                            if (
+                                bg & n
+                                and s is not b
+                                and s.agroups & b.groups
+                                and s.rect.colliderect(b.rect)
+                            ):
+                                s.hit(v, s, b)
+                    g >>= 1
+                    n <<= 1
+
+        for seed in range(5):
+            log, rects = run(seed, lambda v: v.loop_spritehits())
+            assert log
+            assert (log, rects) == run(seed, reference)
+
+    def test_only_moved_sprites_are_rehashed(self):
+        v, log, rnd = self._vid(50, 1)
+        v.loop_spritehits()
+        h = v._hash
+        before = dict(h.sprites)
+        s = v.sprites[3]
+        s.rect.x += 200
+        v.loop_spritehits()
+        changed = [t for t in h.sprites if h.sprites[t] != before[t]]
+        assert changed == [s]
+
+    def test_tile_hits_nearest_first(self):
+        import pygame
+        from pgu import vid
+
+        v = vid.Vid()
+        v.resize((10, 10))
+        hit = []
+        for n in range(3):
+            t = vid.Tile(pygame.Surface((16, 16)))
+            t.agroups = 1 if n else 0
+            t.hit = lambda g, t, s: hit.append((t.tx, t.ty))
+            v.tiles[n] = t
+        for y in range(10):
+            for x in range(10):
+                v.tlayer[y][x] = 1 + (x + y) % 2 if (x, y) != (2, 2) else 0
+        s = vid.Sprite(pygame.Surface((20, 20)), (20, 20))
+        s.groups = 1
+        s._rect = pygame.Rect(s.rect)
+        v._tilehits(s)
+        # the x pass, then the y pass, each ordered by distance to the sprite
+        # and then by column
+        assert hit == [(1, 1), (1, 2), (2, 1)] * 2
+
+
+# ---------------------------------------------------------------------------
+# 23. Tile layers and chunked tile painting
+# ---------------------------------------------------------------------------
+
+
+class TestTileChunks:
+    def _vid(self, bg=0):
+        import pygame
+        from pgu import tilevid, vid
+
+        v = tilevid.Tilevid()
+        for n in range(6):
+            img = pygame.Surface((8, 8), pygame.SRCALPHA, 32)
+            img.fill((40 * n, 255 - 30 * n, 17 * n, 255))
+            if n == 5:
+                # a tile with holes, to show the background through
+                img.fill((0, 0, 0, 0), (0, 0, 4, 4))
+            v.tiles[n] = vid.Tile(img)
+        v.resize((37, 29), bg)
+        rnd = __import__("random").Random(7)
+        for y in range(29):
+            for x in range(37):
+                v.tlayer[y][x] = rnd.randint(0, 5)
+                if bg:
+                    v.blayer[y][x] = rnd.randint(0, 4)
+        return v
+
+    def _reference(self, v, size):
+        # the per tile blit the chunks replace
+        import pygame
+
+        s = pygame.Surface(size)
+        tw = th = 8
+        w, h = v.size
+        ox, oy = v.view.x, v.view.y
+        for y in range(h):
+            for x in range(w):
+                pos = (x * tw - ox, y * th - oy)
+                if v.blayer is not None:
+                    s.blit(v.tiles[v.blayer[y][x]].image, pos)
+                s.blit(v.tiles[v.tlayer[y][x]].image, pos)
+        return s
+
+    def _paint(self, v, size):
+        import pygame
+
+        s = pygame.Surface(size)
+        v.paint(s)
+        return s
+
+    def test_paint_matches_per_tile_blits(self):
+        import pygame
+
+        for bg in (0, 1):
+            v = self._vid(bg)
+            for view in ((0, 0), (13, 5), (100, 77), (-20, -9), (250, 200)):
+                v.view.x, v.view.y = view
+                got = pygame.image.tobytes(self._paint(v, (120, 90)), "RGB")
+                ref = self._reference(v, (120, 90))
+                assert got == pygame.image.tobytes(ref, "RGB"), (bg, view)
+
+    def test_only_changed_chunks_render_again(self):
+        v = self._vid()
+        self._paint(v, (120, 90))
+        before = dict((k, c[0]) for k, c in v.chunks.items())
+        assert before
+        v.set((10, 3), 0 if v.get((10, 3)) else 1)
+        v.fill((0, 9, 3, 2), 4)
+        self._paint(v, (120, 90))
+        changed = sorted(k for k in before if v.chunks[k][0] is not before[k])
+        assert changed == [(0, 1), (1, 0)]
+
+    def test_chunk_limit(self):
+        v = self._vid()
+        v.chunk_limit = 3
+        self._paint(v, (120, 90))
+        assert len(v.chunks) == 3
+
+    def test_region_api(self):
+        import numpy
+
+        v = self._vid()
+        v.paint(__import__("pygame").Surface((400, 300)))
+        v.fill((2, 3, 4, 2), 5)
+        assert (v.get_region((2, 3, 4, 2)) == 5).all()
+        assert (v.alayer[3:5, 2:6] == 1).sum() == len(v.updates)
+        assert v.updates == sorted(v.updates, key=lambda p: (p[1], p[0]))
+        del v.updates[:]
+        v.set_region((2, 3), numpy.full((2, 4), 5))
+        assert v.updates == []
+
+    def test_update_redraws_set_tiles(self):
+        import pygame
+
+        v = self._vid(1)
+        s = pygame.Surface((120, 90))
+        v.paint(s)
+        v.set((2, 2), 1 if v.get((2, 2)) != 1 else 2)
+        us = v.update(s)
+        assert us == [pygame.Rect(16, 16, 8, 8)]
+        assert not v.alayer.any()
+        ref = self._reference(v, (120, 90))
+        assert pygame.image.tobytes(s, "RGB") == pygame.image.tobytes(ref, "RGB")
+
+    def test_tga_level_round_trip(self, tmp_path):
+        from pgu import tilevid
+
+        v = self._vid(1)
+        v.clayer[4][7] = 9
+        fname = str(tmp_path / "level.tga")
+        v.tga_save_level(fname)
+        w = tilevid.Tilevid()
+        w.tga_load_level(fname, 1)
+        assert w.size == v.size
+        assert (w.tlayer == v.tlayer).all()
+        assert (w.blayer == v.blayer).all()
+        assert (w.clayer == v.clayer).all()
+
+
+# ---------------------------------------------------------------------------
+# 24. Tile and border fonts
+# ---------------------------------------------------------------------------
+
+
+class TestFonts:
+    @pytest.fixture
+    def tilefont(self, tmp_path):
+        import random
+        import pygame
+
+        pygame.font.init()
+        pygame.display.set_mode((64, 64))
+        rnd = random.Random(3)
+        img = pygame.Surface((24, 16), pygame.SRCALPHA, 32)
+        for y in range(16):
+            for x in range(24):
+                img.set_at((x, y), (rnd.randint(0, 255),) * 3 + (rnd.randint(0, 255),))
+        fname = str(tmp_path / "font.png")
+        pygame.image.save(img, fname)
+        from pgu import fonts
+
+        return fonts, fname
+
+    def _reference(self, img, color):
+        # the old per pixel recoloring of one glyph
+        img = img.copy()
+        for y in range(img.get_height()):
+            for x in range(img.get_width()):
+                if img.get_at((x, y)).a > 128:
+                    img.set_at((x, y), color)
+        return img
+
+    def test_recolor_matches_per_pixel(self, tilefont):
+        import pygame
+
+        fonts, fname = tilefont
+        f = fonts.TileFont(fname, (8, 8), "abcdef")
+        s = f.render("fad", color=(200, 10, 30))
+        for i, c in enumerate("fad"):
+            ref = self._reference(f.chars[c], (200, 10, 30))
+            got = s.subsurface((i * 8, 0, 8, 8))
+            for y in range(8):
+                for x in range(8):
+                    assert got.get_at((x, y)) == ref.get_at((x, y))
+        assert f.size("fad") == s.get_size()
+
+    def test_renders_are_cached(self, tilefont):
+        fonts, fname = tilefont
+        f = fonts.TileFont(fname, (8, 8), "012345", cache_size=2)
+        a = f.render("012")
+        assert f.render("012") is a
+        assert f.render("012", color=(1, 2, 3)) is not a
+        # a full cache drops the oldest render, which stays as it was
+        pixels = [a.get_at((x, y)) for y in range(8) for x in range(24)]
+        b = f.render("345")
+        assert b is not a
+        assert len(f.cache) == 2
+        assert f.render("012") is not a
+        assert [a.get_at((x, y)) for y in range(8) for x in range(24)] == pixels
+
+    def test_render_into_reuses_the_callers_surface(self, tilefont):
+        fonts, fname = tilefont
+        f = fonts.TileFont(fname, (8, 8), "012345")
+        cached = f.render("012")
+        pixels = [cached.get_at((x, y)) for y in range(8) for x in range(24)]
+        # a ticker passes back what it got last time, a cached surface is
+        # not drawn on, so the first frame gets a surface of its own
+        s = f.render("345", into=cached)
+        assert s is not cached
+        assert f.render("012", into=s) is s
+        assert [s.get_at((x, y)) for y in range(8) for x in range(24)] == pixels
+        assert f.render("345", into=s) is s
+        # the cache never holds nor hands out the callers surface
+        assert all(v is not s for v in f.cache.data.values())
+        assert f.render("012") is cached
+        assert [cached.get_at((x, y)) for y in range(8) for x in range(24)] == pixels
+        # nor is a surface of the wrong size
+        assert f.render("0123", into=s).get_size() == (32, 8)
+
+    def test_fonts_do_not_import_gui(self):
+        import subprocess
+
+        code = "import sys, pgu.fonts; print('pgu.gui' in sys.modules)"
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert out.stdout.split()[-1] == "False"
+
+    def test_scale(self, tilefont):
+        fonts, fname = tilefont
+        f = fonts.TileFont(fname, (8, 8), "abcdef", scale=(16, 12))
+        assert f.render("abc").get_size() == (48, 12)
+
+    def test_border_font(self, tilefont):
+        import pygame
+
+        fonts, fname = tilefont
+        b = fonts.BorderFont(pygame.font.Font(None, 14), 2, (0, 0, 255))
+        s = b.render("12", color=(255, 255, 255))
+        assert s.get_size() == b.size("12")
+        assert b.render("12", color=(255, 255, 255)) is s
+        assert b.render("12", color=(255, 255, 255), background=(0, 0, 0)) is not s
+
+
+# ---------------------------------------------------------------------------
+# 25. pgu.high score tables
+# ---------------------------------------------------------------------------
+
+
+class TestHighScores:
+    def test_submit_positions(self, tmp_path):
+        from pgu import high
+
+        h = high.High(str(tmp_path / "high.txt"), limit=4)
+        assert h.submit(10, "a") == 0
+        assert h.submit(30, "b") == 0
+        assert h.submit(20, "c") == 1
+        # ties go below the equal score already there
+        assert h.submit(20, "d") == 2
+        assert h.check(5) == None
+        assert h.submit(25, "e") == 1
+        assert [(e.score, e.name) for e in h] == [
+            (30, "b"),
+            (25, "e"),
+            (20, "c"),
+            (20, "d"),
+        ]
+        assert h.submit(20, "f") == None
+        assert len(h) == 4
+
+    def test_save_and_append(self, tmp_path):
+        import random
+        from pgu import high
+
+        fname = str(tmp_path / "high.txt")
+        hs = high.Highs(fname, limit=5)
+        rnd = random.Random(2)
+        for i in range(40):
+            key = rnd.choice(["easy", "hard", "cup"])
+            if i == 10:
+                hs.save()
+            hs[key].append(rnd.randint(0, 50), "p%d" % i, i)
+        again = high.Highs(fname, limit=5)
+        assert sorted(again.keys()) == sorted(hs.keys())
+        for key in hs.keys():
+            assert [(e.score, e.name) for e in again[key]] == [
+                (e.score, e.name) for e in hs[key]
+            ]
+        assert not os.path.exists(fname + ".tmp")
+
+    def test_append_compacts_and_survives_torn_line(self, tmp_path):
+        from pgu import high
+
+        fname = str(tmp_path / "high.txt")
+        hs = high.Highs(fname, limit=3)
+        hs.compact = 2
+        for score in range(6):
+            hs["default"].append(score, "x")
+        with open(fname) as f:
+            assert len(f.readlines()) <= 3 + hs.compact
+        with open(fname, "a") as f:
+            f.write("default\t9")
+        again = high.Highs(fname, limit=3)
+        assert [e.score for e in again["default"]] == [5, 4, 3]
+
+
+# ---------------------------------------------------------------------------
+# 26. Lockstep network play
+# ---------------------------------------------------------------------------
+
+
+class TestNetplay:
+    def test_command_line(self, capsys):
+        import eit
+
+        options = eit.parse_args(["--connect", "example.org:7000", "--rollback"])
+        assert options.address == ("example.org", 7000)
+        assert options.rollback
+        options = eit.parse_args(["--bots", "3", "--spectate", "7800"])
+        assert (options.connect, options.bots, options.spectate) == (None, 3, 7800)
+        for args in (
+            ["--bots", "x"],
+            ["--bots", "-1"],
+            ["--rollback"],
+            ["--connect", "example.org"],
+            ["--record"],
+        ):
+            with pytest.raises(SystemExit):
+                eit.parse_args(args)
+        assert "--rollback needs --connect" in capsys.readouterr().err
+
+    def test_actions_from_keys(self, monkeypatch):
+        import pygame
+        from playerfield import PlayerField
+
+        monkeypatch.chdir(GAME_DIR)
+        p = PlayerField(make_minimal_dm(), 0, "NoSuchProfile", 16, 16)
+        events = [
+            pygame.event.Event(pygame.KEYDOWN, key=p.left),
+            pygame.event.Event(pygame.KEYUP, key=p.left),
+            pygame.event.Event(pygame.KEYDOWN, key=p.drop),
+            pygame.event.Event(pygame.KEYDOWN, key=pygame.K_F12),
+            pygame.event.Event(pygame.KEYDOWN, key=p.change_target),
+        ]
+        assert p.actions(events) == ["Left", "Drop", "Target"]
+
+    def test_lockstep_barrier(self):
+        import netplay
+
+        ls = netplay.Lockstep(2, 0, delay=2)
+        # the local input goes delay ticks ahead, one tick at a time
+        assert ls.schedule(["Left"]) == 2
+        assert ls.schedule([]) is None
+        assert ls.advance() == [[], []]
+        assert ls.schedule([]) == 3
+        assert ls.advance() == [[], []]
+        assert not ls.ready()
+        ls.receive(2, 1, ["Drop"])
+        assert ls.advance() == [["Left"], ["Drop"]]
+        with pytest.raises(netplay.NetplayError):
+            ls.receive(1, 1, [])
+
+    def test_match_replays_identically(self, monkeypatch):
+        import random
+        import netplay
+        from datamanager import HeadlessDataManager
+        from playerfield import ACTIONS
+
+        monkeypatch.chdir(GAME_DIR)
+        rnd = random.Random(1)
+        inputs = [
+            [[rnd.choice(ACTIONS[:6])] if rnd.random() < 0.3 else [] for p in range(3)]
+            for t in range(600)
+        ]
+        hashes = []
+        for i in range(2):
+            m = netplay.Match(HeadlessDataManager(), ["a", "b", "c"], 42)
+            random.random()  # random numbers outside the match don't matter
+            for tick in inputs:
+                m.step(tick)
+            hashes.append(m.hash())
+        assert hashes[0] == hashes[1]
+
+    def test_loopback_match(self, monkeypatch):
+        import asyncio
+        import netplay
+
+        monkeypatch.chdir(GAME_DIR)
+
+        async def play():
+            server = netplay.RelayServer(3, seed=7)
+            port = await server.start(port=0)
+            matches = await asyncio.gather(
+                *[
+                    netplay.play_bot("127.0.0.1", port, "bot%d" % i, 400)
+                    for i in range(3)
+                ]
+            )
+            await server.finished.wait()
+            return server, matches
+
+        server, matches = asyncio.run(play())
+        assert server.desync is None
+        assert [m.tick for m in matches] == [400] * 3
+        assert len(set(m.hash() for m in matches)) == 1
+        assert [p.name for p in matches[0].players] == ["bot0", "bot1", "bot2"]
+
+    def test_join_does_not_block(self, monkeypatch):
+        import asyncio
+        import socket
+        import threading
+        import time
+        import netplay
+
+        monkeypatch.chdir(GAME_DIR)
+        ready = threading.Event()
+        server = {}
+
+        async def serve():
+            relay = netplay.RelayServer(2, seed=3)
+            server["port"] = await relay.start(port=0)
+            server["loop"] = asyncio.get_running_loop()
+            server["stop"] = asyncio.Event()
+            ready.set()
+            await server["stop"].wait()
+            relay.close()
+
+        thread = threading.Thread(target=asyncio.run, args=(serve(),))
+        thread.start()
+        assert ready.wait(10)
+        games = [netplay.NetGame("127.0.0.1", server["port"]) for i in range(2)]
+        dms = [make_minimal_dm() for i in range(2)]
+        try:
+            games[0].join("a")
+            for i in range(20):
+                assert games[0].poll(dms[0]) is None
+                time.sleep(0.005)
+            games[1].join("b")
+            matches = [None, None]
+            deadline = time.monotonic() + 10
+            while None in matches and time.monotonic() < deadline:
+                for i in range(2):
+                    if matches[i] is None:
+                        matches[i] = games[i].poll(dms[i])
+                time.sleep(0.001)
+            assert [p.name for p in matches[0].players] == ["a", "b"]
+            assert matches[0].hash() == matches[1].hash()
+        finally:
+            for game in games:
+                game.close()
+            server["loop"].call_soon_threadsafe(server["stop"].set)
+            thread.join(10)
+
+        ### Nobody listening: poll reports the error instead of hanging
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        game = netplay.NetGame("127.0.0.1", port)
+        game.join("c")
+        with pytest.raises(OSError):
+            deadline = time.monotonic() + 10
+            while game.poll(make_minimal_dm()) is None:
+                assert time.monotonic() < deadline
+                time.sleep(0.001)
+        game.close()
+
+    def test_bad_input_closes_the_client(self):
+        import asyncio
+        import netplay
+
+        def frame(kind, payload):
+            return netplay.FRAME.pack(len(payload) + 1) + kind + payload
+
+        async def read(payload):
+            client = netplay.Client("a")
+            client.reader = asyncio.StreamReader()
+            client.session = netplay.Lockstep(2, 0)
+            client.session.tick = 10
+            client.changed = asyncio.Event()
+            client.reader.feed_data(frame(netplay.INPUT, payload))
+            client.reader.feed_eof()
+            await asyncio.wait_for(client.read(), 5)
+            return client
+
+        good = netplay.INPUT_HEADER.pack(12, 1) + bytes([0, 1])
+        for payload in (
+            netplay.INPUT_HEADER.pack(12, 1) + bytes([200]),
+            netplay.INPUT_HEADER.pack(12, 5),
+            netplay.INPUT_HEADER.pack(3, 1),
+            b"\x01",
+        ):
+            client = asyncio.run(read(payload))
+            assert client.closed and client.changed.is_set()
+            assert client.error is not None
+            assert client.lost() == str(client.error)
+
+        client = asyncio.run(read(good))
+        assert client.closed and client.error is None
+        assert client.session.inputs[12][1] == list(netplay.ACTIONS[:2])
+
+    def test_relay_drops_bad_clients(self):
+        import asyncio
+        import netplay
+
+        async def play(message):
+            server = netplay.RelayServer(2, seed=1)
+            port = await server.start(port=0)
+            clients = []
+            for name in (b"a", b"b"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                netplay.write_message(writer, netplay.HELLO, name)
+                clients.append((reader, writer))
+            for reader, writer in clients:
+                kind, payload = await netplay.read_message(reader)
+                assert kind == netplay.START
+            netplay.write_message(clients[0][1], *message)
+            kinds = [
+                await asyncio.wait_for(netplay.read_message(r), 5) for r, w in clients
+            ]
+            await asyncio.wait_for(server.finished.wait(), 5)
+            for reader, writer in clients:
+                writer.close()
+            return kinds
+
+        for message in (
+            (netplay.HASH, b"\x00\x01"),
+            (netplay.HASH, netplay.HASH_BODY.pack(50, 1, 7)),
+            (netplay.INPUT, netplay.INPUT_HEADER.pack(4, 1)),
+            (netplay.INPUT, b""),
+        ):
+            assert asyncio.run(play(message)) == [(None, b"")] * 2
+
+    def test_desync_is_reported(self):
+        import netplay
+
+        class Writer:
+            def __init__(self):
+                self.data = b""
+
+            def write(self, data):
+                self.data += data
+
+        server = netplay.RelayServer(2)
+        server.writers = [Writer(), Writer()]
+        server.check_hash(50, 0, 123)
+        server.check_hash(50, 1, 123)
+        assert server.desync is None
+        server.check_hash(100, 1, 5)
+        server.check_hash(100, 0, 6)
+        assert server.desync == 100
+        assert server.writers[0].data.endswith(
+            netplay.DESYNC + netplay.DESYNC_BODY.pack(100)
+        )
+
+    def test_separate_processes(self):
+        import subprocess
+
+        env = dict(os.environ, PYTHONPATH=GAME_DIR)
+        cmd = [sys.executable, os.path.join(GAME_DIR, "netplay.py")]
+        server = subprocess.Popen(
+            cmd + ["server", "--port", "0", "--players", "2"],
+            cwd=GAME_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            line = ""
+            while "listening" not in line:
+                line = server.stdout.readline()
+                assert line, "server did not start"
+            port = line.split()[-1]
+            bots = [
+                subprocess.Popen(
+                    cmd
+                    + ["bot", "--connect", "127.0.0.1:" + port]
+                    + ["--name", "p%d" % i, "--ticks", "300"],
+                    cwd=GAME_DIR,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                )
+                for i in range(2)
+            ]
+            results = [b.communicate(timeout=60) for b in bots]
+            assert [b.returncode for b in bots] == [0, 0]
+            finals = [
+                [l for l in out.splitlines() if "hash" in l][-1] for out, _ in results
+            ]
+            assert finals[0] == finals[1]
+            assert server.wait(timeout=30) == 0
+        finally:
+            server.kill()
+
+
+# ---------------------------------------------------------------------------
+# 27. Rollback network play
+# ---------------------------------------------------------------------------
+
+
+class TestRollback:
+    def random_inputs(self, seed, players, ticks):
+        import random
+        from playerfield import ACTIONS
+
+        rnd = random.Random(seed)
+        return [
+            [
+                [rnd.choice(ACTIONS)] if rnd.random() < 0.3 else []
+                for p in range(players)
+            ]
+            for t in range(ticks)
+        ]
+
+    def test_restore_replays_identically(self, monkeypatch):
+        import netplay
+        import rollback
+        from datamanager import HeadlessDataManager
+
+        monkeypatch.chdir(GAME_DIR)
+        inputs = self.random_inputs(2, 3, 600)
+        m = netplay.Match(HeadlessDataManager(), ["a", "b", "c"], 11)
+        players = list(m.players)
+        fields = [p.field for p in players]
+        for tick in inputs[:300]:
+            m.step(tick)
+        state = rollback.save_match(m)
+        for tick in inputs[300:]:
+            m.step(tick)
+        expected = m.hash()
+        # restoring twice must give the same match both times
+        for i in range(2):
+            rollback.load_match(m, state)
+            assert m.tick == 300
+            assert m.players == players
+            for tick in inputs[300:]:
+                m.step(tick)
+            assert m.hash() == expected
+        # Switch swaps fields between players, the objects themselves stay
+        assert sorted(map(id, (p.field for p in players))) == sorted(map(id, fields))
+
+    def test_late_inputs_are_rolled_back(self, monkeypatch):
+        import netplay
+        import rollback
+        from datamanager import HeadlessDataManager
+
+        monkeypatch.chdir(GAME_DIR)
+        delay = 2
+        inputs = self.random_inputs(3, 2, 200)
+        for t in range(delay):
+            inputs[t] = [[], []]
+        direct = netplay.Match(HeadlessDataManager(), ["a", "b"], 5)
+        for tick in inputs:
+            direct.step(tick)
+
+        session = rollback.Rollback(2, 0, delay=delay, window=8)
+        m = netplay.Match(HeadlessDataManager(), ["a", "b"], 5)
+        arrived = delay
+        while m.tick < len(inputs):
+            if session.sent < len(inputs):
+                session.schedule(inputs[session.sent][0])
+            # the other player's inputs arrive 6 ticks late
+            while arrived < min(m.tick - 6, len(inputs)):
+                session.receive(arrived, 1, inputs[arrived][1])
+                arrived += 1
+            assert session.ready()
+            session.run(m)
+        for t in range(arrived, len(inputs)):
+            session.receive(t, 1, inputs[t][1])
+        session.settle(m)
+        assert session.rollbacks > 0
+        assert session.final() == len(inputs)
+        assert m.hash() == direct.hash()
+
+    def test_loopback_match(self, monkeypatch):
+        import asyncio
+        import netplay
+        import rollback
+
+        monkeypatch.chdir(GAME_DIR)
+        sessions = []
+
+        class Counted(rollback.Rollback):
+            def __init__(self, *args):
+                rollback.Rollback.__init__(self, *args)
+                sessions.append(self)
+
+        async def play():
+            server = netplay.RelayServer(3, seed=5, delay=1)
+            port = await server.start(port=0)
+            matches = await asyncio.gather(
+                *[
+                    netplay.play_bot(
+                        "127.0.0.1", port, "bot%d" % i, 300, session=Counted
+                    )
+                    for i in range(3)
+                ]
+            )
+            await server.finished.wait()
+            return server, matches
+
+        server, matches = asyncio.run(play())
+        assert server.desync is None
+        assert [m.tick for m in matches] == [300] * 3
+        assert len(set(m.hash() for m in matches)) == 1
+        assert sum(s.rollbacks for s in sessions) > 0
+
+    def test_resimulation_fits_in_a_frame(self, monkeypatch):
+        import time
+        import netplay
+        import rollback
+        from datamanager import HeadlessDataManager
+
+        monkeypatch.chdir(GAME_DIR)
+        inputs = self.random_inputs(4, 4, 200)
+        m = netplay.Match(HeadlessDataManager(), ["a", "b", "c", "d"], 9)
+        for tick in inputs[:190]:
+            m.step(tick)
+        start = time.perf_counter()
+        states = []
+        for tick in inputs[190:]:
+            states.append(rollback.save_match(m))
+            m.step(tick)
+        rollback.load_match(m, states[0])
+        for tick in inputs[190:]:
+            m.step(tick)
+        # generous, about 7ms when measured, a frame at 60 fps is 16ms
+        assert time.perf_counter() - start < 0.1
+
+
+# ---------------------------------------------------------------------------
+# 28. Spectators
+# ---------------------------------------------------------------------------
+
+
+class TestSpectator:
+    def assert_same(self, players, viewers):
+        import spectator
+
+        for p, v in zip(players, viewers):
+            for y in range(23):
+                for x in range(10):
+                    a = p.field.blockparts[y][x]
+                    b = v.field.blockparts[y][x]
+                    assert a.__class__ is b.__class__, (p.name, x, y)
+            for block in ("currentblock", "nextblock"):
+                assert spectator.encode_block(
+                    getattr(p.field, block)
+                ) == spectator.encode_block(getattr(v.field, block))
+            assert (p.score, p.level, p.lines, p.gameover) == (
+                v.score,
+                v.level,
+                v.lines,
+                v.gameover,
+            )
+            assert p.field.background_tile == v.field.background_tile
+            for name, effect in p.field.effects.items():
+                assert (effect is None) == (v.field.effects[name] is None)
+
+    def test_deltas_rebuild_the_fields(self, monkeypatch):
+        import random
+        import netplay
+        import spectator
+        from datamanager import HeadlessDataManager
+        from playerfield import ACTIONS, PlayerField
+
+        monkeypatch.chdir(GAME_DIR)
+        rnd = random.Random(4)
+        m = netplay.Match(HeadlessDataManager(), ["a", "b", "c"], 8)
+        encoders = [spectator.FieldEncoder(p, m.players) for p in m.players]
+        dm = HeadlessDataManager()
+        viewers = [PlayerField(dm, i, p.name, 0, 0) for i, p in enumerate(m.players)]
+        sent = 0
+        while m.tick < 3000 and not m.over():
+            m.step([[rnd.choice(ACTIONS)] if rnd.random() < 0.1 else [] for p in "abc"])
+            if m.tick % 5 == 0:
+                data = spectator.encode_frame(encoders)
+                sent += len(data)
+                spectator.apply_frame(dm, viewers, data)
+                self.assert_same(m.players, viewers)
+        # a few hundred bytes a second per player
+        assert sent / (m.tick * netplay.TICK_TIME / 1000.0) < 3 * 400
+
+        # a viewer that joins late starts from a keyframe of the last update
+        spectator.apply_frame(dm, viewers, spectator.encode_frame(encoders))
+        late = [PlayerField(dm, i, p.name, 0, 0) for i, p in enumerate(m.players)]
+        spectator.apply_frame(dm, late, spectator.encode_keyframe(encoders))
+        self.assert_same(m.players, late)
+
+    def test_switch_and_rollback_mark_cells(self, monkeypatch):
+        import netplay
+        import rollback
+        from blocks import BlockPartRed, BlockPartSwitch
+        from datamanager import HeadlessDataManager
+
+        monkeypatch.chdir(GAME_DIR)
+        m = netplay.Match(HeadlessDataManager(), ["a", "b"], 1)
+        a, b = m.players
+        a.field.insert_bp((3, 20), BlockPartRed(m.dm))
+        state = rollback.save_match(m)
+        a.field.take_dirty()
+        b.field.take_dirty()
+        a.target = b
+        a.activate_special(BlockPartSwitch(m.dm))
+        assert (3, 20) in a.field.take_dirty()
+        assert (3, 20) in b.field.take_dirty()
+        rollback.load_match(m, state)
+        assert len(a.field.take_dirty()) == 230
+
+    def test_server_and_viewers(self, monkeypatch):
+        import asyncio
+        import random
+        import netplay
+        import spectator
+        from datamanager import HeadlessDataManager
+        from playerfield import ACTIONS
+
+        monkeypatch.chdir(GAME_DIR)
+        rnd = random.Random(2)
+        m = netplay.Match(HeadlessDataManager(), ["a", "b"], 3)
+
+        async def play():
+            server = spectator.SpectatorServer(m.players)
+            port = await server.start("127.0.0.1", 0)
+            viewers = []
+            for i in range(3):
+                if i == 2:
+                    # joins in the middle of the match
+                    for t in range(200):
+                        m.step([[rnd.choice(ACTIONS)] for p in "ab"])
+                    server.broadcast()
+                viewer = spectator.Viewer(HeadlessDataManager())
+                await viewer.connect("127.0.0.1", port)
+                viewers.append(viewer)
+                asyncio.ensure_future(viewer.read())
+                await asyncio.sleep(0.05)
+            for t in range(300):
+                m.step(
+                    [[rnd.choice(ACTIONS)] if rnd.random() < 0.2 else [] for p in "ab"]
+                )
+                if t % 5 == 0:
+                    server.broadcast()
+                    await asyncio.sleep(0)
+            server.broadcast()
+            await asyncio.sleep(0.1)
+            server.close()
+            await asyncio.sleep(0.05)
+            return viewers
+
+        viewers = asyncio.run(play())
+        for viewer in viewers:
+            assert viewer.closed
+            assert [p.name for p in viewer.players] == ["a", "b"]
+            self.assert_same(m.players, viewer.players)
+
+
+# ---------------------------------------------------------------------------
+# 29. Layout and batched drawing of many fields
+# ---------------------------------------------------------------------------
+
+
+class TestLayout:
+    def test_four_fields_keep_their_places(self):
+        from layout import grid
+
+        canvas, positions = grid(4)
+        assert canvas == (1024, 768)
+        assert positions == [(248 * i + 16, 16) for i in range(4)]
+
+    def test_many_fields_fit_scaled(self):
+        from layout import FIELD_HEIGHT, FIELD_WIDTH, SCREEN, grid
+
+        for n in (5, 8, 16, 33):
+            (w, h), positions = grid(n)
+            assert len(set(positions)) == n
+            assert abs(w / h - SCREEN[0] / SCREEN[1]) < 1e-9
+            for x, y in positions:
+                assert x + FIELD_WIDTH <= w and y + FIELD_HEIGHT <= h
+        # 16 fields in two rows of eight still get half the screen size
+        (w, h), positions = grid(16)
+        assert SCREEN[0] / w > 0.5
+        assert len(set(y for x, y in positions)) == 2
+
+    def test_quad_arrays(self):
+        from batch import BLOCKPARTS, QuadBatch
+
+        b = QuadBatch()
+        b.add(BLOCKPARTS, 7, 1, 2, 3, 4, 0.1, 1.0, 0.2, 0.25)
+        vertices, texcoords, colors = b.arrays(b.layers[BLOCKPARTS][7])
+        assert vertices.tolist() == [[[1, 2], [3, 2], [3, 4], [1, 4]]]
+        assert texcoords.shape == (1, 4, 2)
+        assert texcoords[0, 2].tolist() == pytest.approx([0.2, 0.25])
+        assert colors.shape == (4, 4)
+
+    def test_one_draw_per_texture_for_all_fields(self, monkeypatch):
+        import netplay
+        from batch import BLOCKPARTS, QuadBatch
+        from datamanager import HeadlessDataManager
+
+        monkeypatch.chdir(GAME_DIR)
+        m = netplay.Match(HeadlessDataManager(), ["p%d" % i for i in range(16)], 2)
+        for t in range(300):
+            m.step([["Drop"] if t % 40 == 0 else [] for p in m.players])
+        b = QuadBatch()
+        for p in m.players:
+            p.draw_batch(b)
+        parts = sum(len(p.field.blockparts_list) for p in m.players)
+        assert parts > 16 * 4
+        # standard and special parts, whatever the number of fields
+        assert len(b.layers[BLOCKPARTS]) <= 2
+        assert sum(map(len, b.layers[BLOCKPARTS].values())) <= parts
+
+    def test_players_past_four(self, monkeypatch):
+        import pygame
+        from playerfield import BotField, PlayerField
+
+        monkeypatch.chdir(GAME_DIR)
+        p = PlayerField(make_minimal_dm(), 5, "NoSuchProfile", 16, 16)
+        assert p.left is None and p.drop is None
+        assert p.actions([pygame.event.Event(pygame.KEYDOWN, key=pygame.K_a)]) == []
+
+        dm = make_minimal_dm()
+        bot = BotField(dm, 9, "Bot 1", 16, 16)
+        dm.players = [bot]
+        bot.next_target()
+        bot.field.add_block()
+        pressed = []
+        monkeypatch.setattr(bot, "do_action", pressed.append)
+        for i in range(100):
+            bot.update([], 100)
+        assert pressed
+
+
+# ---------------------------------------------------------------------------
+# 30. Sound dispatcher
+# ---------------------------------------------------------------------------
+
+
+class TestSounds:
+    class Channel:
+        def __init__(self):
+            self.sounds = []
+
+        def play(self, sound):
+            self.sounds.append(sound)
+
+        def get_busy(self):
+            return bool(self.sounds)
+
+    def dispatcher(self):
+        import sounds
+
+        d = sounds.SoundDispatcher(enabled=False)
+        d.enabled = True
+        d.channels = dict(
+            (category, [self.Channel() for i in range(n)])
+            for category, n in sounds.CHANNELS.items()
+        )
+        return d
+
+    def test_requests_coalesce_and_rate_limit(self):
+        d = self.dispatcher()
+        rumble = d.cue("Rumble", "rumble", "repeat", 150)
+        for i in range(10):
+            rumble.play()
+        d.flush(now=1000)
+        assert (d.played, d.dropped) == (1, 9)
+        rumble.play()
+        d.flush(now=1100)
+        assert d.played == 1
+        rumble.play()
+        d.flush(now=1200)
+        assert d.played == 2
+
+    def test_categories_keep_their_channels(self):
+        d = self.dispatcher()
+        for name in ("Faster", "Slower", "Flip", "Mini", "Blink"):
+            d.cue(name, name).play()
+        d.cue("Place", "place", "place").play()
+        d.flush(now=0)
+        special = [c.sounds for c in d.channels["special"]]
+        # five specials share three channels, the oldest ones are cut off
+        assert sum(map(len, special)) == 5
+        assert all(special)
+        assert d.channels["place"][0].sounds == ["place"]
+        assert not any(c.sounds for c in d.channels["repeat"])
+
+    def test_headless_is_silent(self, monkeypatch):
+        from datamanager import HeadlessDataManager
+
+        monkeypatch.chdir(GAME_DIR)
+        dm = HeadlessDataManager()
+        assert not dm.sounds.enabled
+        dm.specialsounds["Rumble"].play()
+        dm.placesound.play()
+        assert not dm.sounds.pending
+        dm.sounds.flush()
+
+    def test_busy_match(self, monkeypatch):
+        import random
+        import netplay
+        from datamanager import HeadlessDataManager
+        from playerfield import ACTIONS
+
+        monkeypatch.chdir(GAME_DIR)
+        dm = HeadlessDataManager()
+        dm.sounds = self.dispatcher()
+        dm.cue_sounds()
+        rnd = random.Random(5)
+        m = netplay.Match(dm, ["a", "b", "c", "d"], 6)
+        requests = []
+        request = dm.sounds.request
+        monkeypatch.setattr(
+            dm.sounds, "request", lambda cue: requests.append(cue) or request(cue)
+        )
+        while m.tick < 6000 and not m.over():
+            m.step(
+                [[rnd.choice(ACTIONS)] if rnd.random() < 0.3 else [] for p in "abcd"]
+            )
+            if m.tick % 2 == 0:
+                dm.sounds.flush(now=m.tick * netplay.TICK_TIME)
+        seconds = m.tick * netplay.TICK_TIME / 1000.0
+        assert len(requests) > dm.sounds.played
+        # never more than one of each sound per interval
+        assert dm.sounds.played / seconds < len(dm.specialsounds) * 1000 / 50.0
+        for channels in dm.sounds.channels.values():
+            for c in channels:
+                assert len(c.sounds) <= seconds * 1000 / 20.0 + 1
+
+
+# ---------------------------------------------------------------------------
+# 31. Music prefetch
+# ---------------------------------------------------------------------------
+
+
+class TestMusic:
+    def make_tracks(self, tmp_path, n):
+        for i in range(n):
+            data = bytearray(2048)
+            data[44:48] = b"SCRM"
+            (tmp_path / ("track%d.s3m" % i)).write_bytes(bytes(data))
+
+    def test_playlist_has_no_repeats(self, tmp_path):
+        import random
+        from music import MusicService
+
+        self.make_tracks(tmp_path, 5)
+        service = MusicService(str(tmp_path), random.Random(3))
+        names = [service.next_name() for i in range(15)]
+        for r in range(3):
+            assert sorted(names[r * 5 : r * 5 + 5]) == sorted(service.tracks())
+        assert all(a != b for a, b in zip(names, names[1:]))
+
+    def test_prefetch_skips_invalid_tracks(self, tmp_path):
+        from music import MusicService, is_module
+
+        self.make_tracks(tmp_path, 1)
+        (tmp_path / "broken.mod").write_bytes(b"not a module")
+        service = MusicService(str(tmp_path))
+        service.prefetch()
+        service.wait(5)
+        assert service.ready[0] == "track0.s3m"
+        assert is_module(service.ready[1])
+        assert service.bad in (set(), {"broken.mod"})
+
+    def test_play_does_not_wait(self, tmp_path, monkeypatch):
+        import pygame
+        from music import MusicService
+
+        self.make_tracks(tmp_path, 3)
+        loaded = []
+        monkeypatch.setattr(
+            pygame.mixer.music, "load", lambda f, hint: loaded.append(hint)
+        )
+        monkeypatch.setattr(pygame.mixer.music, "play", lambda loops: None)
+        service = MusicService(str(tmp_path))
+        ### Nothing prefetched yet: the game starts without music
+        assert service.play() is False
+        assert service.waiting
+        service.wait(5)
+        service.update()
+        assert loaded == ["s3m"]
+        assert not service.waiting
+        first = service.current
+        ### The next track was read while the first one plays
+        service.wait(5)
+        assert service.play() is True
+        assert service.current != first
+
+    def test_games_share_the_playlist(self, tmp_path, monkeypatch):
+        """Main keeps one MusicService for all the DataManagers it makes"""
+        import pygame
+        from datamanager import DataManager
+        from music import MusicService
+
+        self.make_tracks(tmp_path, 4)
+        monkeypatch.setattr(pygame.mixer.music, "load", lambda f, hint: None)
+        monkeypatch.setattr(pygame.mixer.music, "play", lambda loops: None)
+        monkeypatch.chdir(GAME_DIR)
+        pygame.mixer.init()
+        jukebox = MusicService(str(tmp_path))
+        played = []
+        for game in range(4):
+            ### The menu prefetches, then the game starts
+            jukebox.prefetch()
+            jukebox.wait(5)
+            dm = DataManager(jukebox)
+            assert dm.jukebox is jukebox
+            dm.random_music()
+            played.append(jukebox.current)
+        assert sorted(played) == sorted(jukebox.tracks())
+
+
+# ---------------------------------------------------------------------------
+# 32. Config service
+# ---------------------------------------------------------------------------
+
+
+class TestConfig:
+    def test_parsed_once(self, tmp_path, monkeypatch):
+        import shutil
+        import config
+        from playerfield import PlayerField
+
+        shutil.copy(os.path.join(GAME_DIR, "profiles.cfg"), str(tmp_path))
+        monkeypatch.chdir(tmp_path)
+        parsed = []
+        real = config.ConfigObj
+        monkeypatch.setattr(config, "ConfigObj", lambda f: parsed.append(f) or real(f))
+        players = [PlayerField(make_minimal_dm(), i, "Player1", 0, 0) for i in range(4)]
+        assert len(parsed) == 1
+        assert config.profiles() is config.open_config(str(tmp_path / "profiles.cfg"))
+        assert players[3].left == int(config.profiles().data["Player1"]["Left"])
+
+    def test_writes_are_debounced(self, tmp_path):
+        from config import ConfigFile
+
+        path = str(tmp_path / "settings.cfg")
+        settings = ConfigFile(path, delay=1.0)
+        settings.data["Music"] = "True"
+        settings.changed(now=0.0)
+        settings.data["Music"] = "False"
+        settings.changed(now=0.5)
+        settings.flush(now=1.2)
+        assert not os.path.exists(path)
+        settings.flush(now=1.6)
+        assert ConfigFile(path).data["Music"] == "False"
+        assert os.listdir(str(tmp_path)) == ["settings.cfg"]
+        assert settings.deadline is None
+
+    def test_save_all_writes_pending(self, tmp_path, monkeypatch):
+        import config
+
+        monkeypatch.chdir(tmp_path)
+        settings = config.settings()
+        settings.data["Fullscreen"] = "True"
+        settings.changed()
+        config.flush()
+        assert not os.path.exists("settings.cfg")
+        config.save_all()
+        assert "Fullscreen = True" in open("settings.cfg").read()
+
+
+# ---------------------------------------------------------------------------
+# 33. Match capture
+# ---------------------------------------------------------------------------
+
+
+class TestCapture:
+    def pixels(self, size, bottom, top):
+        """RGBA pixels as read from GL: the bottom row first"""
+        width, height = size
+        rows = [bottom] * (height // 2) + [top] * (height - height // 2)
+        return b"".join(bytes(color) * width for color in rows)
+
+    def test_y4m_frame(self):
+        from capture import rgb_frame, y4m_frame, y4m_header
+
+        size = (4, 4)
+        white, red = (255, 255, 255, 255), (255, 0, 0, 255)
+        frame = y4m_frame(rgb_frame(self.pixels(size, white, red), size))
+        assert y4m_header(size, 30) == b"YUV4MPEG2 W4 H4 F30:1 Ip A1:1 C420jpeg\n"
+        assert frame[:6] == b"FRAME\n"
+        y, u, v = frame[6:22], frame[22:26], frame[26:30]
+        ### red on top, white at the bottom
+        assert y == bytes([76] * 8 + [255] * 8)
+        assert u == bytes([85, 85, 128, 128])
+        assert v == bytes([255, 255, 128, 128])
+
+    def test_raw_frames_top_row_first(self, tmp_path):
+        from capture import FrameWriter
+
+        size = (2, 2)
+        with open(str(tmp_path / "match.raw"), "wb") as f:
+            writer = FrameWriter(f, size, y4m=False)
+            writer.start()
+            writer.put(self.pixels(size, (1, 2, 3, 255), (4, 5, 6, 255)))
+            writer.close()
+        data = (tmp_path / "match.raw").read_bytes()
+        assert data == bytes([4, 5, 6] * 2 + [1, 2, 3] * 2)
+        assert writer.written == 1
+
+    def test_frames_dropped_under_backpressure(self, tmp_path):
+        from capture import FrameWriter
+
+        size = (2, 2)
+        f = open(str(tmp_path / "match.y4m"), "wb")
+        writer = FrameWriter(f, size, queue_size=2)
+        ### The writer isn't running yet, like a disk that can't keep up
+        results = [writer.put(self.pixels(size, (0,) * 4, (0,) * 4)) for i in range(5)]
+        assert results == [True, True, False, False, False]
+        assert writer.dropped == 3
+        writer.start()
+        writer.close()
+        assert writer.written == 2
+        data = (tmp_path / "match.y4m").read_bytes()
+        assert data.count(b"FRAME\n") == 2
+
+
+# ---------------------------------------------------------------------------
+# 34. Render snapshots
+# ---------------------------------------------------------------------------
+
+
+class TestSnapshots:
+    def test_scenes_match_goldens(self):
+        """Every scene renders the same pixels as when the goldens were made.
+        After an intended change of the drawing run: python snapshot.py --update
+        """
+        import json
+        import subprocess
+        import snapshot
+
+        env = dict(os.environ)
+        env.pop("PYOPENGL_PLATFORM", None)
+        result = subprocess.run(
+            [sys.executable, "snapshot.py", "--json"],
+            cwd=GAME_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=300,
+        )
+        if result.returncode == snapshot.UNAVAILABLE:
+            pytest.skip(result.stdout.strip())
+        assert result.returncode == 0, result.stderr
+        results = json.loads(result.stdout.strip().splitlines()[-1])
+        with open(os.path.join(GAME_DIR, snapshot.SNAPSHOT_FILE)) as f:
+            goldens = json.load(f)
+        assert sorted(results) == sorted(goldens)
+        for name, golden in goldens.items():
+            assert results[name]["hash"] == golden, name
+            assert results[name]["ms"] > 0
+
+    def test_textures_do_not_depend_on_directory_order(self, monkeypatch):
+        """A seed draws the same background whatever order listdir returns"""
+        import datamanager
+
+        monkeypatch.chdir(GAME_DIR)
+        for name in ("glBindTexture", "glTexImage2D", "glTexParameterf"):
+            monkeypatch.setattr(datamanager, name, lambda *args: None)
+        monkeypatch.setattr(datamanager, "glGenTextures", lambda n: list(range(n)))
+        listdir = os.listdir
+        loaded = []
+        for order in (sorted, lambda names: sorted(names, reverse=True)):
+            monkeypatch.setattr(os, "listdir", lambda path: order(listdir(path)))
+            dm = object.__new__(datamanager.DataManager)
+            dm.load_textures()
+            dm.load_backgrounds()
+            loaded.append((list(dm.textures.items()), list(dm.backgrounds.items())))
+        assert loaded[0] == loaded[1]
+
+
+# ---------------------------------------------------------------------------
+# 35. Row templates for the building specials
+# ---------------------------------------------------------------------------
+
+
+class TestTemplates:
+    def test_templates(self):
+        from playerfield import CASTLE, RING, STAIR, template
+
+        assert template([(5, "#. #      ")]) == ((5, 0b1001, 0b10),)
+        assert STAIR[0] == (22, 0b1, 0b10)
+        assert STAIR[1] == (21, 0b10, 0b101)
+        assert STAIR[-1] == (13, 0b1000000000, 0b100000000)
+        assert [y for y, fill, clear in RING] == list(range(22, 10, -1))
+        assert CASTLE[-1] == (11, 0b110110110, 0)
+
+    def test_apply_row_is_insert_and_remove(self):
+        import random
+        from blockfield import MASK_BITS, BlockField
+        from blocks import BlockPartGrey, BlockPartRed
+
+        dm = make_minimal_dm()
+        a, b = BlockField(dm, 0, 0), BlockField(dm, 0, 0)
+        for f in (a, b):
+            rnd = random.Random(4)
+            for y in range(5, 23):
+                for x in range(10):
+                    if (x, y) == (3, 20) or rnd.random() < 0.5:
+                        f.insert_bp((x, y), BlockPartRed(dm))
+            f.special_block = f.blockparts[20][3]
+            f.take_dirty()
+        for y, fill, clear in ((20, 0b1001101000, 0b10), (12, 0b11, 0b1100), (5, 0, 0)):
+            a.apply_row(y, fill, clear, [BlockPartGrey(dm) for x in MASK_BITS[fill]])
+            for x in range(10):
+                if fill >> x & 1:
+                    b.insert_bp((x, y), BlockPartGrey(dm))
+                elif clear >> x & 1:
+                    b.remove_bp((x, y))
+        cells = lambda f: [(bp.__class__, bp.x, bp.y) for bp in f.blockparts_list]
+        assert cells(a) == cells(b)
+        assert a.special_block is None and b.special_block is None
+        assert a.take_dirty() == b.take_dirty()
+
+    def test_activation_makes_no_parts(self, monkeypatch):
+        from types import SimpleNamespace
+        import blocks
+        from playerfield import PlayerField
+
+        dm = make_minimal_dm()
+        with mock.patch.object(PlayerField, "load_controls"):
+            p, target = PlayerField(dm, 0, "A", 0, 0), PlayerField(dm, 1, "B", 0, 0)
+        p.target = target
+        made = []
+        init = blocks.BlockPart.__init__
+        monkeypatch.setattr(
+            blocks.BlockPart,
+            "__init__",
+            lambda self, *args: made.append(self) or init(self, *args),
+        )
+        p.activate_special(SimpleNamespace(type="Castle"))
+        assert made == []
+        assert len(target.lines_to_add) == 12
+        while target.lines_to_add:
+            target.handle_specials()
+        assert len(made) == 68
+        assert len(target.field.blockparts_list) == 68
+
+    def test_display_lists_compiled_once(self, monkeypatch):
+        import blocks
+
+        compiled = []
+        monkeypatch.setattr(blocks, "glNewList", lambda *args: compiled.append(args))
+        monkeypatch.setattr(blocks, "compiled_dls", set())
+        dm = make_minimal_dm()
+        parts = [blocks.BlockPartGrey(dm) for i in range(50)]
+        parts += [blocks.BlockPartRed(dm) for i in range(50)]
+        assert len(compiled) == 2
+        assert set(bp.dl for bp in parts) == {1, 7}
+
+
+# ---------------------------------------------------------------------------
+# 36. Vectorized games
+# ---------------------------------------------------------------------------
+
+
+def vec_field(dm, cells):
+    """A BlockField with the parts of one VecEit field"""
+    from blockfield import BlockField
+    from blocks import SPECIAL_PARTS, STANDARD_PARTS, BlockPartGrey
+    import vecenv
+
+    classes = [None] + STANDARD_PARTS + [BlockPartGrey] + SPECIAL_PARTS
+    field = BlockField(dm, 0, 0)
+    for y in range(vecenv.HEIGHT):
+        for x in range(vecenv.WIDTH):
+            if cells[y][x]:
+                field.insert_bp((x, y), classes[cells[y][x]](dm))
+    return field, classes
+
+
+def field_cells(field, classes):
+    return [
+        [0 if bp is None else classes.index(bp.__class__) for bp in row]
+        for row in field.blockparts
+    ]
+
+
+class TestVecEnv:
+    def test_shapes(self):
+        from blocks import ALL_BLOCKS, BlockI, BlockO, BlockT
+        import vecenv
+
+        def rotations(block):
+            shapes = vecenv.SHAPES[ALL_BLOCKS.index(block)]
+            return len(set(tuple(map(tuple, s)) for s in shapes))
+
+        assert rotations(BlockO) == 1
+        assert rotations(BlockI) == 2
+        assert rotations(BlockT) == 4
+        assert vecenv.SHAPE_WIDTHS[ALL_BLOCKS.index(BlockI)].tolist() == [1, 4, 1, 4]
+
+    def test_line_clear_scores(self):
+        import numpy
+        from blocks import ALL_BLOCKS, BlockI
+        import vecenv
+
+        env = vecenv.VecEit(2, seed=3)
+        env.cells[:, 22, 4:] = 1
+        env.piece[:] = ALL_BLOCKS.index(BlockI)
+        obs, rewards, dones, infos = env.step(numpy.array([10, 1]))
+        assert rewards.tolist() == [40, 0]
+        assert infos["lines"].tolist() == [1, 0]
+        assert not dones.any()
+        assert (env.cells[0, 22] == 0).all()
+        assert (env.cells[1, 19:, 1] != 0).all()
+
+    def test_rows_and_flip_match_blockfield(self):
+        import numpy
+        import vecenv
+
+        dm = make_minimal_dm()
+        env = vecenv.VecEit(20, seed=5)
+        rng = numpy.random.default_rng(5)
+        codes = rng.integers(1, vecenv.SPECIAL + len(vecenv.SPECIALS), env.cells.shape)
+        holes = rng.random(env.cells.shape) < 0.15
+        full = rng.random((20, vecenv.HEIGHT)) < 0.3
+        cells = numpy.where(holes & ~full[:, :, None], 0, codes)
+        cells[:, :8] = 0
+        env.cells[:] = cells
+        cleared, special = env.clear_rows()
+        env.flip(numpy.arange(0, 20, 2))
+        for i in range(20):
+            field, classes = vec_field(dm, cells[i])
+            n, bp = field.remove_full_rows()
+            assert n == cleared[i]
+            assert (0 if bp is None else classes.index(bp.__class__)) == special[i]
+            if i % 2 == 0:
+                field.flip()
+            assert field_cells(field, classes) == env.cells[i].tolist()
+
+    def test_attacks_reach_the_target(self):
+        import numpy
+        from blocks import ALL_BLOCKS, BlockI
+        import vecenv
+
+        env = vecenv.VecEit(4, players=2, seed=7)
+        assert env.targets.tolist() == [1, 0, 3, 2]
+        env.cells[0, 19:, 1:] = 1
+        env.cells[2, 21, :] = 1
+        env.cells[2, 21, 3] = vecenv.SPECIAL + vecenv.SPECIALS.index("Bridge")
+        env.cells[2, 22, 1:] = 1
+        env.piece[:] = ALL_BLOCKS.index(BlockI)
+        env.step(numpy.array([0, 9, 0, 9]))
+        ### The I in rows 19-22 and two lines on top of it
+        assert (env.cells[1] != 0).any(axis=1).sum() == 6
+        assert (env.cells[3] != 0).any(axis=1).sum() == 6
+        assert (env.cells[0] == 0).all()
+
+    def test_random_play(self):
+        import numpy
+        import vecenv
+
+        env = vecenv.VecEit(256, players=4, seed=11)
+        rng = numpy.random.default_rng(11)
+        done = 0
+        for i in range(200):
+            obs, rewards, dones, infos = env.step(
+                rng.integers(0, vecenv.N_ACTIONS, 256), anti=rng.random(256) < 0.1
+            )
+            done += dones.sum()
+            assert (rewards >= 0).all()
+            assert obs["cells"].min() >= 0
+            assert obs["cells"].max() < vecenv.SPECIAL + len(vecenv.SPECIALS)
+            assert (obs["antidotes"] <= vecenv.MAX_ANTIDOTES).all()
+        assert done > 0
+
+
+# ---------------------------------------------------------------------------
+# 37. Zobrist hash of the fields
+# ---------------------------------------------------------------------------
+
+
+class TestZobrist:
+    def test_same_field_same_hash(self):
+        from blockfield import BlockField
+        from blocks import BlockI, BlockPartBlind, BlockPartGreen, BlockPartRed
+
+        dm = make_minimal_dm()
+        a, b = BlockField(dm, 0, 0), BlockField(dm, 0, 0)
+        assert a.zobrist == b.zobrist == 0
+        a.insert_bp((1, 20), BlockPartRed(dm))
+        a.insert_bp((2, 22), BlockPartRed(dm))
+        b.insert_bp((2, 21), BlockPartGreen(dm))
+        b.move_bp(2, 21, 2, 22)
+        b.insert_bp((1, 20), BlockPartRed(dm))
+        assert a.zobrist == b.zobrist
+        b.insert_bp((5, 5), BlockPartRed(dm))
+        assert a.zobrist != b.zobrist
+        b.remove_bp((5, 5))
+        assert a.zobrist == b.zobrist
+
+        a.set_currentblock(BlockI(dm, 4, 0))
+        b.set_currentblock(BlockI(dm, 3, 0))
+        assert a.zobrist != b.zobrist
+        assert b.move_block(1, 0)
+        assert a.zobrist == b.zobrist
+        assert not b.move_block(-5, 0)
+        assert a.zobrist == b.zobrist
+        b.rotate_block("cw")
+        assert a.zobrist != b.zobrist
+        b.rotate_block("ccw")
+        assert a.zobrist == b.zobrist
+
+        a.set_effect("Blind", BlockPartBlind(dm, 3, 1))
+        assert a.zobrist != b.zobrist
+        a.set_effect("Blind", None)
+        assert a.zobrist == b.zobrist
+
+    def test_specials_keep_hash_up_to_date(self):
+        import random
+        from types import SimpleNamespace
+        import netplay
+        import rollback
+        from blocks import STANDARD_PARTS
+        from playerfield import ACTIONS
+
+        dm = make_minimal_dm()
+        m = netplay.Match(dm, ["A", "B"], 3)
+        rnd = random.Random(3)
+
+        def check():
+            for p in m.players:
+                zobrist = p.field.zobrist
+                p.field.rehash()
+                assert p.field.zobrist == zobrist
+
+        for kind in ("Switch", "Flip", "Castle", "Question", "Inverse", "Clear"):
+            for p in m.players:
+                for y in range(15, 23):
+                    for x in range(10):
+                        if rnd.random() < 0.5:
+                            p.field.insert_bp((x, y), rnd.choice(STANDARD_PARTS)(dm))
+            saved = rollback.save_match(m)
+            hashes = [p.field.zobrist for p in m.players]
+            m.players[0].activate_special(SimpleNamespace(type=kind))
+            check()
+            for t in range(30):
+                m.step([[rnd.choice(ACTIONS[:6])] for p in m.players])
+                check()
+            rollback.load_match(m, saved)
+            assert [p.field.zobrist for p in m.players] == hashes
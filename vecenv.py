@@ -0,0 +1,414 @@
+"""Thousands of Eit games stepped together with numpy, for training bots.
+
+A PlayerField simulates a game one block part object at a time, far too
+slow to train a bot on.  VecEit keeps n games in numpy arrays instead, the
+fields in cells shaped (n, 23, 10) like BlockField.blockparts, and steps
+all of them at once with a gym-style reset()/step().
+
+An action places the current piece: action // 10 is its rotation and
+action % 10 the column of its leftmost part.  The piece falls straight down
+from the top row, as if dropped right away.  Rows are cleared, scored and
+the specials in them activated like in PlayerField.step, and the attacks
+go to the target of each game: with players > 1 the games are split into
+matches of that many fields where each field targets the next one, with
+players == 1 every game is alone and attacks go nowhere, like a
+PlayerField without a target.
+
+Game time doesn't flow between moves, a placement counts as piece_time ms
+for the timers of specials and packets.  So the rules about speed (Faster,
+Slower) and how the field is seen (Inverse, Mini, Blink, Blind, Trans,
+Color, Background) only set their flag in effects, which a bot can
+observe.  SZ does change the pieces.  Specials that arrive at the same
+target in the same step of the same kind are applied once.
+"""
+
+from types import SimpleNamespace
+
+import numpy
+
+from blocks import ALL_BLOCKS, SPECIAL_PARTS, STANDARD_PARTS, BlockS, BlockZ
+from eit_constants import *
+from playerfield import CASTLE, RING, STAIR
+
+HEIGHT = 23
+WIDTH = 10
+ROTATIONS = 4
+N_ACTIONS = ROTATIONS * WIDTH
+### Milliseconds of game time a placement counts as
+PIECE_TIME = 1000
+### Score of 0-4 cleared lines at level 0, see PlayerField.do_score
+SCORES = numpy.array([0, 40, 100, 300, 1200])
+MAX_ANTIDOTES = 4
+
+### Cell codes: 0 is empty, then the standard parts, grey and the specials
+EMPTY = 0
+GREY = len(STANDARD_PARTS) + 1
+SPECIAL = GREY + 1
+EFFECTS = ("Inverse", "Mini", "Blink", "Blind", "Trans", "SZ", "Color")
+
+
+def _parts():
+    """Return the types of the specials and the shapes of the pieces.
+
+    The shapes are read from the Block classes: for each piece the cell
+    code of its parts, its (dy, dx) cells where it spawns and its rotations
+    with their top left corner at (0, 0), repeated to ROTATIONS.
+    """
+    dm = SimpleNamespace(textures={"standard": 0, "special": 0})
+    specials = [cls(dm).type for cls in SPECIAL_PARTS]
+    codes, spawns, shapes = [], [], []
+    for block in ALL_BLOCKS:
+        b = block(dm, 0, 0)
+        codes.append(STANDARD_PARTS.index(b.blockparts[0].__class__) + 1)
+        spawns.append([(bp.y, bp.x) for bp in b.blockparts])
+        rotations = []
+        for i in range(ROTATIONS):
+            y0 = min(bp.y for bp in b.blockparts)
+            x0 = min(bp.x for bp in b.blockparts)
+            cells = sorted((bp.y - y0, bp.x - x0) for bp in b.blockparts)
+            if cells not in rotations:
+                rotations.append(cells)
+            b.rotate("cw")
+        shapes.append((rotations * ROTATIONS)[:ROTATIONS])
+    return specials, numpy.array(codes), numpy.array(spawns), numpy.array(shapes)
+
+
+SPECIALS, PIECE_CODES, SPAWN_CELLS, SHAPES = _parts()
+### Width of each rotation of each piece
+SHAPE_WIDTHS = SHAPES[:, :, :, 1].max(axis=2) + 1
+### The specials spawn_special chooses from, as cell codes
+SPAWNED = numpy.array(
+    [SPECIAL + i for i in range(len(SPECIALS))]
+    + [SPECIAL + SPECIALS.index("Anti")] * EXTRA_ANTIS
+)
+### The pieces random_block chooses from with SZ
+SZ_PIECES = numpy.array([ALL_BLOCKS.index(BlockS), ALL_BLOCKS.index(BlockZ)])
+
+
+def _masks(template):
+    """The rows, fill and clear masks of a playerfield template as arrays"""
+    ys = numpy.array([y for y, fill, clear in template])
+    bits = 1 << numpy.arange(WIDTH)
+    fill = numpy.array([fill & bits != 0 for y, fill, clear in template])
+    clear = numpy.array([clear & bits != 0 for y, fill, clear in template])
+    return ys, fill, clear
+
+
+TEMPLATES = {"Stair": _masks(STAIR), "Ring": _masks(RING), "Castle": _masks(CASTLE)}
+
+
+class VecEit:
+    """n_envs games stepped together, see the module docstring"""
+
+    def __init__(self, n_envs, players=1, seed=None, piece_time=PIECE_TIME):
+        if n_envs % players:
+            raise ValueError("n_envs must be a multiple of players")
+        self.n_envs = n_envs
+        self.players = players
+        self.piece_time = piece_time
+        self.random = numpy.random.default_rng(seed)
+        envs = numpy.arange(n_envs)
+        if players > 1:
+            self.targets = envs - envs % players + (envs + 1) % players
+        else:
+            self.targets = numpy.full(n_envs, -1)
+        self.cells = numpy.zeros((n_envs, HEIGHT, WIDTH), dtype=numpy.int8)
+        ### Occupied cells with a floor below the field, for the drops
+        self.solid = numpy.ones((n_envs, HEIGHT + 4, WIDTH), dtype=bool)
+        self.piece = numpy.zeros(n_envs, dtype=numpy.int8)
+        self.next = numpy.zeros(n_envs, dtype=numpy.int8)
+        self.spawn_x = numpy.zeros(n_envs, dtype=numpy.int8)
+        self.effects = numpy.zeros((n_envs, len(EFFECTS)), dtype=bool)
+        self.antidotes = numpy.zeros(n_envs, dtype=numpy.int8)
+        self.score = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.lines = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.level = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.to_nextlevel = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.spawntime = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.packettime = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.reset()
+
+    def observe(self):
+        """The state a bot sees, the arrays are live and must not be changed"""
+        return {
+            "cells": self.cells,
+            "piece": self.piece,
+            "next": self.next,
+            "effects": self.effects,
+            "antidotes": self.antidotes,
+        }
+
+    def reset(self, envs=None):
+        """Start new games in envs, all of them if None"""
+        if envs is None:
+            envs = numpy.arange(self.n_envs)
+        self.cells[envs] = EMPTY
+        self.effects[envs] = False
+        for a in (self.antidotes, self.score, self.lines, self.level):
+            a[envs] = 0
+        self.to_nextlevel[envs] = TO_NEXT_LEVEL
+        self.spawntime[envs] = SPAWN_SPECIAL_TIME - 4 * 1000
+        self.packettime[envs] = 0
+        self.next[envs] = self.random_pieces(envs)
+        self.next_piece(envs)
+        return self.observe()
+
+    def random_pieces(self, envs):
+        pieces = self.random.integers(0, len(ALL_BLOCKS), len(envs))
+        sz = self.effects[envs, EFFECTS.index("SZ")]
+        pieces[sz] = self.random.choice(SZ_PIECES, sz.sum())
+        return pieces
+
+    def next_piece(self, envs):
+        """Make the next piece current, return the envs where it can't spawn"""
+        self.piece[envs] = self.next[envs]
+        self.next[envs] = self.random_pieces(envs)
+        x = self.random.integers(3, 7, len(envs))
+        self.spawn_x[envs] = x
+        cells = SPAWN_CELLS[self.piece[envs]]
+        ys = cells[:, :, 0]
+        xs = cells[:, :, 1] + x[:, None]
+        blocked = self.cells[envs[:, None], ys, xs].any(axis=1)
+        return envs[blocked]
+
+    def step(self, actions, anti=None):
+        """Place the current piece of every game, returns (observation,
+        rewards, dones, infos).  With anti, the games where it's true use
+        an antidote first.  Games that end are reset at once, infos has
+        their final "score"."""
+        n = self.n_envs
+        envs = numpy.arange(n)
+        actions = numpy.asarray(actions)
+        if anti is not None:
+            use = numpy.asarray(anti, dtype=bool) & (self.antidotes > 0)
+            self.effects[use] = False
+            self.antidotes[use] -= 1
+
+        ### Drop the pieces
+        rotation = actions // WIDTH
+        shape = SHAPES[self.piece, rotation]
+        x = numpy.minimum(actions % WIDTH, WIDTH - SHAPE_WIDTHS[self.piece, rotation])
+        self.solid[:, :HEIGHT] = self.cells != EMPTY
+        ys = numpy.arange(HEIGHT + 1)[None, :, None] + shape[:, None, :, 0]
+        xs = x[:, None, None] + shape[:, None, :, 1]
+        hits = self.solid[envs[:, None, None], ys, xs].any(axis=2)
+        y = hits.argmax(axis=1) - 1
+        dones = y < 0
+        placed = envs[~dones]
+        self.cells[
+            placed[:, None],
+            y[placed, None] + shape[placed, :, 0],
+            x[placed, None] + shape[placed, :, 1],
+        ] = PIECE_CODES[self.piece[placed], None]
+
+        cleared, special = self.clear_rows()
+
+        ### Specials, score and the lines sent to the targets
+        top_lines = numpy.zeros(n, dtype=numpy.int64)
+        for code in numpy.unique(special[special > 0]):
+            kind = SPECIALS[code - SPECIAL]
+            self.activate(kind, envs[special == code], top_lines)
+        rewards = SCORES[cleared] * (self.level + 1)
+        self.score += rewards
+        self.lines += cleared
+        self.to_nextlevel -= cleared
+        up = self.to_nextlevel <= 0
+        self.to_nextlevel[up] += TO_NEXT_LEVEL
+        self.level[up] += 1
+        has_special = (self.cells >= SPECIAL).any(axis=(1, 2))
+        self.spawntime[~has_special] += 200
+        attack = self.targets >= 0
+        packets = attack & (self.packettime > 0) & (cleared > 0)
+        bottom_lines = numpy.bincount(
+            self.targets[packets], cleared[packets], minlength=n
+        ).astype(numpy.int64)
+        tetris = attack & (cleared == 4)
+        top_lines += 2 * numpy.bincount(self.targets[tetris], minlength=n)
+        self.add_bottom_lines(bottom_lines)
+        self.add_top_lines(top_lines)
+
+        ### Timers
+        self.packettime = numpy.maximum(self.packettime - self.piece_time, 0)
+        self.spawntime += self.piece_time
+        has_special = (self.cells >= SPECIAL).any(axis=(1, 2))
+        remove = has_special & (
+            self.spawntime > SPAWN_SPECIAL_TIME - REMOVE_SPECIAL_TIME
+        )
+        self.remove_specials(envs[remove])
+        spawn = envs[self.spawntime > SPAWN_SPECIAL_TIME]
+        self.spawn_specials(spawn)
+        self.spawntime[spawn] = 0
+
+        ### The next pieces, games that can't go on are over
+        dones[self.next_piece(envs)] = True
+        infos = {"lines": cleared, "special": special, "score": self.score.copy()}
+        self.reset(envs[dones])
+        return self.observe(), rewards, dones, infos
+
+    def clear_rows(self):
+        """Remove the full rows, return the number of rows removed and the
+        code of a special in them per game, like remove_full_rows"""
+        full = (self.cells != EMPTY).all(axis=2)
+        cleared = full.sum(axis=1)
+        special = numpy.zeros(self.n_envs, dtype=numpy.int64)
+        envs = numpy.nonzero(cleared)[0]
+        if not len(envs):
+            return cleared, special
+        cells = self.cells[envs]
+        full = full[envs]
+        ### The last special wins, as remove_full_rows goes down the rows
+        ### and left to right in each
+        specials = (full[:, :, None] & (cells >= SPECIAL)).reshape(len(envs), -1)
+        last = HEIGHT * WIDTH - 1 - specials[:, ::-1].argmax(axis=1)
+        codes = cells.reshape(len(envs), -1)[numpy.arange(len(envs)), last]
+        special[envs] = numpy.where(specials.any(axis=1), codes, 0)
+        ### The full rows go to the top and are emptied, the rest keep order
+        order = numpy.argsort(~full, axis=1, kind="stable")
+        cells = numpy.take_along_axis(cells, order[:, :, None], axis=1)
+        cells[numpy.arange(HEIGHT)[None, :] < cleared[envs, None]] = EMPTY
+        self.cells[envs] = cells
+        return cleared, special
+
+    def garbage(self, shape):
+        """Rows of random standard parts with one hole each, like add_line"""
+        rows = self.random.integers(1, GREY, shape + (WIDTH,)).astype(numpy.int8)
+        holes = self.random.integers(0, WIDTH, shape)
+        numpy.put_along_axis(rows, holes[..., None], EMPTY, axis=-1)
+        return rows
+
+    def top_index(self, envs):
+        occupied = (self.cells[envs] != EMPTY).any(axis=2)
+        top = numpy.maximum(occupied.argmax(axis=1) - 1, 0)
+        return numpy.where(occupied.any(axis=1), top, HEIGHT - 1)
+
+    def add_top_lines(self, counts):
+        """add_line(top=True) counts[i] times on game i"""
+        for i in range(counts.max(initial=0)):
+            envs = numpy.nonzero(counts > i)[0]
+            y = self.top_index(envs)
+            row = self.garbage((len(envs),))
+            old = self.cells[envs, y]
+            self.cells[envs, y] = numpy.where(row != EMPTY, row, old)
+
+    def add_bottom_lines(self, counts):
+        """add_line(top=False) counts[i] times on game i"""
+        for i in range(counts.max(initial=0)):
+            envs = numpy.nonzero(counts > i)[0]
+            self.cells[envs, :-1] = self.cells[envs, 1:]
+            self.cells[envs, -1] = self.garbage((len(envs),))
+
+    def remove_specials(self, envs):
+        cells = self.cells[envs]
+        special = cells >= SPECIAL
+        cells[special] = self.random.integers(1, GREY, special.sum())
+        self.cells[envs] = cells
+
+    def spawn_specials(self, envs):
+        """Turn a random part of each game into a special, like spawn_special"""
+        self.remove_specials(envs)
+        cells = self.cells[envs].reshape(len(envs), HEIGHT * WIDTH)
+        keys = numpy.where(cells != EMPTY, self.random.random(cells.shape), -1.0)
+        some = keys.max(axis=1) >= 0
+        rows = numpy.nonzero(some)[0]
+        chosen = keys[rows].argmax(axis=1)
+        cells[rows, chosen] = self.random.choice(SPAWNED, len(rows))
+        self.cells[envs] = cells.reshape(-1, HEIGHT, WIDTH)
+
+    def activate(self, kind, envs, top_lines):
+        """Do what activate_special does for a special of kind cleared in
+        envs.  Lines added to the top of the targets go to top_lines."""
+        if kind == "Anti":
+            self.antidotes[envs] = numpy.minimum(
+                self.antidotes[envs] + 1, MAX_ANTIDOTES
+            )
+            return
+        if kind == "Packet":
+            self.packettime[envs] = PACKET_TIME
+            return
+        if kind == "Clear":
+            self.cells[envs] = EMPTY
+            return
+        targets = self.targets[envs]
+        envs, targets = envs[targets >= 0], targets[targets >= 0]
+        if not len(envs):
+            return
+        if kind == "Switch":
+            mine = self.cells[envs].copy()
+            self.cells[envs] = self.cells[targets]
+            self.cells[targets] = mine
+            return
+        if kind == "Bridge":
+            numpy.add.at(top_lines, targets, 2)
+            return
+        targets = numpy.unique(targets)
+        if kind in EFFECTS:
+            self.effects[targets, EFFECTS.index(kind)] = True
+        elif kind == "Castle":
+            self.cells[targets] = EMPTY
+            self.apply_template(targets, TEMPLATES[kind], GREY)
+        elif kind in TEMPLATES:
+            self.apply_template(targets, TEMPLATES[kind])
+        elif kind == "Fill":
+            ys = numpy.arange(HEIGHT - 1, 12, -1)
+            self.cells[targets[:, None], ys] = self.garbage((len(targets), len(ys)))
+        elif kind == "Rumble":
+            self.rumble(targets)
+        elif kind == "Flip":
+            self.flip(targets)
+        elif kind == "Question":
+            self.question(targets)
+
+    def apply_template(self, envs, template, code=None):
+        ys, fill, clear = template
+        rows = self.cells[envs[:, None], ys]
+        if code is None:
+            parts = self.random.integers(1, GREY, rows.shape)
+        else:
+            parts = numpy.full(rows.shape, code)
+        rows = numpy.where(fill, parts, numpy.where(clear, EMPTY, rows))
+        self.cells[envs[:, None], ys] = rows
+
+    def flip(self, envs):
+        """Turn the stack upside down, like BlockField.flip"""
+        top = self.top_index(envs) + 1
+        y = numpy.arange(HEIGHT)[None, :]
+        order = numpy.where(y < top[:, None], y, top[:, None] + HEIGHT - 1 - y)
+        self.cells[envs] = numpy.take_along_axis(
+            self.cells[envs], order[:, :, None], axis=1
+        )
+
+    def question(self, envs):
+        """Remove half of the parts at random"""
+        cells = self.cells[envs].reshape(len(envs), HEIGHT * WIDTH)
+        filled = cells != EMPTY
+        keys = numpy.where(filled, self.random.random(cells.shape), 2.0)
+        ranks = keys.argsort(axis=1).argsort(axis=1)
+        cells[ranks < (filled.sum(axis=1) // 2)[:, None]] = EMPTY
+        self.cells[envs] = cells.reshape(-1, HEIGHT, WIDTH)
+
+    def rumble(self, envs):
+        """Shake the six top parts for five rounds, like handle_specials"""
+        m = len(envs)
+        rows = numpy.arange(m)
+        cells = self.cells[envs]
+        filled = cells[:, 1:].reshape(m, -1) != EMPTY
+        index = numpy.where(filled, numpy.arange(filled.shape[1]), filled.size)
+        first = numpy.sort(index, axis=1)[:, :6]
+        active = first < filled.size
+        ys = first // WIDTH + 1
+        xs = first % WIDTH
+        for r in range(5):
+            for j in range(6):
+                nx = xs[:, j] + self.random.integers(-1, 2, m)
+                ny = ys[:, j] + self.random.integers(-1, 1, m)
+                ok = active[:, j] & (nx >= 0) & (nx < WIDTH) & (ny >= 2) & (ny < HEIGHT)
+                ok[ok] = cells[rows[ok], ny[ok], nx[ok]] == EMPTY
+                moving = rows[ok]
+                cells[moving, ny[ok], nx[ok]] = cells[moving, ys[ok, j], xs[ok, j]]
+                cells[moving, ys[ok, j], xs[ok, j]] = EMPTY
+                xs[ok, j] = nx[ok]
+                ys[ok, j] = ny[ok]
+            last = active.sum(axis=1) - 1
+            drop = (last >= 0) & (self.random.random(m) > 0.1)
+            active[rows[drop], last[drop]] = False
+        self.cells[envs] = cells